@@ -0,0 +1,12 @@
+"""
+角色权限判断
+
+视图与其他应用共用的权限检查放在这里，避免应用之间互相引用视图模块中的私有函数。
+"""
+
+
+def can_manage_books(user) -> bool:
+    """检查用户是否可管理图书与借阅（管理员或图书管理员）"""
+    if not user.is_authenticated:
+        return False
+    return user.role in ('admin', 'librarian') or user.is_superuser
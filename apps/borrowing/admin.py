@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BorrowRecord, FineRule
+from .models import BorrowRecord, CirculationEvent, DailyCirculationStat, DueReminder, FineRule, Hold, IdempotencyKey
 
 
 @admin.register(FineRule)
@@ -13,4 +13,50 @@ class BorrowRecordAdmin(admin.ModelAdmin):
     list_filter = ("status", "borrowed_at")
     search_fields = ("user__username", "book__title", "book__isbn")
 
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ("user", "book", "status", "created_at", "ready_at", "expires_at")
+    list_filter = ("status",)
+    search_fields = ("user__username", "book__title", "book__isbn")
+    raw_id_fields = ("user", "book")
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("user", "key", "endpoint", "status_code", "created_at", "expires_at")
+    search_fields = ("user__username", "key")
+    raw_id_fields = ("user",)
+
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_type", "record", "user", "book", "amount", "occurred_at")
+    list_filter = ("event_type",)
+    raw_id_fields = ("record", "user", "book")
+
+    # 流水只追加：后台只读
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyCirculationStat)
+class DailyCirculationStatAdmin(admin.ModelAdmin):
+    list_display = ("date", "event_type", "count", "amount")
+    list_filter = ("event_type",)
+    date_hierarchy = "date"
+
+
+@admin.register(DueReminder)
+class DueReminderAdmin(admin.ModelAdmin):
+    list_display = ("record", "due_at", "sent_at")
+    date_hierarchy = "sent_at"
+    raw_id_fields = ("record",)
+
 # Register your models here.
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BorrowingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.borrowing'
+
+    def ready(self):
+        # 注册信号处理（罚款规则缓存失效）
+        from . import signals  # noqa: F401
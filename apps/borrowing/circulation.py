@@ -0,0 +1,429 @@
+"""
+批量借还服务
+
+流通台一次为读者办理多本书的借阅/归还/续借，全部条目在同一事务中处理：
+- 加锁顺序固定：先借阅记录、后图书，同类行按 id 升序加锁，并发批次之间不会互相等待成环（死锁）
+- 批量语句：借阅记录一次 bulk_create，归还/续借一次 bulk_update，库存一条
+  UPDATE ... SET available_copies = available_copies + CASE id ... END
+- 单个条目失败（图书不存在、无库存、记录不可续借等）只记入该条目结果，不影响其他条目
+- 借阅优先领取本人的待取书预约；归还的副本先分配给排队预约（见 holds.py）
+- 库存批量 UPDATE 不触发 post_save，通过 book_stock_changed 信号同步分类汇总与可借数量缓存
+- 借出/归还/续借/罚款事件在同一事务中一条 INSERT 批量写入流通流水（见 ledger.py）
+
+单册借阅（borrow 表单）使用 take_copy 扣减库存，默认为乐观策略：一条带条件的
+UPDATE ... SET available_copies = available_copies - 1 WHERE isbn = ? AND available_copies > 0，
+按影响行数判断是否借到，不先 SELECT ... FOR UPDATE 持锁检查；热门教材集中借阅时行锁只在
+UPDATE 到提交之间持有。settings.BORROW_STOCK_STRATEGY = 'locking' 可退回先加锁再检查的方式。
+开启分段库存的图书（apps.library.stripes）改为在随机一段上加减，不再争用图书行。
+
+流通台批量归还（checkin_scans）把扫码枪连续扫入的 ISBN / 借阅记录 ID 按组办理，每组一个事务，
+逐组产出结果，供还书台页面流式展示。
+
+供 /api/borrow、/api/return、/api/renew、/api/desk/return 接口使用。
+"""
+import re
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Replace
+from django.utils import timezone
+
+from apps.library import stripes, suggest
+from apps.library.models import Book
+from apps.library.signals import book_stock_changed
+from . import holds, ledger
+from .models import BorrowRecord, FineRule, Hold
+
+
+MAX_ITEMS = 20
+DESK_GROUP_SIZE = 50
+DESK_MAX_ITEMS = 500
+
+# 去掉连字符后为 10/13 位的条码视为 ISBN；其余纯数字视为借阅记录 ID
+ISBN_PATTERN = re.compile(r'^(\d{9}[\dXx]|\d{13})$')
+MAX_LOAN_DAYS = 60
+MAX_RENEW_DAYS = 30
+
+BOOK_FIELDS = ('id', 'isbn', 'title', 'category', 'available_copies', 'stock_stripes')
+
+STOCK_STRATEGY_OPTIMISTIC = 'optimistic'
+STOCK_STRATEGY_LOCKING = 'locking'
+
+
+def _ok(key: str, value, **data) -> Dict:
+    return {key: value, 'ok': True, **data}
+
+
+def _error(key: str, value, code: str, message: str) -> Dict:
+    return {key: value, 'ok': False, 'error': {'code': code, 'message': message}}
+
+
+def calculate_fine(due_at, now, rule: FineRule) -> Decimal:
+    """按自然日计算逾期罚款（与 return_book 一致）"""
+    days = (now.date() - due_at.date()).days
+    return Decimal(days) * rule.daily_fine if days > 0 else Decimal('0.00')
+
+
+def _lock_books(book_ids, include_striped: bool = False) -> Dict[int, Book]:
+    """
+    按 id 升序锁定图书行
+
+    分段库存的图书默认不锁图书行（库存在各段上加减）；归还可能把副本分配给预约
+    （holds.allocate 要求已锁定图书行），此时传 include_striped=True 一并锁定
+    """
+    book_ids = set(book_ids)
+    locked = Book.objects.select_for_update().filter(id__in=book_ids).order_by('id')
+    if not include_striped:
+        locked = locked.filter(stock_stripes=0)
+    books = {book.id: book for book in locked.only(*BOOK_FIELDS)}
+    missing = book_ids - set(books)
+    if missing:
+        books.update({book.id: book for book in Book.objects.filter(id__in=missing).only(*BOOK_FIELDS)})
+    return books
+
+
+def _apply_stock(deltas: Dict[int, int], books: Dict[int, Book], now) -> None:
+    """
+    一条 UPDATE 批量调整多本书的可借数量，并通知派生数据
+
+    分段库存的图书：归还（正增量）还入随机一段；借出已在逐条借阅时从分段扣减，这里只发通知
+    """
+    deltas = {book_id: delta for book_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    row_deltas = {book_id: delta for book_id, delta in deltas.items() if not books[book_id].stock_stripes}
+    if row_deltas:
+        Book.objects.filter(id__in=list(row_deltas)).update(
+            available_copies=F('available_copies') + Case(
+                *[When(id=book_id, then=Value(delta)) for book_id, delta in row_deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            updated_at=now,
+        )
+    for book_id, delta in deltas.items():
+        if books[book_id].stock_stripes and delta > 0:
+            stripes.put(books[book_id], delta)
+    book_stock_changed.send(
+        sender=Book,
+        deltas=deltas,
+        categories={book_id: books[book_id].category for book_id in deltas},
+    )
+
+
+def get_stock_strategy() -> str:
+    """单册借阅的库存扣减策略：optimistic（条件 UPDATE，默认）或 locking（加锁后检查）"""
+    strategy = getattr(settings, 'BORROW_STOCK_STRATEGY', STOCK_STRATEGY_OPTIMISTIC)
+    return STOCK_STRATEGY_LOCKING if strategy == STOCK_STRATEGY_LOCKING else STOCK_STRATEGY_OPTIMISTIC
+
+
+def take_copy(isbn: str, now, strategy: Optional[str] = None) -> Tuple[Optional[Book], Optional[str]]:
+    """
+    借出一册：扣减可借数量并通知派生数据，须在事务中调用（调用方随后写入借阅记录）
+
+    Args:
+        isbn: 图书 ISBN
+        now: 本次借阅时间（同时写入 updated_at）
+        strategy: 扣减策略，None 表示使用 BORROW_STOCK_STRATEGY
+
+    Returns:
+        (图书, None)；失败时为 (None, 'BOOK_NOT_FOUND') 或 (None, 'NO_STOCK')
+    """
+    strategy = strategy or get_stock_strategy()
+    if strategy == STOCK_STRATEGY_LOCKING:
+        book = Book.objects.select_for_update().filter(isbn=isbn).only(*BOOK_FIELDS).first()
+        if book is None:
+            return None, 'BOOK_NOT_FOUND'
+        if book.stock_stripes:
+            if not stripes.take(book):
+                return None, 'NO_STOCK'
+        else:
+            if book.available_copies <= 0:
+                return None, 'NO_STOCK'
+            Book.objects.filter(id=book.id).update(available_copies=F('available_copies') - 1, updated_at=now)
+            book.available_copies -= 1
+    else:
+        # 条件 UPDATE 本身即是检查：影响 0 行说明没有可借副本、图书不存在或为分段库存
+        updated = Book.objects.filter(isbn=isbn, stock_stripes=0, available_copies__gt=0).update(
+            available_copies=F('available_copies') - 1, updated_at=now,
+        )
+        book = Book.objects.filter(isbn=isbn).only(*BOOK_FIELDS).first()
+        if book is None:
+            return None, 'BOOK_NOT_FOUND'
+        if book.stock_stripes:
+            updated = stripes.take(book)
+        if not updated:
+            return None, 'NO_STOCK'
+    book_stock_changed.send(sender=Book, deltas={book.id: -1}, categories={book.id: book.category})
+    return book, None
+
+
+def checkout(user, isbns: Sequence[str], rule: FineRule, loan_days: Optional[int] = None) -> List[Dict]:
+    """
+    批量借阅
+
+    Args:
+        user: 借阅人
+        isbns: ISBN 列表（同一 ISBN 出现多次表示借多册）
+        rule: 罚款规则（提供默认借阅天数）
+        loan_days: 借阅天数，None 表示使用规则默认值；上限 MAX_LOAN_DAYS
+
+    Returns:
+        与 isbns 顺序一致的逐条结果：成功含 record_id、due_at，失败含 error
+    """
+    now = timezone.now()
+    days = min(loan_days or rule.loan_period_days, MAX_LOAN_DAYS)
+    due_at = now + timezone.timedelta(days=days)
+
+    with transaction.atomic():
+        # 先不加锁地解析 id，再按主键升序加锁，保证加锁顺序与请求中的 ISBN 顺序无关
+        ids = dict(Book.objects.filter(isbn__in=set(isbns)).values_list('isbn', 'id'))
+        books = _lock_books(ids.values())
+        remaining = {book_id: book.available_copies for book_id, book in books.items()}
+        # 本人的待取书预约：副本已预留，领取时不扣减库存
+        ready = holds.ready_holds(user, list(books)) if books else {}
+        claimed: List[Hold] = []
+
+        results: List[Optional[Dict]] = []
+        records = []
+        stock_taken: Counter = Counter()
+        for isbn in isbns:
+            book_id = ids.get(isbn)
+            if book_id not in books:
+                results.append(_error('isbn', isbn, 'BOOK_NOT_FOUND', '未找到该 ISBN 的图书'))
+                continue
+            hold = ready.pop(book_id, None)
+            if hold is not None:
+                hold.status = 'fulfilled'
+                claimed.append(hold)
+                records.append(BorrowRecord(user=user, book_id=book_id, borrowed_at=now, due_at=due_at, status='borrowed'))
+                results.append(None)
+                continue
+            if books[book_id].stock_stripes:
+                # 分段库存：逐册从随机一段扣减
+                if not stripes.take(books[book_id]):
+                    results.append(_error('isbn', isbn, 'NO_STOCK', '该图书当前无可借副本'))
+                    continue
+            elif remaining[book_id] <= 0:
+                results.append(_error('isbn', isbn, 'NO_STOCK', '该图书当前无可借副本'))
+                continue
+            remaining[book_id] -= 1
+            stock_taken[book_id] += 1
+            records.append(BorrowRecord(user=user, book_id=book_id, borrowed_at=now, due_at=due_at, status='borrowed'))
+            results.append(None)
+
+        if records:
+            BorrowRecord.objects.bulk_create(records)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # MySQL 不回传自增 id：按本批共同的借出时间取回（同一本书多册按 id 顺序对应）
+                created = (
+                    BorrowRecord.objects.filter(user=user, borrowed_at=now, book_id__in={r.book_id for r in records})
+                    .order_by('id').values_list('book_id', 'id')
+                )
+                pending: Dict[int, List[int]] = {}
+                for book_id, record_id in created:
+                    pending.setdefault(book_id, []).append(record_id)
+                for record in records:
+                    record.id = pending[record.book_id].pop(0)
+
+            ledger.write(ledger.build('borrowed', record, now) for record in records)
+            if claimed:
+                Hold.objects.bulk_update(claimed, ['status'])
+            _apply_stock({book_id: -count for book_id, count in stock_taken.items()}, books, now)
+            borrowed = Counter(record.book_id for record in records)
+            for book_id, count in borrowed.items():
+                suggest.borrowed_on_commit(book_id, count)
+
+    created_iter = iter(records)
+    for idx, isbn in enumerate(isbns):
+        if results[idx] is None:
+            record = next(created_iter)
+            results[idx] = _ok('isbn', isbn, record_id=record.id, due_at=record.due_at.isoformat())
+    return results
+
+
+def _lock_records(record_ids, user, manager: bool, statuses):
+    """按 id 升序锁定借阅记录；非管理角色只能操作本人记录"""
+    records = BorrowRecord.objects.select_for_update().filter(id__in=set(record_ids), status__in=statuses)
+    if not manager:
+        records = records.filter(user=user)
+    return {record.id: record for record in records.order_by('id')}
+
+
+def checkin(user, record_ids: Sequence[int], rule: FineRule, manager: bool = False) -> List[Dict]:
+    """
+    批量归还：逾期记录按规则计算罚款，状态置为 returned
+
+    Returns:
+        与 record_ids 顺序一致的逐条结果：成功含 book_id、fine_amount，失败含 error
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        records = _lock_records(record_ids, user, manager, ('borrowed', 'overdue'))
+        books = _lock_books({record.book_id for record in records.values()}, include_striped=True)
+
+        results = []
+        returned = []
+        events = []
+        seen = set()
+        for record_id in record_ids:
+            record = records.get(record_id)
+            if record is None or record_id in seen:
+                results.append(_error('record_id', record_id, 'RECORD_NOT_FOUND', '未找到可归还的借阅记录'))
+                continue
+            seen.add(record_id)
+            previous_fine = record.fine_amount
+            record.returned_at = now
+            if now > record.due_at:
+                record.fine_amount = calculate_fine(record.due_at, now, rule)
+            record.status = 'returned'
+            returned.append(record)
+            events.append(ledger.build('returned', record, now))
+            events.extend(ledger.fine_changed(record, previous_fine, now))
+            results.append(_ok('record_id', record_id, book_id=record.book_id, fine_amount=str(record.fine_amount)))
+
+        if returned:
+            BorrowRecord.objects.bulk_update(returned, ['returned_at', 'status', 'fine_amount'])
+            ledger.write(events)
+            # 有人预约的图书，归还的副本依次分配给队首预约，其余计入可借数量
+            released = Counter()
+            for record in returned:
+                if holds.allocate(record.book_id, now) is None:
+                    released[record.book_id] += 1
+            _apply_stock(released, books, now)
+    return results
+
+
+def renew(user, record_ids: Sequence[int], rule: FineRule, manager: bool = False) -> List[Dict]:
+    """
+    批量续借：未逾期且未达续借上限的记录延长 min(loan_period_days, 30) 天
+
+    Returns:
+        与 record_ids 顺序一致的逐条结果：成功含 due_at、renew_count，失败含 error
+    """
+    now = timezone.now()
+    additional = timezone.timedelta(days=min(rule.loan_period_days, MAX_RENEW_DAYS))
+    with transaction.atomic():
+        records = _lock_records(record_ids, user, manager, ('borrowed',))
+
+        results = []
+        renewed = []
+        seen = set()
+        for record_id in record_ids:
+            record = records.get(record_id)
+            if record is None or record_id in seen:
+                results.append(_error('record_id', record_id, 'RECORD_NOT_FOUND', '未找到可续借的借阅记录'))
+                continue
+            if record.renew_count >= rule.max_renewals:
+                results.append(_error('record_id', record_id, 'RENEW_LIMIT_REACHED', '超过最大续借次数'))
+                continue
+            if now > record.due_at:
+                results.append(_error('record_id', record_id, 'OVERDUE_NOT_RENEWABLE', '逾期记录不可续借，请先归还'))
+                continue
+            seen.add(record_id)
+            record.due_at += additional
+            record.renew_count += 1
+            renewed.append(record)
+            results.append(_ok('record_id', record_id, due_at=record.due_at.isoformat(), renew_count=record.renew_count))
+
+        if renewed:
+            BorrowRecord.objects.bulk_update(renewed, ['due_at', 'renew_count'])
+            ledger.write(ledger.build('renewed', record, now) for record in renewed)
+    return results
+
+
+def parse_scan(code) -> Tuple[Optional[str], Optional[object]]:
+    """
+    识别扫入的条码
+
+    Returns:
+        ('isbn', ISBN) / ('record_id', 记录 ID)；无法识别时为 (None, None)
+    """
+    if isinstance(code, int) and not isinstance(code, bool):
+        return ('record_id', code) if code > 0 else (None, None)
+    if not isinstance(code, str):
+        return None, None
+    code = code.strip()
+    if ISBN_PATTERN.match(code.replace('-', '')):
+        return 'isbn', code
+    if code.isdigit():
+        return 'record_id', int(code)
+    return None, None
+
+
+def _resolve_isbns(isbns: Sequence[str]) -> Dict[str, List[int]]:
+    """
+    为扫入的 ISBN 找到待归还的借阅记录：同一本书的多册按扫入顺序依次对应应还时间最早的在借记录
+
+    Returns:
+        {扫入的 ISBN: [记录 ID, ...]}
+    """
+    codes = {isbn: book_id for book_id, isbn in Book.objects.filter(isbn__in=set(isbns)).values_list('id', 'isbn')}
+    # 扫码枪输出不带连字符的 13 位条码：精确匹配不到的按去掉连字符后的数字匹配（无索引，仅对这部分条码）
+    bare = {isbn for isbn in set(isbns) - set(codes) if isbn.isdigit()}
+    if bare:
+        codes.update(
+            Book.objects.annotate(isbn_digits=Replace('isbn', Value('-'), Value('')))
+            .filter(isbn_digits__in=bare).values_list('isbn_digits', 'id')
+        )
+    wanted = Counter(codes[isbn] for isbn in isbns if isbn in codes)
+    if not wanted:
+        return {}
+
+    active: Dict[int, List[int]] = {}
+    records = (
+        BorrowRecord.objects.filter(book_id__in=list(wanted), status__in=('borrowed', 'overdue'))
+        .order_by('due_at', 'id').values_list('id', 'book_id')
+    )
+    for record_id, book_id in records.iterator():
+        candidates = active.setdefault(book_id, [])
+        if len(candidates) < wanted[book_id]:
+            candidates.append(record_id)
+
+    resolved: Dict[str, List[int]] = {}
+    for isbn in isbns:
+        candidates = active.get(codes.get(isbn))
+        if candidates:
+            resolved.setdefault(isbn, []).append(candidates.pop(0))
+    return resolved
+
+
+def checkin_scans(user, codes: Sequence, rule: FineRule, group_size: int = DESK_GROUP_SIZE) -> Iterator[List[Dict]]:
+    """
+    还书台批量归还：按 group_size 分组，每组先把 ISBN 解析为在借记录，再调用 checkin 在一个事务中归还
+
+    ISBN 条码归还该书应还时间最早的在借记录；每组提交后即产出该组结果，中途中断不影响已提交的组。
+
+    Yields:
+        每组与 codes 顺序一致的逐条结果（含 index 与 code）
+    """
+    for start in range(0, len(codes), group_size):
+        group = codes[start:start + group_size]
+        parsed = [parse_scan(code) for code in group]
+        # 前面各组已提交，已归还的记录不会再被解析到
+        isbn_records = _resolve_isbns([value for kind, value in parsed if kind == 'isbn'])
+
+        record_ids: List[Optional[int]] = []
+        for kind, value in parsed:
+            if kind == 'isbn':
+                candidates = isbn_records.get(value)
+                record_ids.append(candidates.pop(0) if candidates else None)
+            else:
+                record_ids.append(value if kind == 'record_id' else None)
+
+        outcomes = iter(checkin(user, [record_id for record_id in record_ids if record_id is not None], rule, manager=True))
+        results = []
+        for offset, ((kind, value), record_id) in enumerate(zip(parsed, record_ids)):
+            item = {'index': start + offset, 'code': group[offset]}
+            if kind is None:
+                item.update(_error('code', group[offset], 'VALIDATION_ERROR', '无法识别的条码（应为 ISBN 或借阅记录ID）'))
+            elif record_id is None:
+                item.update(_error('isbn', value, 'RECORD_NOT_FOUND', '该图书没有在借记录'))
+            else:
+                item.update(next(outcomes))
+            results.append(item)
+        yield results
@@ -0,0 +1,198 @@
+"""
+预约排队服务
+
+图书无可借副本时读者预约排队，不必反复刷新重试借阅：
+- 排队按 (created_at, id) 先来后到；队首查询走 (book, status, created_at, id) 联合索引，
+  取第一条即可，代价与排队人数无关
+- 副本归还时在同一事务中分配给队首预约（状态置为待取书并设置取书截止时间），
+  可借数量不增加；无人排队才计入可借数量
+- 读者借阅该书时优先消耗自己的待取书预约，不再扣减库存
+- 取消待取书预约或超过取书截止时间（expire_holds 命令）后，副本继续分配给下一位，
+  队列为空时回到可借数量
+
+加锁顺序与借还一致：先图书行、后预约行。预约与归还都先锁图书行，
+保证“检查无库存后排队”与“归还时查找队首”不会交错导致副本闲置而有人排队。
+"""
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.library import stripes
+from apps.library.models import Book
+from apps.library.signals import book_stock_changed
+from .models import Hold
+
+
+DEFAULT_PICKUP_DAYS = 3
+ACTIVE_STATUSES = ('waiting', 'ready')
+
+
+def get_pickup_days() -> int:
+    """到书后保留天数，超过后预约过期"""
+    return getattr(settings, 'BORROW_HOLD_PICKUP_DAYS', DEFAULT_PICKUP_DAYS)
+
+
+def _lock_book(book_id: int) -> Optional[Book]:
+    return (
+        Book.objects.select_for_update().filter(id=book_id)
+        .only('id', 'category', 'available_copies', 'stock_stripes')
+        .first()
+    )
+
+
+def next_hold(book_id: int) -> Optional[Hold]:
+    """锁定并返回队首预约（索引定位，不扫描整个队列）"""
+    return (
+        Hold.objects.select_for_update()
+        .filter(book_id=book_id, status='waiting')
+        .order_by('created_at', 'id')
+        .first()
+    )
+
+
+def allocate(book_id: int, now) -> Optional[Hold]:
+    """
+    把一册副本分配给队首预约，须在事务中调用且已锁定图书行
+
+    Returns:
+        分配到副本的预约；无人排队时返回 None（调用方应把副本计入可借数量）
+    """
+    hold = next_hold(book_id)
+    if hold is not None:
+        hold.status = 'ready'
+        hold.ready_at = now
+        hold.expires_at = now + timezone.timedelta(days=get_pickup_days())
+        hold.save(update_fields=['status', 'ready_at', 'expires_at'])
+    return hold
+
+
+def release_copy(book_id: int, now) -> Optional[Hold]:
+    """
+    归还一册：有人排队则留给队首预约（可借数量不变），否则可借数量 +1，须在事务中调用
+
+    Returns:
+        分配到副本的预约，或 None
+    """
+    book = _lock_book(book_id)
+    if book is None:
+        return None
+    hold = allocate(book_id, now)
+    if hold is None:
+        if book.stock_stripes:
+            stripes.put(book)
+        else:
+            Book.objects.filter(id=book_id).update(available_copies=F('available_copies') + 1, updated_at=now)
+        book_stock_changed.send(sender=Book, deltas={book_id: 1}, categories={book_id: book.category})
+    return hold
+
+
+def place(user, book: Book, now=None) -> Tuple[Optional[Hold], Optional[str]]:
+    """
+    预约排队，须在事务中调用
+
+    Returns:
+        (预约, None)；失败时为 (None, 'BOOK_AVAILABLE') 或 (None, 'HOLD_EXISTS')
+    """
+    now = now or timezone.now()
+    locked = _lock_book(book.id)
+    available = stripes.totals([book.id]).get(book.id, 0) if locked.stock_stripes else locked.available_copies
+    if available > 0:
+        return None, 'BOOK_AVAILABLE'
+    if Hold.objects.filter(user=user, book_id=book.id, status__in=ACTIVE_STATUSES).exists():
+        return None, 'HOLD_EXISTS'
+    return Hold.objects.create(user=user, book_id=book.id, created_at=now), None
+
+
+def claim(user, isbn: str) -> Optional[Hold]:
+    """借阅时领取本人的待取书预约（副本已预留，不再扣减库存），须在事务中调用"""
+    found = Hold.objects.filter(user=user, book__isbn=isbn, status='ready').values_list('id', 'book_id').first()
+    if found is None:
+        return None
+    hold_id, book_id = found
+    # 先锁图书行再锁预约行（不联表），与 expire/cancel 的加锁顺序一致
+    book = _lock_book(book_id)
+    hold = Hold.objects.select_for_update().filter(id=hold_id, status='ready').first()
+    if book is None or hold is None:
+        return None
+    hold.book = book
+    hold.status = 'fulfilled'
+    hold.save(update_fields=['status'])
+    return hold
+
+
+def ready_holds(user, book_ids) -> Dict[int, Hold]:
+    """锁定并返回本人的待取书预约 {book_id: 预约}，供批量借阅领取"""
+    return {
+        hold.book_id: hold
+        for hold in Hold.objects.select_for_update().filter(user=user, book_id__in=book_ids, status='ready').order_by('id')
+    }
+
+
+def cancel(user, hold_id: int, now=None) -> Optional[Hold]:
+    """
+    取消本人的预约，须在事务中调用；待取书预约取消后副本转给下一位
+
+    Returns:
+        被取消的预约；不存在或已结束时返回 None
+    """
+    now = now or timezone.now()
+    hold = Hold.objects.filter(id=hold_id, user=user, status__in=ACTIVE_STATUSES).only('id', 'book_id').first()
+    if hold is None:
+        return None
+    # 先锁图书行再锁预约行，与归还的加锁顺序一致
+    _lock_book(hold.book_id)
+    hold = Hold.objects.select_for_update().filter(id=hold.id, status__in=ACTIVE_STATUSES).first()
+    if hold is None:
+        return None
+    was_ready = hold.status == 'ready'
+    hold.status = 'cancelled'
+    hold.save(update_fields=['status'])
+    if was_ready:
+        release_copy(hold.book_id, now)
+    return hold
+
+
+def expire(now=None, limit: Optional[int] = None) -> int:
+    """
+    使超过取书截止时间的预约过期，并把副本转给下一位；每条预约单独提交
+
+    Returns:
+        过期的预约数
+    """
+    now = now or timezone.now()
+    due = Hold.objects.filter(status='ready', expires_at__lt=now).order_by('expires_at', 'id')
+    ids = list(due.values_list('id', 'book_id')[:limit] if limit else due.values_list('id', 'book_id'))
+    expired = 0
+    for hold_id, book_id in ids:
+        with transaction.atomic():
+            _lock_book(book_id)
+            updated = Hold.objects.filter(id=hold_id, status='ready', expires_at__lt=now).update(status='expired')
+            if updated:
+                release_copy(book_id, now)
+                expired += updated
+    return expired
+
+
+def with_queue_positions(holds: QuerySet) -> QuerySet:
+    """为预约查询集标注排在前面的人数 queue_ahead（一次查询，每行一个走队列索引的计数子查询）"""
+    ahead = (
+        Hold.objects.filter(book_id=OuterRef('book_id'), status='waiting')
+        .filter(Q(created_at__lt=OuterRef('created_at')) | Q(created_at=OuterRef('created_at'), id__lt=OuterRef('id')))
+        .order_by()
+        .values('book_id')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return holds.annotate(queue_ahead=Coalesce(Subquery(ahead), 0))
+
+
+def queue_position(hold: Hold) -> int:
+    """排队中的预约位次（从 1 开始），同样走队列索引"""
+    ahead = Hold.objects.filter(book_id=hold.book_id, status='waiting').filter(
+        Q(created_at__lt=hold.created_at) | Q(created_at=hold.created_at, id__lt=hold.id)
+    ).count()
+    return ahead + 1
@@ -0,0 +1,142 @@
+"""
+借还请求幂等处理
+
+流通台网络不稳定时客户端会重复提交借阅/归还表单，造成重复的借阅记录与重复扣减库存。
+客户端为每次提交生成一个幂等键（请求头 Idempotency-Key，或表单字段 idempotency_key）：
+- 首次请求：在同一事务中先写入幂等键行，再执行视图并保存响应（状态码、内容、重定向地址）；
+  视图抛出异常时幂等键随事务回滚，客户端可用同一键重试
+- 重复请求：有效期内直接重放保存的响应（响应头 Idempotent-Replayed: true），不再执行视图
+- 并发的重复请求：在 (user, key) 唯一索引上等待首个请求提交，随后读取并重放
+- 同一键用于不同请求（路径或内容不同）：返回 422 IDEMPOTENCY_KEY_MISMATCH
+- 5xx 响应不保存，便于重试；过期的键由 purge_idempotency_keys 命令清理
+
+未登录或未携带幂等键的请求按原逻辑处理。
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+DEFAULT_TTL = 24 * 3600
+
+
+def get_ttl() -> int:
+    """幂等键有效期（秒）"""
+    return getattr(settings, 'BORROW_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def _get_key(request):
+    key = request.META.get(HEADER) or request.POST.get(FORM_FIELD) or ''
+    return key.strip()
+
+
+def _request_hash(request) -> str:
+    """请求摘要：路径 + 请求体（表单中的幂等键与 CSRF 令牌不参与）"""
+    digest = hashlib.sha256(request.path.encode('utf-8'))
+    if request.content_type == 'application/json':
+        digest.update(request.body)
+    else:
+        for name in sorted(request.POST):
+            if name in (FORM_FIELD, 'csrfmiddlewaretoken'):
+                continue
+            for value in request.POST.getlist(name):
+                digest.update(f'\0{name}={value}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _error(code, message, status):
+    return JsonResponse({
+        'error': {
+            'code': code,
+            'message': message
+        }
+    }, status=status)
+
+
+def _replay(record: IdempotencyKey, request_hash: str):
+    if record.request_hash != request_hash:
+        return _error('IDEMPOTENCY_KEY_MISMATCH', '该幂等键已用于其他请求', 422)
+    response = HttpResponse(record.body, status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lookup(user, key, now):
+    return IdempotencyKey.objects.filter(user=user, key=key, expires_at__gt=now).first()
+
+
+class _Duplicate(Exception):
+    """并发的重复请求已写入同一幂等键"""
+
+
+def idempotent(view_func):
+    """借还视图装饰器：按幂等键保存并重放响应，放在 require_POST/login_required 之后"""
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = _get_key(request)
+        if not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error('VALIDATION_ERROR', f'幂等键长度不能超过 {MAX_KEY_LENGTH}', 400)
+
+        now = timezone.now()
+        request_hash = _request_hash(request)
+        record = _lookup(request.user, key, now)
+        if record is not None:
+            return _replay(record, request_hash)
+
+        try:
+            with transaction.atomic():
+                # 清理同一键的过期记录后再写入；并发的重复请求在唯一索引上等待本事务结束
+                IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+                try:
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, endpoint=view_func.__name__[:64],
+                        request_hash=request_hash, status_code=0, created_at=now,
+                        expires_at=now + timezone.timedelta(seconds=get_ttl()),
+                    )
+                except IntegrityError:
+                    raise _Duplicate
+
+                response = view_func(request, *args, **kwargs)
+                if response.status_code >= 500 or getattr(response, 'streaming', False):
+                    # 服务端错误与流式响应不保存，客户端可用同一键重试
+                    record.delete()
+                    return response
+                record.status_code = response.status_code
+                record.content_type = response.get('Content-Type', '')[:100]
+                record.location = response.get('Location', '')[:255]
+                record.body = response.content.decode(response.charset or 'utf-8', errors='replace')
+                record.save(update_fields=['status_code', 'content_type', 'location', 'body'])
+                return response
+        except _Duplicate:
+            record = _lookup(request.user, key, timezone.now())
+            if record is None:
+                return _error('IDEMPOTENCY_KEY_IN_USE', '相同幂等键的请求正在处理，请稍后重试', 409)
+            return _replay(record, request_hash)
+
+    return wrapper
+
+
+def purge_expired(batch_size: int = 1000, now=None) -> int:
+    """按 expires_at 索引分批删除过期的幂等键，返回删除行数"""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        expired = IdempotencyKey.objects.filter(expires_at__lte=now).order_by('expires_at')
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
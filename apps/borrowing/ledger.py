@@ -0,0 +1,76 @@
+"""
+流通事件流水
+
+借阅记录的每次状态变更（借出、归还、续借、逾期、罚款）都在同一事务中追加一行 CirculationEvent：
+事务回滚时事件随之回滚，提交后事件与状态变更一致。流水只追加不修改，
+统计由 rollups.consume 按事件 id 高水位增量汇总，不再回扫 BorrowRecord 全表。
+
+罚款事件记录 fine_amount 的变动额（逾期标记时预计算、归还时按实际天数重算），
+各罚款事件金额之和等于借阅记录上的罚款金额之和。
+"""
+from decimal import Decimal
+from typing import Iterable, List
+
+from django.db import transaction
+
+from .models import BorrowRecord, CirculationEvent
+
+
+def build(event_type: str, record: BorrowRecord, now, amount: Decimal = Decimal('0.00')) -> CirculationEvent:
+    """构造一条事件（未保存），供批量写入"""
+    return CirculationEvent(
+        event_type=event_type, record_id=record.id, user_id=record.user_id, book_id=record.book_id,
+        amount=amount, occurred_at=now,
+    )
+
+
+def fine_changed(record: BorrowRecord, previous_fine: Decimal, now) -> List[CirculationEvent]:
+    """罚款金额有变动时构造罚款事件（金额为变动额），否则返回空列表"""
+    delta = record.fine_amount - previous_fine
+    return [build('fined', record, now, delta)] if delta else []
+
+
+def write(events: Iterable[CirculationEvent]) -> None:
+    """批量写入事件，须在状态变更所在的事务中调用"""
+    events = list(events)
+    if events:
+        CirculationEvent.objects.bulk_create(events)
+
+
+def log(event_type: str, record: BorrowRecord, now, amount: Decimal = Decimal('0.00')) -> None:
+    """写入单条事件，须在状态变更所在的事务中调用"""
+    build(event_type, record, now, amount).save()
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    由现有借阅记录补录历史事件，仅在流水为空时执行（部署流水之前的数据），应在停止借还时运行
+
+    借出按 borrowed_at、归还按 returned_at、逾期按 due_at 记录，罚款按归还（或应还）时间记录全额；
+    历史续借没有发生时间，不补录。
+
+    Returns:
+        写入的事件数
+    """
+    if CirculationEvent.objects.exists():
+        return 0
+    written = 0
+    last_id = 0
+    fields = ('id', 'user', 'book', 'borrowed_at', 'due_at', 'returned_at', 'status', 'fine_amount')
+    while True:
+        records = list(BorrowRecord.objects.filter(id__gt=last_id).order_by('id').only(*fields)[:batch_size])
+        if not records:
+            return written
+        events = []
+        for record in records:
+            events.append(build('borrowed', record, record.borrowed_at))
+            if record.status == 'overdue':
+                events.append(build('overdue', record, record.due_at))
+            if record.returned_at is not None:
+                events.append(build('returned', record, record.returned_at))
+            if record.fine_amount:
+                events.append(build('fined', record, record.returned_at or record.due_at, record.fine_amount))
+        with transaction.atomic():
+            write(events)
+        written += len(events)
+        last_id = records[-1].id
@@ -0,0 +1,51 @@
+"""
+逾期罚款逐日累计管理命令
+
+用法：
+    python manage.py accrue_fines [--chunk-size 1000] [--workers 4] [--dry-run]
+
+功能：
+    - 查找罚款尚未累计到今天的逾期记录（fine_accrued_on 早于今天或为空）
+    - 按主键范围分块，每块一个事务、一条 UPDATE 按逾期天数重算罚款，并写入罚款变动流水
+    - 同一天重复执行不会再更新；中断后重新执行只处理剩余记录
+    - --workers N 由 N 个进程并行处理各主键范围
+
+建议通过定时任务（如cron）每日在 mark_overdue 之后执行
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.borrowing import overdue, rules
+
+
+class Command(BaseCommand):
+    help = '把逾期记录的罚款逐日累计到今天'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=overdue.DEFAULT_CHUNK_SIZE,
+                            help=f'每个事务处理的记录数（默认 {overdue.DEFAULT_CHUNK_SIZE}）')
+        parser.add_argument('--workers', type=int, default=1, help='并行进程数（默认 1）')
+        parser.add_argument('--dry-run', action='store_true', help='仅统计待累计的记录数，不实际更新数据库')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size 与 --workers 必须为正整数')
+        now = timezone.now()
+
+        if options['dry_run']:
+            count = overdue.accrual_pending(now.date()).count()
+            self.stdout.write(self.style.WARNING('--dry-run 模式：不会实际更新数据库'))
+            self.stdout.write(f'待累计罚款的逾期记录 {count} 条')
+            return
+
+        count, accrued = overdue.accrue(
+            now, rules.get_rule(), options['chunk_size'],
+            progress=overdue.progress_printer(self.stdout.write, '已累计'),
+            workers=overdue.effective_workers(
+                options['workers'], lambda message: self.stdout.write(self.style.WARNING(message))
+            ),
+        )
+        if count:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已累计 {count} 条逾期记录的罚款，新增罚款 {accrued} 元'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 所有逾期记录的罚款已累计到今天'))
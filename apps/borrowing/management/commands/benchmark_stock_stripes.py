@@ -0,0 +1,118 @@
+"""
+库存扣减并发基准管理命令
+
+用法：
+    python manage.py benchmark_stock_stripes [--copies 2000] [--threads 16] [--stripes 8]
+
+功能：
+    - 创建一本临时图书，用 threads 个线程并发借出全部 copies 册（每次借阅一个事务）
+    - 依次比较三种扣减方式的吞吐量：
+        locking     SELECT ... FOR UPDATE 后检查并扣减（单行锁）
+        optimistic  条件 UPDATE ... WHERE available_copies > 0（单行）
+        striped     分段库存，随机一段条件扣减
+    - 每种方式结束后核对借出册数与剩余库存（不会出现负数或超借）
+    - 结束后删除临时图书
+    - 各线程使用自己的数据库连接并各自提交，无法整体回滚；重置库存的 UPDATE 不触发信号，
+      每次重置与结束删除后按实际数据重新聚合该分类的汇总并使可借数量缓存失效
+
+需要支持行级锁的数据库（MySQL/PostgreSQL），SQLite 为库级锁，结果没有参考意义
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from apps.borrowing import circulation
+from apps.library import availability, facets, stripes
+from apps.library.models import Book
+
+
+BENCHMARK_ISBN = '978-9-999-99999-1'
+BENCHMARK_CATEGORY = '基准测试'
+MODES = ('locking', 'optimistic', 'striped')
+
+
+class Command(BaseCommand):
+    help = '对比单行锁、条件 UPDATE 与分段库存的并发借阅吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=2000, help='临时图书的册数，即每种方式的借阅次数（默认 2000）')
+        parser.add_argument('--threads', type=int, default=16, help='并发线程数（默认 16）')
+        parser.add_argument('--stripes', type=int, default=stripes.DEFAULT_STRIPES,
+                            help=f'分段数（默认 {stripes.DEFAULT_STRIPES}）')
+
+    def _reset(self, book, mode, copies, stripe_count):
+        stripes.disable(book.id)
+        Book.objects.filter(id=book.id).update(available_copies=copies, total_copies=copies)
+        if mode == 'striped':
+            stripes.enable(book.id, stripe_count)
+        self._sync_derived(book.id)
+
+    def _sync_derived(self, book_id):
+        """直接 UPDATE 与借出通知的增量不对应，按实际数据重算分类汇总并使缓存失效"""
+        facets.refresh_categories([BENCHMARK_CATEGORY])
+        availability.invalidate([book_id])
+
+    def _run(self, mode, copies, threads):
+        strategy = circulation.STOCK_STRATEGY_LOCKING if mode == 'locking' else circulation.STOCK_STRATEGY_OPTIMISTIC
+        lock = threading.Lock()
+        counts = {'taken': 0, 'retries': 0}
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            book, error = circulation.take_copy(BENCHMARK_ISBN, timezone.now(), strategy)
+                    except OperationalError:
+                        # 锁等待超时/死锁回滚后重试
+                        with lock:
+                            counts['retries'] += 1
+                        continue
+                    if error:
+                        return
+                    with lock:
+                        counts['taken'] += 1
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return time.perf_counter() - started, counts
+
+    def handle(self, *args, **options):
+        copies, threads = options['copies'], options['threads']
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite 为库级锁，以下结果仅验证正确性，吞吐量没有参考意义'))
+
+        Book.objects.filter(isbn=BENCHMARK_ISBN).delete()
+        book = Book.objects.create(
+            title='库存基准测试', isbn=BENCHMARK_ISBN, category=BENCHMARK_CATEGORY,
+            total_copies=copies, available_copies=copies,
+        )
+        try:
+            baseline = None
+            for mode in MODES:
+                self._reset(book, mode, copies, options['stripes'])
+                elapsed, counts = self._run(mode, copies, threads)
+                book.refresh_from_db()
+                remaining = (
+                    stripes.totals([book.id]).get(book.id, 0) if book.stock_stripes else book.available_copies
+                )
+                rate = counts['taken'] / elapsed if elapsed else 0
+                baseline = baseline or rate
+                status = '✓' if counts['taken'] == copies and remaining == 0 else '✗'
+                self.stdout.write(
+                    f'{status} {mode:<10} 借出 {counts["taken"]}/{copies} 册，剩余 {remaining}，'
+                    f'重试 {counts["retries"]} 次，耗时 {elapsed:.2f} 秒，'
+                    f'{rate:.0f} 次/秒（{rate / baseline if baseline else 0:.2f}x）'
+                )
+        finally:
+            Book.objects.filter(id=book.id).delete()
+            self._sync_derived(book.id)
@@ -0,0 +1,47 @@
+"""
+预约过期处理管理命令
+
+用法：
+    python manage.py expire_holds [--dry-run] [--limit N]
+
+功能：
+    - 查找超过取书截止时间仍未借阅的待取书预约
+    - 将其标记为 'expired'，保留的副本转给下一位排队读者（队列为空时计入可借数量）
+    - 每条预约单独提交，执行中断不会影响已处理的预约
+
+建议通过定时任务（如cron）每小时执行
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.borrowing import holds
+from apps.borrowing.models import Hold
+
+
+class Command(BaseCommand):
+    help = '使超过取书截止时间的预约过期，并把副本转给下一位'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='仅显示将要过期的预约，不实际更新数据库')
+        parser.add_argument('--limit', type=int, default=None, help='本次最多处理的预约数')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        if options['dry_run']:
+            due = Hold.objects.filter(status='ready', expires_at__lt=now).select_related('user', 'book').order_by('expires_at')
+            if options['limit']:
+                due = due[:options['limit']]
+            self.stdout.write(self.style.WARNING('--dry-run 模式：不会实际更新数据库'))
+            for hold in due:
+                self.stdout.write(
+                    f'  - 预约 #{hold.id}: {hold.user.username} - {hold.book.title} '
+                    f'(取书截止 {timezone.localtime(hold.expires_at):%Y-%m-%d %H:%M})'
+                )
+            return
+
+        expired = holds.expire(now, limit=options['limit'])
+        if expired:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已过期 {expired} 条预约，副本已转给下一位或计入可借数量'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 没有过期的预约'))
@@ -2,21 +2,28 @@
 逾期标记与罚款计算管理命令
 
 用法：
-    python manage.py mark_overdue
+    python manage.py mark_overdue [--chunk-size 1000] [--workers 4] [--per-row] [--dry-run]
 
 功能：
     - 扫描所有应还日期已过但未归还的借阅记录
     - 将状态标记为 'overdue'
     - 根据罚款规则预计算罚款金额
+    - 在同一事务中写入逾期与罚款流通事件（见 apps.borrowing.ledger）
+    - 默认按主键范围分块，每块一个小事务、一条 UPDATE 在 SQL 中计算罚款（见 apps.borrowing.overdue）；
+      --per-row 退回逐条保存、单个事务的方式，两者结果相同
+    - --workers N 把待标记记录切成主键范围后由 N 个进程并行处理（各自的数据库连接），
+      输出进度并汇总合计；结果与进程数无关
+    - 记录罚款累计到的日期，此后由 accrue_fines 命令逐日累计罚款
     - 输出统计信息
 
 建议通过定时任务（如cron）每日执行
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from django.db import transaction
 from decimal import Decimal
-from apps.borrowing.models import BorrowRecord, FineRule
+from apps.borrowing import ledger, overdue, rules
+from apps.borrowing.models import BorrowRecord
 
 
 class Command(BaseCommand):
@@ -28,18 +35,30 @@ class Command(BaseCommand):
             action='store_true',
             help='仅显示将要标记的记录，不实际更新数据库',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=overdue.DEFAULT_CHUNK_SIZE,
+            help=f'每个事务标记的记录数（默认 {overdue.DEFAULT_CHUNK_SIZE}）',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='并行进程数（默认 1，即在当前进程中顺序执行）',
+        )
+        parser.add_argument(
+            '--per-row',
+            action='store_true',
+            help='逐条保存并在单个事务中标记（旧方式，用于核对）',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         now = timezone.now()
         
-        # 获取罚款规则
-        rule = FineRule.objects.first()
-        if not rule:
-            rule = FineRule.objects.create()
-            self.stdout.write(
-                self.style.WARNING('未找到罚款规则，已创建默认规则')
-            )
+        # 获取罚款规则（不存在时创建默认规则）
+        rule = rules.get_rule()
         
         # 查找所有应还日期已过但未归还的记录
         overdue_records = BorrowRecord.objects.filter(
@@ -68,21 +87,43 @@ class Command(BaseCommand):
                 )
             return
         
-        # 批量更新逾期记录
+        if not options['per_row']:
+            if options['chunk_size'] < 1 or options['workers'] < 1:
+                raise CommandError('--chunk-size 与 --workers 必须为正整数')
+            updated_count, total_fine = overdue.mark(
+                now, rule, options['chunk_size'], progress=overdue.progress_printer(self.stdout.write),
+                workers=overdue.effective_workers(
+                    options['workers'], lambda message: self.stdout.write(self.style.WARNING(message))
+                ),
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ 成功标记 {updated_count} 条逾期记录，总罚款金额: {total_fine} 元'
+                )
+            )
+            return
+        
+        # 逐条更新逾期记录
         updated_count = 0
         total_fine = Decimal('0.00')
+        events = []
         
         with transaction.atomic():
             for record in overdue_records:
                 days = (now.date() - record.due_at.date()).days
                 fine = Decimal(days) * rule.daily_fine if days > 0 else Decimal('0.00')
                 
+                previous_fine = record.fine_amount
                 record.status = 'overdue'
                 record.fine_amount = fine
-                record.save(update_fields=['status', 'fine_amount'])
+                record.fine_accrued_on = now.date()
+                record.save(update_fields=['status', 'fine_amount', 'fine_accrued_on'])
+                events.append(ledger.build('overdue', record, now))
+                events.extend(ledger.fine_changed(record, previous_fine, now))
                 
                 updated_count += 1
                 total_fine += fine
+            ledger.write(events)
         
         self.stdout.write(
             self.style.SUCCESS(
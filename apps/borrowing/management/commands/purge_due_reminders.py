@@ -0,0 +1,27 @@
+"""
+清理到期提醒记录管理命令
+
+用法：
+    python manage.py purge_due_reminders [--batch-size 1000]
+
+功能：
+    - 分批删除借阅记录已归还或已逾期的到期提醒记录（DueReminder），这些记录不会再被提醒
+    - 每批单独提交，避免长事务与大范围锁
+    - 输出删除行数
+
+建议通过定时任务（如cron）每日在 send_due_reminders 之后执行
+"""
+from django.core.management.base import BaseCommand
+
+from apps.borrowing import reminders
+
+
+class Command(BaseCommand):
+    help = '清理已结束借阅的到期提醒记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批删除行数（默认 1000）')
+
+    def handle(self, *args, **options):
+        deleted = reminders.purge_closed(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ 已清理 {deleted} 条到期提醒记录'))
@@ -0,0 +1,27 @@
+"""
+清理过期幂等键管理命令
+
+用法：
+    python manage.py purge_idempotency_keys [--batch-size 1000]
+
+功能：
+    - 按 expires_at 索引分批删除已过期的借还幂等键（有效期见 BORROW_IDEMPOTENCY_TTL）
+    - 每批单独提交，避免长事务与大范围锁
+    - 输出删除行数
+
+建议通过定时任务（如cron）每小时执行
+"""
+from django.core.management.base import BaseCommand
+
+from apps.borrowing import idempotency
+
+
+class Command(BaseCommand):
+    help = '清理过期的借还幂等键'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批删除行数（默认 1000）')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ 已清理 {deleted} 条过期幂等键'))
@@ -0,0 +1,61 @@
+"""
+到期调度管理命令
+
+用法：
+    python manage.py run_due_scheduler [--batch-size 1000] [--lookahead 3600] [--refresh 60]
+    python manage.py run_due_scheduler --once
+
+功能：
+    - 常驻运行，把即将到期的借出记录按应还时间放入优先队列，到期即标记为逾期并计算罚款、写入流水
+      （见 apps.borrowing.scheduler），不必等待每日一次的 mark_overdue 扫描
+    - 每隔 refresh 秒从 (status, due_at) 索引重新装载，跟上新借出、续借与归还
+    - --once 标记当前已到期的记录后退出（可由定时任务按分钟执行）
+    - 逐日累计罚款仍由 accrue_fines 命令负责；mark_overdue 可保留为兜底核对
+
+由 supervisor/systemd 等守护，同一时间只需运行一个实例（多个实例也不会重复标记）
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.borrowing import scheduler
+
+
+class Command(BaseCommand):
+    help = '按应还时间常驻标记逾期记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=scheduler.DEFAULT_BATCH_SIZE,
+                            help=f'每次装载的记录数（默认 {scheduler.DEFAULT_BATCH_SIZE}）')
+        parser.add_argument('--lookahead', type=float, default=scheduler.DEFAULT_LOOKAHEAD,
+                            help=f'装载应还时间在多少秒内的记录（默认 {scheduler.DEFAULT_LOOKAHEAD}）')
+        parser.add_argument('--refresh', type=float, default=scheduler.DEFAULT_REFRESH,
+                            help=f'重新装载间隔秒数（默认 {scheduler.DEFAULT_REFRESH}）')
+        parser.add_argument('--once', action='store_true', help='标记当前已到期的记录后退出')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['refresh'] <= 0:
+            raise CommandError('--batch-size 与 --refresh 必须为正数')
+        if options['lookahead'] < options['refresh']:
+            # 窗口短于装载间隔时，两次装载之间到期的记录要等到下次装载才能入队
+            raise CommandError('--lookahead 不能小于 --refresh')
+
+        queue = scheduler.DueScheduler(options['batch_size'], options['lookahead'], options['refresh'])
+        if not options['once']:
+            self.stdout.write(f'到期调度已启动：装载 {options["lookahead"]:g} 秒内到期的记录，'
+                              f'每 {options["refresh"]:g} 秒刷新')
+        try:
+            while True:
+                now = timezone.now()
+                count, total = queue.tick(now)
+                if count or options['once']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ {timezone.localtime(now):%Y-%m-%d %H:%M:%S} 标记 {count} 条逾期记录，罚款 {total} 元'
+                    ))
+                if options['once']:
+                    return
+                # 应还时间须严格早于 now，多睡一小段避免醒来时恰好未到
+                time.sleep(queue.seconds_until_next(timezone.now()) + 0.01)
+        except KeyboardInterrupt:
+            self.stdout.write('到期调度已停止')
@@ -0,0 +1,51 @@
+"""
+到期提醒邮件管理命令
+
+用法：
+    python manage.py send_due_reminders [--days 3] [--batch-size 100] [--dry-run]
+
+功能：
+    - 流式读取 days 天内到期、尚未提醒的借出记录，按读者合并为一封摘要邮件
+    - 每 batch-size 封通过同一个邮件连接发送，发送后记录 DueReminder，重复执行只发送新增提醒
+    - 续借改变应还时间后按新的应还时间再提醒一次；没有邮箱的读者跳过
+    - 邮件经 EMAIL_BACKEND 发送，开发环境为 console 后端（输出到控制台）
+
+建议通过定时任务（如cron）每日执行
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.borrowing import reminders
+
+
+class Command(BaseCommand):
+    help = '按读者汇总发送图书到期提醒邮件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help=f'提前天数（默认 BORROW_REMINDER_DAYS，即 {reminders.get_days()}）')
+        parser.add_argument('--batch-size', type=int, default=reminders.DEFAULT_BATCH_SIZE,
+                            help=f'每批通过同一连接发送的邮件数（默认 {reminders.DEFAULT_BATCH_SIZE}）')
+        parser.add_argument('--dry-run', action='store_true', help='仅显示将要发送的提醒，不发送也不记录')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or (options['days'] is not None and options['days'] < 1):
+            raise CommandError('--days 与 --batch-size 必须为正整数')
+        now = timezone.now()
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('--dry-run 模式：不会发送邮件'))
+            users = count = 0
+            pending = reminders.pending(now, options['days']).iterator(chunk_size=reminders.ITERATOR_CHUNK_SIZE)
+            for user, records in reminders.digests(pending):
+                users += 1
+                count += len(records)
+                self.stdout.write(f'  - {user.username} <{user.email}>：{len(records)} 本')
+            self.stdout.write(f'将向 {users} 名读者提醒 {count} 条借阅记录')
+            return
+
+        sent, count = reminders.send(now, options['days'], options['batch_size'])
+        if sent:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已发送 {sent} 封提醒邮件，涉及 {count} 条借阅记录'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 没有需要提醒的记录'))
@@ -0,0 +1,281 @@
+"""
+并发借还压测管理命令
+
+用法：
+    python manage.py simulate_circulation [--threads 8] [--ops 200] [--books 20] [--copies 3]
+                                          [--mix 50:35:15] [--seed 42] [--keep]
+
+功能：
+    - 生成压测图书（分类“压测”）与读者账号，每个线程以一名读者身份通过 Django 测试客户端
+      随机提交借阅 / 归还 / 续借表单（经过完整的中间件、视图与事务）
+    - 统计总吞吐量，各操作与整体的 p50/p95/p99 延迟，成功/业务失败次数
+    - 统计死锁与锁等待超时（视图抛出的数据库异常）；MySQL 下另读取 InnoDB 行锁等待次数、
+      累计等待时间与死锁计数的增量
+    - 结束后逐本核对库存不变量：可借数量 + 在借记录数 + 待取书预约数 == 馆藏总数
+      （分段库存的图书按各段之和计算可借数量）
+    - 默认删除压测数据（含流通事件流水，已汇总的日期按剩余流水重算）；--keep 保留以便排查
+
+需要支持行级锁的数据库（MySQL/PostgreSQL）才能反映真实并发表现，SQLite 为库级锁
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.contrib.messages import constants as message_constants
+from django.contrib.messages import get_messages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count, Q
+from django.test import Client
+
+from apps.accounts.models import User
+from apps.borrowing import rollups
+from apps.borrowing.models import BorrowRecord, CirculationEvent
+from apps.library import stripes
+from apps.library.isbn import make_isbn
+from apps.library.models import Book
+
+
+CATEGORY = '压测'
+USERNAME_PREFIX = 'sim_reader_'
+ISBN_BASE = 990000000
+OPERATIONS = ('borrow', 'return', 'renew')
+URLS = {'borrow': '/borrowing/borrow/', 'return': '/borrowing/return/', 'renew': '/borrowing/renew/'}
+
+
+def _classify_error(exc: OperationalError) -> str:
+    """区分死锁与锁等待超时（MySQL 1213/1205，PostgreSQL 错误信息，SQLite database is locked）"""
+    code = exc.args[0] if exc.args and isinstance(exc.args[0], int) else None
+    message = str(exc).lower()
+    if code == 1213 or 'deadlock' in message:
+        return 'deadlocks'
+    if code == 1205 or 'lock wait timeout' in message or 'locked' in message:
+        return 'lock_timeouts'
+    return 'db_errors'
+
+
+def _lock_metrics():
+    """MySQL InnoDB 行锁等待次数、累计等待时间（毫秒）与死锁计数；其他数据库返回 None"""
+    if connection.vendor != 'mysql':
+        return None
+    metrics = {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN ('Innodb_row_lock_waits', 'Innodb_row_lock_time')"
+        )
+        metrics.update({name: int(value) for name, value in cursor.fetchall()})
+        try:
+            cursor.execute("SELECT COUNT FROM information_schema.INNODB_METRICS WHERE NAME = 'lock_deadlocks'")
+            row = cursor.fetchone()
+            metrics['deadlocks'] = int(row[0]) if row else 0
+        except Exception:
+            metrics['deadlocks'] = 0
+    return metrics
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Command(BaseCommand):
+    help = '并发借还压测并核对库存不变量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='并发线程数，每个线程一名读者（默认 8）')
+        parser.add_argument('--ops', type=int, default=200, help='每个线程的操作次数（默认 200）')
+        parser.add_argument('--books', type=int, default=20, help='压测图书数（默认 20，越少争用越激烈）')
+        parser.add_argument('--copies', type=int, default=3, help='每本图书的馆藏数（默认 3）')
+        parser.add_argument('--mix', default='50:35:15', help='借阅:归还:续借 的权重（默认 50:35:15）')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+        parser.add_argument('--keep', action='store_true', help='保留压测数据（默认删除）')
+
+    def _parse_mix(self, mix):
+        try:
+            weights = [int(part) for part in mix.split(':')]
+        except ValueError:
+            weights = []
+        if len(weights) != 3 or min(weights) < 0 or not sum(weights):
+            raise CommandError('--mix 格式应为三个非负整数，如 50:35:15')
+        return weights
+
+    def _seed(self, options):
+        # 上次中断残留的压测数据
+        self._cleanup()
+        books = [
+            Book.objects.create(
+                title=f'压测图书 {idx}', author='压测', isbn=make_isbn(ISBN_BASE + idx), category=CATEGORY,
+                total_copies=options['copies'], available_copies=options['copies'],
+            )
+            for idx in range(options['books'])
+        ]
+        users = []
+        for idx in range(options['threads']):
+            user = User(username=f'{USERNAME_PREFIX}{idx}', role='student')
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+        return books, users
+
+    def _cleanup(self):
+        # 流水不建外键，不随读者与图书级联删除：先按压测读者与图书删除事件并重算已汇总的日期
+        user_ids = list(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('id', flat=True))
+        book_ids = list(Book.objects.filter(category=CATEGORY).values_list('id', flat=True))
+        rollups.discard(CirculationEvent.objects.filter(Q(user_id__in=user_ids) | Q(book_id__in=book_ids)))
+        # 借阅记录对图书为 PROTECT：先删读者（级联删除其借阅记录、预约与幂等键），再删图书
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        BorrowRecord.objects.filter(book__category=CATEGORY).delete()
+        Book.objects.filter(category=CATEGORY).delete()
+
+    def _worker(self, user, isbns, weights, ops, seed, stats, lock):
+        rng = random.Random(seed)
+        client = Client()
+        client.force_login(user)
+        local = defaultdict(list)
+        counters = defaultdict(int)
+        try:
+            for _ in range(ops):
+                op = rng.choices(OPERATIONS, weights)[0]
+                if op == 'borrow':
+                    data = {'isbn': rng.choice(isbns)}
+                else:
+                    statuses = ('borrowed', 'overdue') if op == 'return' else ('borrowed',)
+                    active = list(
+                        BorrowRecord.objects.filter(user=user, status__in=statuses).values_list('id', flat=True)
+                    )
+                    if not active:
+                        op, data = 'borrow', {'isbn': rng.choice(isbns)}
+                    else:
+                        data = {'record_id': str(rng.choice(active))}
+
+                started = time.perf_counter()
+                try:
+                    response = client.post(URLS[op], data)
+                except OperationalError as exc:
+                    counters[_classify_error(exc)] += 1
+                    local[op].append((time.perf_counter() - started) * 1000)
+                    continue
+                local[op].append((time.perf_counter() - started) * 1000)
+
+                # 表单视图以消息提示结果；读取后清除，避免消息在会话中累积
+                levels = [message.level for message in get_messages(response.wsgi_request)]
+                client.cookies.pop('messages', None)
+                if message_constants.SUCCESS in levels:
+                    counters[f'{op}_ok'] += 1
+                else:
+                    counters[f'{op}_rejected'] += 1
+        finally:
+            connection.close()
+            with lock:
+                for op, values in local.items():
+                    stats['latency'][op].extend(values)
+                for name, value in counters.items():
+                    stats['counters'][name] += value
+
+    def _check_invariant(self):
+        """可借数量 + 在借记录数 + 待取书预约数 == 馆藏总数"""
+        books = list(
+            Book.objects.filter(category=CATEGORY).annotate(
+                loans=Count('borrow_records', filter=Q(borrow_records__status__in=('borrowed', 'overdue')), distinct=True),
+                ready_holds=Count('holds', filter=Q(holds__status='ready'), distinct=True),
+            )
+        )
+        striped = stripes.totals([book.id for book in books if book.stock_stripes])
+        violations = []
+        for book in books:
+            available = striped.get(book.id, 0) if book.stock_stripes else book.available_copies
+            if available + book.loans + book.ready_holds != book.total_copies:
+                violations.append((book, available))
+        return books, violations
+
+    def handle(self, *args, **options):
+        weights = self._parse_mix(options['mix'])
+        if options['threads'] < 1 or options['ops'] < 1 or options['books'] < 1:
+            raise CommandError('--threads、--ops、--books 必须为正整数')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite 为库级锁，吞吐量与锁等待数据没有参考意义'))
+
+        books, users = self._seed(options)
+        isbns = [book.isbn for book in books]
+        self.stdout.write(f'已生成 {len(books)} 本图书（每本 {options["copies"]} 册）、{len(users)} 名读者')
+
+        stats = {'latency': defaultdict(list), 'counters': defaultdict(int)}
+        lock = threading.Lock()
+        before = _lock_metrics()
+        threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(user, isbns, weights, options['ops'], options['seed'] + idx, stats, lock),
+            )
+            for idx, user in enumerate(users)
+        ]
+        # 数据库异常由本命令分类计数，压测期间不逐条输出 django.request 的错误日志
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            request_logger.setLevel(previous_level)
+        elapsed = time.perf_counter() - started
+        after = _lock_metrics()
+
+        try:
+            self._report(stats, elapsed, before, after)
+            checked, violations = self._check_invariant()
+            for book, available in violations[:20]:
+                self.stdout.write(self.style.ERROR(
+                    f'  ✗ {book.isbn}：可借 {available} + 在借 {book.loans} + 待取书 {book.ready_holds} '
+                    f'!= 馆藏 {book.total_copies}'
+                ))
+            if violations:
+                self.stdout.write(self.style.ERROR(f'✗ 库存不变量：{len(violations)}/{len(checked)} 本图书不一致'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'✓ 库存不变量：{len(checked)} 本图书全部一致'))
+        finally:
+            if options['keep']:
+                self.stdout.write('已保留压测数据（分类“压测”，读者 sim_reader_*）')
+            else:
+                self._cleanup()
+                self.stdout.write('已删除压测数据')
+
+    def _report(self, stats, elapsed, before, after):
+        latency = stats['latency']
+        counters = stats['counters']
+        all_values = [value for values in latency.values() for value in values]
+        total = len(all_values)
+        self.stdout.write(f'完成 {total} 次操作，耗时 {elapsed:.2f} 秒，吞吐量 {total / elapsed:.1f} 次/秒')
+        for op in OPERATIONS + ('all',):
+            values = all_values if op == 'all' else latency.get(op, [])
+            if not values:
+                continue
+            label = '合计' if op == 'all' else (
+                f'{op}（成功 {counters[f"{op}_ok"]}，拒绝 {counters[f"{op}_rejected"]}）'
+            )
+            self.stdout.write(
+                f'  {label}：{len(values)} 次，p50 {_percentile(values, 0.5):.1f} ms，'
+                f'p95 {_percentile(values, 0.95):.1f} ms，p99 {_percentile(values, 0.99):.1f} ms'
+            )
+        self.stdout.write(
+            f'死锁 {counters["deadlocks"]} 次，锁等待超时 {counters["lock_timeouts"]} 次，'
+            f'其他数据库错误 {counters["db_errors"]} 次'
+        )
+        if before is not None and after is not None:
+            waits = after.get('Innodb_row_lock_waits', 0) - before.get('Innodb_row_lock_waits', 0)
+            wait_ms = after.get('Innodb_row_lock_time', 0) - before.get('Innodb_row_lock_time', 0)
+            self.stdout.write(
+                f'InnoDB 行锁等待 {waits} 次，累计 {wait_ms} ms'
+                f'（平均 {wait_ms / waits if waits else 0:.1f} ms），'
+                f'死锁计数 +{after.get("deadlocks", 0) - before.get("deadlocks", 0)}'
+            )
+        else:
+            self.stdout.write('锁等待时间：当前数据库不提供全局行锁统计（仅 MySQL 支持）')
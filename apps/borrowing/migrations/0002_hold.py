@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+        ('library', '0006_book_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', '排队中'), ('ready', '待取书'), ('fulfilled', '已借出'), ('cancelled', '已取消'), ('expired', '已过期')], default='waiting', max_length=16, verbose_name='状态')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='预约时间')),
+                ('ready_at', models.DateTimeField(blank=True, null=True, verbose_name='到书时间')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='取书截止时间')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='holds', to='library.book', verbose_name='图书')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '预约',
+                'verbose_name_plural': '预约',
+                'indexes': [models.Index(fields=['book', 'status', 'created_at', 'id'], name='borrowing_h_book_id_212fc6_idx'), models.Index(fields=['status', 'expires_at'], name='borrowing_h_status_08b3f3_idx'), models.Index(fields=['user', 'status'], name='borrowing_h_user_id_b13600_idx')],
+            },
+        ),
+    ]
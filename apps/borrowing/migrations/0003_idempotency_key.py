@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0002_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, verbose_name='幂等键')),
+                ('endpoint', models.CharField(max_length=64, verbose_name='接口')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='请求摘要')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='响应状态码')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='响应类型')),
+                ('location', models.CharField(blank=True, max_length=255, verbose_name='重定向地址')),
+                ('body', models.TextField(blank=True, verbose_name='响应内容')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('expires_at', models.DateTimeField(verbose_name='过期时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '幂等键',
+                'verbose_name_plural': '幂等键',
+                'indexes': [models.Index(fields=['expires_at'], name='borrowing_i_expires_eb2653_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='uniq_idempotency_user_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0003_idempotency_key'),
+        ('library', '0007_stock_stripe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True, verbose_name='名称')),
+                ('last_event_id', models.BigIntegerField(default=0, verbose_name='已汇总事件 id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '汇总进度',
+                'verbose_name_plural': '汇总进度',
+            },
+        ),
+        migrations.CreateModel(
+            name='CirculationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('borrowed', '借出'), ('returned', '归还'), ('renewed', '续借'), ('overdue', '逾期'), ('fined', '罚款')], max_length=16, verbose_name='事件类型')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8, verbose_name='罚款变动金额')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='发生时间')),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.book', verbose_name='图书')),
+                ('record', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='borrowing.borrowrecord', verbose_name='借阅记录')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '流通事件',
+                'verbose_name_plural': '流通事件',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCirculationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('event_type', models.CharField(choices=[('borrowed', '借出'), ('returned', '归还'), ('renewed', '续借'), ('overdue', '逾期'), ('fined', '罚款')], max_length=16, verbose_name='事件类型')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='次数')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='金额')),
+            ],
+            options={
+                'verbose_name': '流通日汇总',
+                'verbose_name_plural': '流通日汇总',
+                'constraints': [models.UniqueConstraint(fields=('date', 'event_type'), name='uniq_daily_circulation_stat')],
+            },
+        ),
+    ]
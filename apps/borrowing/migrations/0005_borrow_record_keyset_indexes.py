@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0004_circulation_ledger'),
+        ('library', '0007_stock_stripe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='borrowrecord',
+            name='borrowing_b_borrowe_5d4793_idx',
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['borrowed_at', 'id'], name='borrowing_b_borrowe_55d703_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['status', 'borrowed_at', 'id'], name='borrowing_b_status_411727_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['user', 'borrowed_at', 'id'], name='borrowing_b_user_id_16fef3_idx'),
+        ),
+    ]
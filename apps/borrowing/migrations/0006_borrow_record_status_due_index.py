@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0005_borrow_record_keyset_indexes'),
+        ('library', '0007_stock_stripe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['status', 'due_at'], name='borrowing_b_status_aa29dd_idx'),
+        ),
+    ]
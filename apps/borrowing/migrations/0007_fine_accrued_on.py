@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0006_borrow_record_status_due_index'),
+        ('library', '0007_stock_stripe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowrecord',
+            name='fine_accrued_on',
+            field=models.DateField(blank=True, null=True, verbose_name='罚款累计至'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['status', 'fine_accrued_on'], name='borrowing_b_status_0c4870_idx'),
+        ),
+    ]
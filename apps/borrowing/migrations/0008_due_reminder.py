@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0007_fine_accrued_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_at', models.DateTimeField(verbose_name='提醒的应还时间')),
+                ('sent_at', models.DateTimeField(auto_now_add=True, verbose_name='发送时间')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='borrowing.borrowrecord', verbose_name='借阅记录')),
+            ],
+            options={
+                'verbose_name': '到期提醒',
+                'verbose_name_plural': '到期提醒',
+                'constraints': [models.UniqueConstraint(fields=('record', 'due_at'), name='uniq_due_reminder')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0008_due_reminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupcursor',
+            name='gaps',
+            field=models.JSONField(blank=True, default=dict, verbose_name='待补汇总的缺号'),
+        ),
+    ]
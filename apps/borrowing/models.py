@@ -33,17 +33,170 @@ class BorrowRecord(models.Model):
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="borrowed", db_index=True, verbose_name="状态")
     renew_count = models.PositiveIntegerField(default=0, verbose_name="续借次数")
     fine_amount = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'), verbose_name="罚款金额")
+    fine_accrued_on = models.DateField(null=True, blank=True, verbose_name="罚款累计至")
 
     class Meta:
         verbose_name = "借阅记录"
         verbose_name_plural = "借阅记录"
+        # (borrowed_at, id) 系列索引供借阅记录列表按游标分页：全部 / 按状态 / 按读者
         indexes = [
             models.Index(fields=["status"]),
-            models.Index(fields=["borrowed_at"]),
+            models.Index(fields=["borrowed_at", "id"]),
+            models.Index(fields=["status", "borrowed_at", "id"]),
+            models.Index(fields=["user", "borrowed_at", "id"]),
+            # 逾期标记按 status='borrowed' AND due_at < now 取待处理记录
+            models.Index(fields=["status", "due_at"]),
+            # 逐日计息按 status='overdue' AND fine_accrued_on < today 取待处理记录
+            models.Index(fields=["status", "fine_accrued_on"]),
         ]
 
     def __str__(self) -> str:
         return f"{self.user} - {self.book} ({self.status})"
 
 
+class Hold(models.Model):
+    """
+    预约排队：无可借副本时读者排队，副本归还后按先来后到分配给队首预约
+
+    队首查询按 (book, status, created_at, id) 联合索引定位，不随预约总数增长而扫描全表
+    """
+    STATUS_CHOICES = (
+        ("waiting", "排队中"),
+        ("ready", "待取书"),
+        ("fulfilled", "已借出"),
+        ("cancelled", "已取消"),
+        ("expired", "已过期"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="holds", verbose_name="用户")
+    book = models.ForeignKey(Book, on_delete=models.PROTECT, related_name="holds", verbose_name="图书")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="waiting", verbose_name="状态")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="预约时间")
+    ready_at = models.DateTimeField(null=True, blank=True, verbose_name="到书时间")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="取书截止时间")
+
+    class Meta:
+        verbose_name = "预约"
+        verbose_name_plural = "预约"
+        indexes = [
+            models.Index(fields=["book", "status", "created_at", "id"]),
+            models.Index(fields=["status", "expires_at"]),
+            models.Index(fields=["user", "status"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} - {self.book} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    幂等键：客户端为每次借还提交生成唯一键，网络重试时重放首次的响应，不重复办理
+
+    (user, key) 唯一，并发的重复提交在唯一索引上等待首个请求提交后直接重放；
+    过期的行由 purge_idempotency_keys 命令按 expires_at 索引分批清理
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys", verbose_name="用户")
+    key = models.CharField(max_length=64, verbose_name="幂等键")
+    endpoint = models.CharField(max_length=64, verbose_name="接口")
+    request_hash = models.CharField(max_length=64, verbose_name="请求摘要")
+    status_code = models.PositiveSmallIntegerField(verbose_name="响应状态码")
+    content_type = models.CharField(max_length=100, blank=True, verbose_name="响应类型")
+    location = models.CharField(max_length=255, blank=True, verbose_name="重定向地址")
+    body = models.TextField(blank=True, verbose_name="响应内容")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    expires_at = models.DateTimeField(verbose_name="过期时间")
+
+    class Meta:
+        verbose_name = "幂等键"
+        verbose_name_plural = "幂等键"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="uniq_idempotency_user_key"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id}:{self.key} ({self.endpoint})"
+
+
+class CirculationEvent(models.Model):
+    """
+    流通事件流水（只追加）：借出、归还、续借、逾期、罚款各记一行，与状态变更在同一事务中写入
+
+    借阅记录、读者、图书均不建外键约束：流水只追加不修改，删除读者或记录不影响已记录的事件。
+    统计由 rollups.consume 按自增 id 高水位增量汇总到 DailyCirculationStat，不回扫历史
+    """
+    EVENT_CHOICES = (
+        ("borrowed", "借出"),
+        ("returned", "归还"),
+        ("renewed", "续借"),
+        ("overdue", "逾期"),
+        ("fined", "罚款"),
+    )
+
+    event_type = models.CharField(max_length=16, choices=EVENT_CHOICES, verbose_name="事件类型")
+    record = models.ForeignKey(BorrowRecord, on_delete=models.DO_NOTHING, db_constraint=False, related_name="events", verbose_name="借阅记录")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="用户")
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="图书")
+    amount = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'), verbose_name="罚款变动金额")
+    occurred_at = models.DateTimeField(default=timezone.now, verbose_name="发生时间")
+
+    class Meta:
+        verbose_name = "流通事件"
+        verbose_name_plural = "流通事件"
+
+    def __str__(self) -> str:
+        return f"#{self.id} {self.event_type} 记录{self.record_id}"
+
+
+class DailyCirculationStat(models.Model):
+    """按日、按事件类型汇总的流通计数（本地日期），由流水增量累加"""
+    date = models.DateField(verbose_name="日期")
+    event_type = models.CharField(max_length=16, choices=CirculationEvent.EVENT_CHOICES, verbose_name="事件类型")
+    count = models.PositiveIntegerField(default=0, verbose_name="次数")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name="金额")
+
+    class Meta:
+        verbose_name = "流通日汇总"
+        verbose_name_plural = "流通日汇总"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "event_type"], name="uniq_daily_circulation_stat"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.date} {self.event_type}: {self.count}"
+
+
+class RollupCursor(models.Model):
+    """汇总进度：已汇总到的最大事件 id（高水位），以及高水位越过、尚未提交的缺号"""
+    name = models.CharField(max_length=32, unique=True, verbose_name="名称")
+    last_event_id = models.BigIntegerField(default=0, verbose_name="已汇总事件 id")
+    gaps = models.JSONField(default=dict, blank=True, verbose_name="待补汇总的缺号")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "汇总进度"
+        verbose_name_plural = "汇总进度"
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.last_event_id}"
+
+
+class DueReminder(models.Model):
+    """到期提醒发送记录：每条借阅记录的每个应还时间只提醒一次，续借后应还时间变化会再次提醒"""
+    record = models.ForeignKey(BorrowRecord, on_delete=models.CASCADE, related_name="reminders", verbose_name="借阅记录")
+    due_at = models.DateTimeField(verbose_name="提醒的应还时间")
+    sent_at = models.DateTimeField(auto_now_add=True, verbose_name="发送时间")
+
+    class Meta:
+        verbose_name = "到期提醒"
+        verbose_name_plural = "到期提醒"
+        constraints = [
+            models.UniqueConstraint(fields=["record", "due_at"], name="uniq_due_reminder"),
+        ]
+
+    def __str__(self) -> str:
+        return f"记录{self.record_id} @ {self.due_at}"
+
 # Create your models here.
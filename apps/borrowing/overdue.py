@@ -0,0 +1,283 @@
+"""
+逾期标记（集合操作）
+
+mark_overdue 逐条 save() 时，长假后数万条逾期记录就是数万条 UPDATE，且全部在一个长事务中持锁。
+这里按主键范围分块：
+- 每块先按 (status, due_at) 索引取出待标记记录的主键，锁定后一条 UPDATE 把状态置为 overdue，
+  罚款金额在 SQL 中由 due_at 与 FineRule.daily_fine 计算，再一条 INSERT 写入逾期/罚款流水
+- 每块一个小事务，中断后重新执行只处理剩余记录
+- 逾期天数与逐条计算一致：按 UTC 自然日之差（now.date() - due_at.date()），结果与逐条路径相同
+
+逐日计息（accrue）：已逾期记录的罚款随天数增长。每条记录在 fine_accrued_on 记下罚款累计到的日期，
+每天只重算 fine_accrued_on 早于今天的逾期记录，同样分块集合更新并写入罚款变动流水；
+同一天重复执行不做任何更新，代价与当天待计息的逾期记录数成正比，与已归还的历史记录无关。
+
+并行执行（workers > 1）：先切好全部主键范围，再交给进程池，每个进程使用自己的数据库连接逐块处理，
+父进程汇总各块的记录数与金额。各块互不重叠、使用同一个 now，结果与进程数无关。
+需要支持行级锁的数据库（MySQL/PostgreSQL），SQLite 为库级锁，命令会退回单进程。
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import django
+from django.apps import apps as django_apps
+from django.db import connections, transaction
+from django.db.models import DecimalField, ExpressionWrapper, Func, IntegerField, Q, Value
+
+from . import ledger
+from .models import BorrowRecord, FineRule
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class OverdueDays(Func):
+    """
+    截至 today（UTC 日期）的逾期自然日数，与 (now.date() - due_at.date()).days 一致
+
+    各数据库以 UTC 存储时间（USE_TZ=True），直接取存储值的日期部分相减
+    """
+    output_field = IntegerField()
+
+    def __init__(self, expression, today, **extra):
+        super().__init__(expression, **extra)
+        self.today = today
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL：timestamptz 先转换到 UTC 再取日期
+        field_sql, params = compiler.compile(self.source_expressions[0])
+        return f"(%s::date - ({field_sql} AT TIME ZONE 'UTC')::date)", [self.today.isoformat(), *params]
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        field_sql, params = compiler.compile(self.source_expressions[0])
+        return f'DATEDIFF(%s, {field_sql})', [self.today.isoformat(), *params]
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        field_sql, params = compiler.compile(self.source_expressions[0])
+        return f'CAST(julianday(%s) - julianday(date({field_sql})) AS INTEGER)', [self.today.isoformat(), *params]
+
+
+def fine_expression(now, daily_fine: Decimal):
+    """罚款金额 = 逾期天数 × 每日罚金（待标记记录 due_at < now，天数不为负）"""
+    return ExpressionWrapper(
+        OverdueDays('due_at', now.date()) * Value(daily_fine),
+        output_field=DecimalField(max_digits=8, decimal_places=2),
+    )
+
+
+def pending(now):
+    """待标记的记录：已过应还时间仍为借出状态（走 (status, due_at) 索引）"""
+    return BorrowRecord.objects.filter(status='borrowed', due_at__lt=now)
+
+
+def accrual_pending(today):
+    """
+    待计息的逾期记录：罚款只累计到 today 之前（或从未累计）的记录（走 (status, fine_accrued_on) 索引）
+
+    逾期天数只取决于当天日期，fine_accrued_on 等于 today 的记录当天不会再变化，无需重算
+    """
+    return BorrowRecord.objects.filter(status='overdue').filter(
+        Q(fine_accrued_on__lt=today) | Q(fine_accrued_on__isnull=True)
+    )
+
+
+def chunk_bounds(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    把待处理记录按主键切成每块至多 chunk_size 条的范围 (起始 id, 结束 id)，两端均包含
+
+    每次只取下一块的边界主键，不把全部主键读入内存；处理完的记录不再满足筛选条件
+    """
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
+
+
+def _update_range(queryset, first_id: int, last_id: int, now, rule: FineRule, status_event: Optional[str]):
+    """
+    在一个事务中重算主键范围内记录的罚款（并可同时置为逾期），写入流水
+
+    Returns:
+        (更新后的记录列表, 罚款变动合计)
+    """
+    with transaction.atomic():
+        locked = list(
+            queryset.select_for_update().filter(id__gte=first_id, id__lte=last_id)
+            .order_by('id').values_list('id', 'fine_amount')
+        )
+        if not locked:
+            return [], Decimal('0.00')
+        ids = [record_id for record_id, _ in locked]
+        updates = {'fine_amount': fine_expression(now, rule.daily_fine), 'fine_accrued_on': now.date()}
+        if status_event:
+            updates['status'] = status_event
+        BorrowRecord.objects.filter(id__in=ids).update(**updates)
+
+        previous = dict(locked)
+        records = list(BorrowRecord.objects.filter(id__in=ids).order_by('id').only('id', 'user', 'book', 'fine_amount'))
+        events = []
+        for record in records:
+            if status_event:
+                events.append(ledger.build(status_event, record, now))
+            events.extend(ledger.fine_changed(record, previous[record.id], now))
+        ledger.write(events)
+    delta = sum((record.fine_amount - previous[record.id] for record in records), Decimal('0.00'))
+    return records, delta
+
+
+def mark_range(first_id: int, last_id: int, now, rule: FineRule) -> Tuple[int, Decimal]:
+    """
+    在一个事务中标记主键范围内的逾期记录并计算罚款，写入逾期与罚款流水
+
+    Returns:
+        (标记的记录数, 罚款合计)
+    """
+    records, _ = _update_range(pending(now), first_id, last_id, now, rule, 'overdue')
+    return len(records), sum((record.fine_amount for record in records), Decimal('0.00'))
+
+
+def mark_ids(ids: List[int], now, rule: FineRule) -> Tuple[int, Decimal]:
+    """
+    标记指定记录中仍待标记（借出状态且 due_at < now）的记录，供到期调度器按应还时间逐批调用；
+    已归还或已续借到 now 之后的记录不受影响
+
+    Returns:
+        (标记的记录数, 罚款合计)
+    """
+    if not ids:
+        return 0, Decimal('0.00')
+    records, _ = _update_range(pending(now).filter(id__in=ids), min(ids), max(ids), now, rule, 'overdue')
+    return len(records), sum((record.fine_amount for record in records), Decimal('0.00'))
+
+
+def mark(now, rule: FineRule, chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None, workers: int = 1) -> Tuple[int, Decimal]:
+    """
+    分块标记全部逾期记录
+
+    Args:
+        progress: 可选回调 progress(已完成块数, 总块数, 已标记数, 罚款合计)，每块提交后调用
+        workers: 并行进程数，1 表示在当前进程中顺序执行
+
+    Returns:
+        (标记的记录数, 罚款合计)
+    """
+    return run(TASK_MARK, now, rule, chunk_size, progress, workers)
+
+
+def accrue_range(first_id: int, last_id: int, now, rule: FineRule) -> Tuple[int, Decimal]:
+    """
+    在一个事务中把主键范围内待计息记录的罚款累计到今天
+
+    Returns:
+        (更新的记录数, 新增罚款合计)
+    """
+    records, delta = _update_range(accrual_pending(now.date()), first_id, last_id, now, rule, None)
+    return len(records), delta
+
+
+def accrue(now, rule: FineRule, chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None, workers: int = 1) -> Tuple[int, Decimal]:
+    """
+    逐日计息：只重算今天尚未累计的逾期记录，同一天重复执行不再更新；中断后重新执行只处理剩余记录
+
+    参数同 mark()
+
+    Returns:
+        (更新的记录数, 新增罚款合计)
+    """
+    return run(TASK_ACCRUE, now, rule, chunk_size, progress, workers)
+
+
+TASK_MARK = 'mark'
+TASK_ACCRUE = 'accrue'
+
+
+def _accrual_pending_at(now):
+    return accrual_pending(now.date())
+
+
+# 任务名 -> (待处理记录查询, 单块处理函数)；子进程只接收任务名，便于序列化
+_TASKS = {
+    TASK_MARK: (pending, mark_range),
+    TASK_ACCRUE: (_accrual_pending_at, accrue_range),
+}
+
+
+def _init_worker() -> None:
+    """子进程初始化：spawn 方式启动时需要重新加载 Django；数据库连接在首次查询时各自建立"""
+    if not django_apps.ready:
+        django.setup()
+
+
+def _run_range(task: str, first_id: int, last_id: int, now, rule: FineRule) -> Tuple[int, Decimal]:
+    try:
+        return _TASKS[task][1](first_id, last_id, now, rule)
+    finally:
+        connections.close_all()
+
+
+def _pool_context():
+    # fork 继承已加载的配置（含测试数据库名），不支持时退回 spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+
+def effective_workers(workers: int, warn: Optional[Callable[[str], None]] = None) -> int:
+    """SQLite 为库级锁，多个写进程只会互相等待（延迟事务升级写锁时直接报 database is locked），退回单进程"""
+    if workers > 1 and connections['default'].vendor == 'sqlite':
+        if warn is not None:
+            warn('SQLite 不支持多进程并发写入，--workers 按 1 执行')
+        return 1
+    return workers
+
+
+def progress_printer(write: Callable[[str], None], label: str = '已标记') -> Callable:
+    """命令行进度输出：总块数已知时约每 5% 输出一次，否则每 10 块输出一次"""
+    def report(done, total_chunks, count, amount):
+        step = max(1, total_chunks // 20) if total_chunks else 10
+        if done % step == 0 or done == total_chunks:
+            of = f'/{total_chunks}' if total_chunks else ''
+            write(f'  进度 {done}{of} 块，{label} {count} 条，金额 {amount} 元')
+    return report
+
+
+def run(task: str, now, rule: FineRule, chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Optional[Callable] = None, workers: int = 1) -> Tuple[int, Decimal]:
+    """
+    按主键范围分块执行 mark 或 accrue，workers > 1 时多进程并行
+
+    Returns:
+        (处理的记录数, 金额合计)
+    """
+    queryset_for, run_range = _TASKS[task]
+    count, total = 0, Decimal('0.00')
+    if workers <= 1:
+        done = 0
+        for first_id, last_id in chunk_bounds(queryset_for(now), chunk_size):
+            processed, amount = run_range(first_id, last_id, now, rule)
+            count += processed
+            total += amount
+            done += 1
+            if progress is not None:
+                progress(done, None, count, total)
+        return count, total
+
+    ranges: List[Tuple[int, int]] = list(chunk_bounds(queryset_for(now), chunk_size))
+    if not ranges:
+        return count, total
+    # 子进程不能共用父进程的数据库连接（fork 后共享同一套接字），先关闭，各进程自行连接
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=_pool_context(),
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(_run_range, task, first_id, last_id, now, rule) for first_id, last_id in ranges]
+        for done, future in enumerate(as_completed(futures), start=1):
+            processed, amount = future.result()
+            count += processed
+            total += amount
+            if progress is not None:
+                progress(done, len(ranges), count, total)
+    return count, total
@@ -0,0 +1,122 @@
+"""
+到期提醒
+
+逾期管理页能列出 3 天内到期的记录，但读者收不到通知，到期后集中变成逾期。本模块按读者汇总提醒邮件：
+- 以 iterator() 流式读取即将到期、尚未提醒的借出记录（按读者排序），不把全部记录读入内存
+- 同一读者的多本图书合并为一封摘要邮件，每 batch_size 封复用同一个邮件连接逐封发送
+- 只为后端确认发送成功的邮件写入 DueReminder（唯一约束 (record, due_at)），发送失败的下次重试；
+  中途抛出异常时已发送的部分照样记录。重复执行只发送新增的提醒，
+  续借改变应还时间后会按新的应还时间再提醒一次
+- 先发送后记录：记录失败时下次可能重复提醒，但不会漏发
+- 记录已结束（归还或转为逾期）的提醒不再需要，由 purge_due_reminders 命令定期分批清理
+
+邮件经 Django 邮件后端发送，console/locmem 后端可用于开发与测试
+"""
+from datetime import timedelta
+from itertools import groupby
+from typing import Iterable, Iterator, List, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import BorrowRecord, DueReminder
+
+
+DEFAULT_DAYS = 3
+DEFAULT_BATCH_SIZE = 100
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def get_days() -> int:
+    """提前多少天提醒"""
+    return getattr(settings, 'BORROW_REMINDER_DAYS', DEFAULT_DAYS)
+
+
+def due_soon(now, days: int = None):
+    """应还时间在 (now, now + days] 内的借出记录（走 (status, due_at) 索引）"""
+    return BorrowRecord.objects.filter(
+        status='borrowed', due_at__gt=now, due_at__lte=now + timedelta(days=days or get_days()),
+    )
+
+
+def pending(now, days: int = None):
+    """即将到期、有邮箱且当前应还时间尚未提醒的记录，按读者、应还时间排序"""
+    reminded = DueReminder.objects.filter(record=OuterRef('pk'), due_at=OuterRef('due_at'))
+    return (
+        due_soon(now, days).exclude(user__email='').filter(~Exists(reminded))
+        .select_related('user', 'book')
+        .only('id', 'due_at', 'user__username', 'user__email', 'book__title')
+        .order_by('user_id', 'due_at', 'id')
+    )
+
+
+def digests(records: Iterable[BorrowRecord]) -> Iterator[Tuple[object, List[BorrowRecord]]]:
+    """把按读者排序的记录流合并为 (读者, 记录列表)"""
+    for _, group in groupby(records, key=lambda record: record.user_id):
+        group = list(group)
+        yield group[0].user, group
+
+
+def build_message(user, records: List[BorrowRecord], connection=None) -> EmailMessage:
+    lines = [f'{user.username}，您好：', '', '以下借阅的图书即将到期，请按时归还或办理续借：', '']
+    for record in records:
+        lines.append(f'  - 《{record.book.title}》 应还时间 {timezone.localtime(record.due_at):%Y-%m-%d %H:%M}')
+    lines += ['', '逾期未还将按日计收罚款。', '校园图书馆']
+    return EmailMessage(
+        subject=f'图书即将到期提醒（{len(records)} 本）', body='\n'.join(lines),
+        to=[user.email], connection=connection,
+    )
+
+
+def _flush(connection, batch: List[Tuple[EmailMessage, List[BorrowRecord]]]) -> Tuple[int, int]:
+    """逐封发送（复用同一连接），只记录发送成功的邮件对应的借阅记录"""
+    sent: List[List[BorrowRecord]] = []
+    reminders: List[DueReminder] = []
+    try:
+        for message, records in batch:
+            # send_messages 返回发送成功的封数，fail_silently 的后端失败时返回 0
+            if connection.send_messages([message]):
+                sent.append(records)
+    finally:
+        reminders = [DueReminder(record_id=record.id, due_at=record.due_at) for records in sent for record in records]
+        if reminders:
+            # 并发执行的另一进程已记录时忽略
+            DueReminder.objects.bulk_create(reminders, ignore_conflicts=True)
+    return len(sent), len(reminders)
+
+
+def purge_closed(batch_size: int = 1000) -> int:
+    """分批删除借阅记录已不在借出状态的提醒（不会再被提醒），返回删除行数"""
+    deleted = 0
+    while True:
+        ids = list(
+            DueReminder.objects.exclude(record__status='borrowed').order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += DueReminder.objects.filter(id__in=ids).delete()[0]
+
+
+def send(now, days: int = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    发送到期提醒
+
+    Args:
+        days: 提前天数，默认 BORROW_REMINDER_DAYS
+        batch_size: 每批通过同一连接发送的邮件数
+
+    Returns:
+        (发送的邮件数, 提醒的记录数)
+    """
+    sent = reminded = 0
+    batch = []
+    with get_connection() as connection:
+        for user, records in digests(pending(now, days).iterator(chunk_size=ITERATOR_CHUNK_SIZE)):
+            batch.append((build_message(user, records, connection), records))
+            if len(batch) >= batch_size:
+                messages, count = _flush(connection, batch)
+                sent, reminded, batch = sent + messages, reminded + count, []
+        messages, count = _flush(connection, batch)
+    return sent + messages, reminded + count
@@ -0,0 +1,219 @@
+"""
+流通统计增量汇总
+
+按高水位消费流通事件流水（CirculationEvent），累加到按日、按事件类型的汇总行（DailyCirculationStat）：
+- 进度记在 RollupCursor.last_event_id，每批在一个事务中锁定进度行、读取 id 更大的事件、
+  按本地日期与事件类型累加并推进高水位；并发的汇总进程在进度行上排队，不会重复累加
+- 每次只读取新增事件，统计接口的代价与新增事件数成正比，与历史总量无关
+- 自增 id 按分配顺序而非提交顺序可见（例如归还先写流水、再等待图书行锁，提交可能晚于较大 id）：
+  高水位越过的缺号记入 RollupCursor.gaps（id -> 首次发现时间），此后每批先补汇总已提交的缺号；
+  超过 BORROW_ROLLUP_GAP_TIMEOUT 秒仍未出现的缺号视为已回滚（自增 id 回滚后不复用）并放弃
+- 统计接口读取前以 skip_locked 方式顺带汇总一小批：进度行被汇总命令持有时直接跳过，不排队
+- rebuild() 清空汇总并从头重放流水，用于核对或修正
+- discard() 删除压测等临时数据产生的事件，已汇总的日期按剩余流水重算
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import CirculationEvent, DailyCirculationStat, RollupCursor
+
+
+CURSOR_NAME = 'daily'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_GAP_TIMEOUT = 600
+# 最多跟踪的缺号数，超出时放弃最早发现的（批量插入回滚等造成的大段缺号）
+MAX_GAPS = 10000
+
+
+def get_gap_timeout() -> int:
+    """缺号最多等待多少秒（等待较小 id 的事务提交），超时视为已回滚"""
+    return getattr(settings, 'BORROW_ROLLUP_GAP_TIMEOUT', DEFAULT_GAP_TIMEOUT)
+
+
+def _lock_cursor(skip_locked: bool = False) -> Optional[RollupCursor]:
+    """锁定进度行；skip_locked 时进度行被其他汇总持有则返回 None"""
+    RollupCursor.objects.get_or_create(name=CURSOR_NAME)
+    return RollupCursor.objects.select_for_update(skip_locked=skip_locked).filter(name=CURSOR_NAME).first()
+
+
+def _add(day: date, event_type: str, count: int, amount: Decimal) -> None:
+    updated = DailyCirculationStat.objects.filter(date=day, event_type=event_type).update(
+        count=F('count') + count, amount=F('amount') + amount,
+    )
+    if not updated:
+        # 持有进度行锁，不会有其他汇总进程并发创建同一行
+        DailyCirculationStat.objects.create(date=day, event_type=event_type, count=count, amount=amount)
+
+
+def _consume_batch(batch_size: int, now, skip_locked: bool = False) -> Tuple[int, bool]:
+    """汇总一批事件（含已补提交的缺号），返回 (汇总的事件数, 是否还有可汇总的事件)"""
+    with transaction.atomic():
+        cursor = _lock_cursor(skip_locked)
+        if cursor is None:
+            return 0, False
+        gaps = dict(cursor.gaps)
+        events = []
+        if gaps:
+            events = list(
+                CirculationEvent.objects.filter(id__in=[int(event_id) for event_id in gaps])
+                .values_list('id', 'event_type', 'amount', 'occurred_at')
+            )
+            for event_id, *_ in events:
+                del gaps[str(event_id)]
+            expired_before = now.timestamp() - get_gap_timeout()
+            gaps = {event_id: seen for event_id, seen in gaps.items() if seen >= expired_before}
+
+        new_events = list(
+            CirculationEvent.objects.filter(id__gt=cursor.last_event_id).order_by('id')
+            .values_list('id', 'event_type', 'amount', 'occurred_at')[:batch_size]
+        )
+        expected = cursor.last_event_id + 1
+        in_flight_after = now - timezone.timedelta(seconds=get_gap_timeout())
+        for event_id, _, _, occurred_at in new_events:
+            # 高水位越过的 id 可能属于尚未提交的事务，记为缺号留待后续批次补汇总；
+            # 其后的事件早于等待时限时（重建、补录的历史流水），缺号不可能仍在提交中
+            if occurred_at >= in_flight_after:
+                for missing in islice(range(expected, event_id), MAX_GAPS):
+                    gaps[str(missing)] = now.timestamp()
+            expected = event_id + 1
+        if new_events:
+            cursor.last_event_id = new_events[-1][0]
+        if len(gaps) > MAX_GAPS:
+            gaps = dict(sorted(gaps.items(), key=lambda item: int(item[0]))[-MAX_GAPS:])
+        events.extend(new_events)
+
+        buckets: Dict[Tuple[date, str], list] = defaultdict(lambda: [0, Decimal('0.00')])
+        for event_id, event_type, amount, occurred_at in events:
+            bucket = buckets[(timezone.localdate(occurred_at), event_type)]
+            bucket[0] += 1
+            bucket[1] += amount
+        if not events and gaps == cursor.gaps:
+            return 0, False
+        for (day, event_type), (count, amount) in sorted(buckets.items()):
+            _add(day, event_type, count, amount)
+        cursor.gaps = gaps
+        cursor.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+    return len(events), len(new_events) == batch_size
+
+
+def consume(batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None,
+            now=None, skip_locked: bool = False) -> int:
+    """
+    汇总高水位之后的新事件，以及此前越过、现已提交的缺号事件
+
+    Args:
+        batch_size: 每个事务汇总的新事件数
+        max_batches: 最多汇总的批数，None 表示直到没有可汇总的事件
+        now: 当前时间（测试用），用于记录与淘汰缺号
+        skip_locked: 进度行被其他汇总持有时直接返回 0（读路径顺带汇总时使用，不排队等锁）
+
+    Returns:
+        汇总的事件数
+    """
+    now = now or timezone.now()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        consumed, more = _consume_batch(batch_size, now, skip_locked)
+        total += consumed
+        batches += 1
+        if not more:
+            break
+    return total
+
+
+def pending() -> int:
+    """尚未汇总的事件数（高水位之后的事件与已提交的缺号）"""
+    cursor = RollupCursor.objects.filter(name=CURSOR_NAME).first()
+    if cursor is None:
+        return CirculationEvent.objects.count()
+    gap_ids = [int(event_id) for event_id in cursor.gaps]
+    return CirculationEvent.objects.filter(Q(id__gt=cursor.last_event_id) | Q(id__in=gap_ids)).count()
+
+
+def _recompute_day(day: date, cursor: RollupCursor) -> None:
+    """按已汇总范围内（高水位以内、不含缺号）的流水重算某一天的汇总行"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    rows = (
+        CirculationEvent.objects.filter(
+            id__lte=cursor.last_event_id, occurred_at__gte=start, occurred_at__lt=start + timedelta(days=1),
+        )
+        .exclude(id__in=[int(event_id) for event_id in cursor.gaps])
+        .values('event_type')
+        .annotate(count=Count('id'), amount=Sum('amount'))
+        .order_by()
+    )
+    DailyCirculationStat.objects.filter(date=day).delete()
+    DailyCirculationStat.objects.bulk_create([
+        DailyCirculationStat(date=day, event_type=row['event_type'], count=row['count'], amount=row['amount'])
+        for row in rows
+    ])
+
+
+def discard(events) -> int:
+    """
+    删除一批事件（压测等临时数据），其中已汇总的事件所在日期按剩余流水重算
+
+    Args:
+        events: CirculationEvent 查询集
+
+    Returns:
+        删除的事件数
+    """
+    with transaction.atomic():
+        cursor = _lock_cursor()
+        rows = list(events.values_list('id', 'occurred_at'))
+        if not rows:
+            return 0
+        rolled_up = {
+            timezone.localdate(occurred_at) for event_id, occurred_at in rows
+            if event_id <= cursor.last_event_id and str(event_id) not in cursor.gaps
+        }
+        ids = {event_id for event_id, _ in rows}
+        CirculationEvent.objects.filter(id__in=ids).delete()
+        gaps = {event_id: seen for event_id, seen in cursor.gaps.items() if int(event_id) not in ids}
+        if gaps != cursor.gaps:
+            cursor.gaps = gaps
+            cursor.save(update_fields=['gaps', 'updated_at'])
+        for day in sorted(rolled_up):
+            _recompute_day(day, cursor)
+    return len(rows)
+
+
+def rebuild(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """清空汇总并从头重放全部流水，返回汇总的事件数"""
+    with transaction.atomic():
+        cursor = _lock_cursor()
+        DailyCirculationStat.objects.all().delete()
+        cursor.last_event_id = 0
+        cursor.gaps = {}
+        cursor.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+    return consume(batch_size)
+
+
+def daily(start: date, end: Optional[date] = None) -> Dict[date, Dict[str, Tuple[int, Decimal]]]:
+    """日期范围内（含两端）的汇总 {日期: {事件类型: (次数, 金额)}}"""
+    rows = DailyCirculationStat.objects.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    result: Dict[date, Dict[str, Tuple[int, Decimal]]] = defaultdict(dict)
+    for day, event_type, count, amount in rows.values_list('date', 'event_type', 'count', 'amount'):
+        result[day][event_type] = (count, amount)
+    return result
+
+
+def total(event_type: str, start: Optional[date] = None) -> Tuple[int, Decimal]:
+    """某类事件自 start（含）以来的 (次数, 金额)，start 为 None 表示全部"""
+    rows = DailyCirculationStat.objects.filter(event_type=event_type)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    totals = rows.aggregate(count=Sum('count'), amount=Sum('amount'))
+    return totals['count'] or 0, totals['amount'] or Decimal('0.00')
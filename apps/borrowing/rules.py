@@ -0,0 +1,67 @@
+"""
+罚款规则缓存模块
+
+FineRule 一年只改动一两次，却在每次借还、演示页、逾期页和 mark_overdue 中读取。
+本模块在进程内缓存规则对象，并用共享缓存中的版本号做跨进程失效：
+- 每次读取只比较共享版本号（缓存读取），版本未变时不访问数据库
+- FineRule 保存/删除（fine_rule_api 的 PUT、后台修改）后在事务提交时递增版本号，
+  各工作进程下次读取时发现版本变化即重新加载
+- 返回的是缓存对象的副本，调用方修改后保存不会污染缓存
+- 本地副本最多使用 LOCAL_TTL 秒：默认的 LocMemCache 按进程隔离，版本号无法跨进程传播，
+  此时其他进程的修改最多 LOCAL_TTL 秒后生效；配置共享缓存（见 settings.CACHES）后立即生效
+"""
+import copy
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import FineRule
+
+
+VERSION_KEY = 'borrowing:fine_rule:version'
+LOCAL_TTL = 60
+
+_lock = threading.Lock()
+_cached = {'version': None, 'rule': None, 'loaded_at': 0.0}
+
+
+def _current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 共享缓存被清空或淘汰时以当前毫秒时间戳重新初始化，保证与各进程的本地版本不同
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_rule() -> FineRule:
+    """获取当前罚款规则（不存在时创建默认规则）"""
+    version = _current_version()
+    with _lock:
+        expired = time.monotonic() - _cached['loaded_at'] >= LOCAL_TTL
+        if _cached['rule'] is None or _cached['version'] != version or expired:
+            rule = FineRule.objects.first()
+            if rule is None:
+                rule = FineRule.objects.create()
+            _cached['rule'] = rule
+            _cached['version'] = version
+            _cached['loaded_at'] = time.monotonic()
+        return copy.copy(_cached['rule'])
+
+
+def invalidate() -> None:
+    """递增共享版本号并清除本进程缓存"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), timeout=None)
+    with _lock:
+        _cached['rule'] = None
+        _cached['version'] = None
+
+
+def invalidate_on_commit() -> None:
+    """规则修改提交后再失效，避免其他进程在提交前重新加载到旧规则"""
+    transaction.on_commit(invalidate)
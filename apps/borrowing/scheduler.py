@@ -0,0 +1,87 @@
+"""
+到期调度（按应还时间标记逾期）
+
+每日一次的 mark_overdue 扫描下，记录过了 due_at 最多要等 24 小时才变为逾期，且全部标记集中在一次扫描中。
+DueScheduler 常驻运行，到期即标记：
+- 按 (status, due_at) 索引读取应还时间在 lookahead 秒内、最早到期的一批借出记录（至多 batch_size 条），
+  以 (due_at, id) 放入小顶堆
+- 堆顶到期即出堆，同一时刻到期的一批交给 overdue.mark_ids 集合更新并写入流水；
+  更新条件仍为“借出状态且 due_at < now”，堆中已归还或已续借的旧条目不会被误标
+- 每隔 refresh 秒重新装载，新借出、续借改变的应还时间与归还都体现在新的一批中；
+  堆取空而上一批已满（积压）时立即装载下一批
+- 两次装载之间睡眠到堆顶到期为止，标记延迟约为应还时间之后的一次唤醒，
+  装载之后才借出且在下次装载前到期的记录最多延迟 refresh 秒
+"""
+import heapq
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from . import overdue, rules
+from .models import BorrowRecord
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_LOOKAHEAD = 3600
+DEFAULT_REFRESH = 60
+
+
+class DueScheduler:
+    """按应还时间排序的待标记队列"""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, lookahead: float = DEFAULT_LOOKAHEAD,
+                 refresh: float = DEFAULT_REFRESH):
+        self.batch_size = batch_size
+        self.lookahead = timedelta(seconds=lookahead)
+        self.refresh = timedelta(seconds=refresh)
+        self.heap: List[Tuple[datetime, int]] = []
+        self.loaded_at: Optional[datetime] = None
+        self.full = False
+
+    def load(self, now) -> int:
+        """重新装载 lookahead 内最早到期的一批借出记录，返回装载数"""
+        self.heap = list(
+            BorrowRecord.objects.filter(status='borrowed', due_at__lt=now + self.lookahead)
+            .order_by('due_at', 'id').values_list('due_at', 'id')[:self.batch_size]
+        )
+        heapq.heapify(self.heap)
+        self.full = len(self.heap) == self.batch_size
+        self.loaded_at = now
+        return len(self.heap)
+
+    def needs_load(self, now) -> bool:
+        if self.loaded_at is None or now >= self.loaded_at + self.refresh:
+            return True
+        return not self.heap and self.full
+
+    def pop_due(self, now) -> List[int]:
+        """弹出应还时间早于 now 的记录 id"""
+        ids = []
+        while self.heap and self.heap[0][0] < now:
+            ids.append(heapq.heappop(self.heap)[1])
+        return ids
+
+    def tick(self, now) -> Tuple[int, Decimal]:
+        """
+        按需装载并标记应还时间早于 now 的记录
+
+        Returns:
+            (标记的记录数, 罚款合计)
+        """
+        count, total = 0, Decimal('0.00')
+        while True:
+            if self.needs_load(now):
+                self.load(now)
+            ids = self.pop_due(now)
+            if not ids:
+                return count, total
+            marked, amount = overdue.mark_ids(ids, now, rules.get_rule())
+            count += marked
+            total += amount
+
+    def seconds_until_next(self, now) -> float:
+        """距下一次需要处理（堆顶到期或重新装载）的秒数"""
+        wake = self.loaded_at + self.refresh if self.loaded_at else now
+        if self.heap:
+            wake = min(wake, self.heap[0][0])
+        return max(0.0, (wake - now).total_seconds())
@@ -0,0 +1,16 @@
+"""
+借阅相关信号处理
+
+- FineRule 保存/删除后使罚款规则缓存失效（各工作进程通过共享版本号感知）
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import rules
+from .models import FineRule
+
+
+@receiver(post_save, sender=FineRule, dispatch_uid='borrowing_fine_rule_cache')
+@receiver(post_delete, sender=FineRule, dispatch_uid='borrowing_fine_rule_cache_delete')
+def invalidate_fine_rule_cache(sender, **kwargs):
+    rules.invalidate_on_commit()
@@ -1,3 +1,1239 @@
-from django.test import TestCase
+"""
+借阅模块测试
+"""
+import re
+import time
+from datetime import timedelta
+from unittest import skipIf, skipUnless
+from io import StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.library import availability, facets, stripes
+from apps.library.models import Book, CategorySummary
+from . import circulation, holds, idempotency, ledger, overdue, reminders, rollups, rules, scheduler, views
+from .models import (
+    BorrowRecord, CirculationEvent, DailyCirculationStat, DueReminder, FineRule, Hold, IdempotencyKey, RollupCursor,
+)
+from .views import _get_rule
+
+
+def mock_now(now):
+    """固定 timezone.now()，保证两次执行使用相同的当前时间"""
+    from unittest import mock
+    return mock.patch('django.utils.timezone.now', return_value=now)
+
+
+def make_book(isbn='978-7-111-12345-3', **kwargs):
+    """创建测试图书"""
+    defaults = {
+        'title': 'Python编程',
+        'author': 'Eric Matthes',
+        'publisher': '人民邮电出版社',
+        'category': '计算机',
+        'total_copies': 3,
+        'available_copies': 3,
+    }
+    defaults.update(kwargs)
+    return Book.objects.create(isbn=isbn, **defaults)
+
+
+class CirculationAvailabilityTests(TestCase):
+    """借还后可借数量缓存同步测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.admin = User.objects.create_user(username='admin1', password='testpass123', role='admin')
+        self.client.force_login(self.user)
+        availability.get(self.book.id)
+
+    def test_borrow_and_return(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.assertEqual(availability.get(self.book.id), 2)
+
+        record = BorrowRecord.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/return/', {'record_id': record.id})
+        self.assertEqual(availability.get(self.book.id), 3)
+
+    def test_failed_borrow_keeps_overlay(self):
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        availability.invalidate([self.book.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.assertEqual(availability.get(self.book.id), 0)
+        self.assertFalse(BorrowRecord.objects.exists())
+
+    def test_return_overdue(self):
+        record = BorrowRecord.objects.create(
+            user=self.user, book=self.book, status='overdue', due_at=timezone.now() - timedelta(days=3),
+        )
+        Book.objects.filter(pk=self.book.pk).update(available_copies=2)
+        availability.invalidate([self.book.id])
+        availability.get(self.book.id)
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/overdue/return/', {'record_id': record.id})
+        self.assertEqual(availability.get(self.book.id), 3)
+
+
+class CirculationApiTests(TestCase):
+    """批量借还接口测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.python = make_book()
+        self.dl = make_book(isbn='978-7-115-46147-6', title='深度学习', category='人工智能',
+                            total_copies=1, available_copies=1)
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(self.user)
+
+    def _post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_multi_item_checkout(self):
+        """一次借多本：库存不足/不存在的条目单独报错，其余成功"""
+        facets.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post('/borrowing/api/borrow', {
+                'isbns': [self.dl.isbn, self.python.isbn, self.dl.isbn, '978-0-000-00000-0'],
+                'loan_days': 14,
+            })
+        data = response.json()
+        self.assertEqual((data['succeeded'], data['failed']), (2, 2))
+        codes = [item.get('error', {}).get('code') for item in data['results']]
+        self.assertEqual(codes, [None, None, 'NO_STOCK', 'BOOK_NOT_FOUND'])
+        self.assertEqual(
+            set(BorrowRecord.objects.values_list('id', flat=True)),
+            {item['record_id'] for item in data['results'] if item['ok']},
+        )
+        self.python.refresh_from_db()
+        self.dl.refresh_from_db()
+        self.assertEqual((self.python.available_copies, self.dl.available_copies), (2, 0))
+        self.assertEqual(availability.get(self.python.id), 2)
+
+        from apps.library.models import CategorySummary
+        summary = CategorySummary.objects.get(category='人工智能')
+        self.assertEqual(summary.available_copies, 0)
+
+    def test_checkout_statement_count(self):
+        """加锁、插入、库存更新均为批量语句，不随条目数增长"""
+        rule = _get_rule()
+        # 解析 id、加锁、待取书预约、插入、流水、库存更新各一条（另含事务保存点 2 条）
+        with self.assertNumQueries(8):
+            circulation.checkout(self.user, [self.python.isbn] * 3 + [self.dl.isbn], rule)
+        self.assertEqual(BorrowRecord.objects.count(), 4)
+
+    def test_checkout_without_returning_ids(self):
+        """数据库不回传自增 id（MySQL）时按借出时间取回记录 id"""
+        from unittest import mock
+
+        from django.db import connection
+
+        # SQLite 后端中该特性是只读 property，需在类上替换
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            results = circulation.checkout(self.user, [self.python.isbn, self.dl.isbn, self.python.isbn], _get_rule())
+        records = {record.id: record.book_id for record in BorrowRecord.objects.all()}
+        self.assertEqual([records[item['record_id']] for item in results], [self.python.id, self.dl.id, self.python.id])
+
+    def test_return_and_renew(self):
+        records = [
+            BorrowRecord.objects.create(user=self.user, book=self.python, due_at=timezone.now() + timedelta(days=5)),
+            BorrowRecord.objects.create(user=self.user, book=self.python, due_at=timezone.now() - timedelta(days=2),
+                                        status='overdue'),
+        ]
+        Book.objects.filter(pk=self.python.pk).update(available_copies=1)
+        other = User.objects.create_user(username='other', password='testpass123')
+        foreign = BorrowRecord.objects.create(user=other, book=self.dl, due_at=timezone.now() + timedelta(days=5))
+
+        data = self._post('/borrowing/api/renew', {'record_ids': [records[0].id, records[1].id, foreign.id]}).json()
+        codes = [item.get('error', {}).get('code') for item in data['results']]
+        self.assertEqual(codes, [None, 'RECORD_NOT_FOUND', 'RECORD_NOT_FOUND'])
+        self.assertEqual(data['results'][0]['renew_count'], 1)
+        data = self._post('/borrowing/api/renew', {'record_id': records[0].id}).json()
+        self.assertEqual(data['results'][0]['error']['code'], 'RENEW_LIMIT_REACHED')
+
+        data = self._post('/borrowing/api/return', {'record_ids': [r.id for r in records] + [foreign.id]}).json()
+        self.assertEqual((data['succeeded'], data['failed']), (2, 1))
+        self.assertEqual(data['results'][1]['fine_amount'], '1.00')
+        self.python.refresh_from_db()
+        self.assertEqual(self.python.available_copies, 3)
+        self.assertEqual(BorrowRecord.objects.filter(status='returned').count(), 2)
+
+    def test_librarian_acts_for_patron(self):
+        librarian = User.objects.create_user(username='librarian', password='testpass123', role='librarian')
+        response = self._post('/borrowing/api/borrow', {'isbn': self.python.isbn, 'user_id': librarian.id})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(librarian)
+        data = self._post('/borrowing/api/borrow', {'isbn': self.python.isbn, 'user_id': self.user.id}).json()
+        record = BorrowRecord.objects.get(pk=data['results'][0]['record_id'])
+        self.assertEqual(record.user, self.user)
+        data = self._post('/borrowing/api/return', {'record_ids': [record.id]}).json()
+        self.assertEqual(data['succeeded'], 1)
+
+    def test_validation(self):
+        self.assertEqual(self._post('/borrowing/api/borrow', {'isbns': []}).status_code, 400)
+        self.assertEqual(self._post('/borrowing/api/borrow', {'isbns': ['x'] * 21}).status_code, 400)
+        self.assertEqual(self._post('/borrowing/api/borrow', {'isbn': 'x', 'loan_days': 90}).status_code, 400)
+        self.assertEqual(self._post('/borrowing/api/return', {'record_ids': ['abc']}).status_code, 400)
+        response = self.client.post('/borrowing/api/return', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FineRuleCacheTests(TestCase):
+    """罚款规则缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin1', password='testpass123', role='admin')
+
+    def test_cached_rule_skips_database(self):
+        """版本号未变时不再查询数据库"""
+        rule = rules.get_rule()
+        with self.assertNumQueries(0):
+            cached = rules.get_rule()
+        self.assertEqual(cached.pk, rule.pk)
+
+    def test_returned_rule_is_a_copy(self):
+        """调用方修改返回对象不影响缓存"""
+        rule = rules.get_rule()
+        rule.daily_fine = Decimal('9.99')
+        self.assertNotEqual(rules.get_rule().daily_fine, Decimal('9.99'))
+
+    def test_api_update_invalidates(self):
+        """fine_rule_api 修改规则提交后，读取到新规则"""
+        rules.get_rule()
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/borrowing/api/rule', {'daily_fine': 1.5},
+                                       content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(rules.get_rule().daily_fine, Decimal('1.50'))
+
+    def test_other_process_sees_version_bump(self):
+        """其他进程（模拟为直接改库并递增共享版本号）修改规则后，本进程重新加载"""
+        rule = rules.get_rule()
+        FineRule.objects.filter(pk=rule.pk).update(max_renewals=5)
+        self.assertEqual(rules.get_rule().max_renewals, rule.max_renewals)
+        cache.incr(rules.VERSION_KEY)
+        self.assertEqual(rules.get_rule().max_renewals, 5)
+
+    def test_local_copy_expires(self):
+        """进程隔离的缓存收不到其他进程的版本号：本地副本超过 LOCAL_TTL 后重新加载"""
+        from unittest import mock
+        rule = rules.get_rule()
+        FineRule.objects.filter(pk=rule.pk).update(max_renewals=6)
+        self.assertEqual(rules.get_rule().max_renewals, rule.max_renewals)
+        later = time.monotonic() + rules.LOCAL_TTL
+        with mock.patch('apps.borrowing.rules.time.monotonic', return_value=later):
+            self.assertEqual(rules.get_rule().max_renewals, 6)
+
+    def test_cache_flush_reloads(self):
+        """共享缓存被清空后重新加载，不沿用本地旧对象"""
+        rule = rules.get_rule()
+        FineRule.objects.filter(pk=rule.pk).update(loan_period_days=21)
+        cache.clear()
+        self.assertEqual(rules.get_rule().loan_period_days, 21)
+
+
+class TakeCopyTests(TestCase):
+    """单册借阅库存扣减测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(total_copies=1, available_copies=1)
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(self.user)
+
+    def test_strategies(self):
+        for strategy in (circulation.STOCK_STRATEGY_OPTIMISTIC, circulation.STOCK_STRATEGY_LOCKING):
+            with self.subTest(strategy=strategy):
+                Book.objects.filter(pk=self.book.pk).update(available_copies=1)
+                book, error = circulation.take_copy(self.book.isbn, timezone.now(), strategy)
+                self.assertIsNone(error)
+                self.assertEqual(book.available_copies, 0)
+                self.assertEqual(circulation.take_copy(self.book.isbn, timezone.now(), strategy), (None, 'NO_STOCK'))
+                self.assertEqual(circulation.take_copy('978-0-000-00000-0', timezone.now(), strategy),
+                                 (None, 'BOOK_NOT_FOUND'))
+                self.book.refresh_from_db()
+                self.assertEqual(self.book.available_copies, 0)
+
+    def test_optimistic_borrow_is_one_update(self):
+        """乐观策略：不加锁读取，扣减只有一条条件 UPDATE"""
+        with self.assertNumQueries(2):
+            circulation.take_copy(self.book.isbn, timezone.now(), circulation.STOCK_STRATEGY_OPTIMISTIC)
+
+    @override_settings(BORROW_STOCK_STRATEGY='locking')
+    def test_borrow_view_locking_fallback(self):
+        facets.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+        self.assertEqual(availability.get(self.book.id), 0)
+
+    def test_borrow_view_updates_derived_data(self):
+        """条件 UPDATE 不触发 post_save，分类汇总与可借数量缓存通过信号同步"""
+        facets.rebuild()
+        availability.get(self.book.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.assertEqual(availability.get(self.book.id), 0)
+        self.assertEqual(facets.totals()['available_copies'], 0)
+
+
+class ConcurrentBorrowTests(TransactionTestCase):
+    """并发借阅：库存不会被扣成负数"""
+
+    def test_concurrent_take_copy_never_oversells(self):
+        """SQLite 为库级锁，并发写会报 database is locked：锁冲突时整笔重试，断言只检查是否超借"""
+        import threading
+
+        from django.db import OperationalError
+
+        book = make_book(total_copies=5, available_copies=5)
+        users = [User.objects.create_user(username=f'reader{i}', password='testpass123') for i in range(20)]
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def worker(user):
+            try:
+                barrier.wait()
+                for attempt in range(200):
+                    try:
+                        with transaction.atomic():
+                            taken, error = circulation.take_copy(book.isbn, timezone.now(),
+                                                                 circulation.STOCK_STRATEGY_OPTIMISTIC)
+                            if taken is not None:
+                                BorrowRecord.objects.create(user=user, book=taken,
+                                                            due_at=timezone.now() + timedelta(days=30))
+                    except OperationalError:
+                        # 锁冲突（SQLite 库级锁、MySQL 死锁回滚）：事务已回滚，稍后重试
+                        time.sleep(0.01 * (attempt % 5 + 1))
+                        continue
+                    results.append(error)
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        book.refresh_from_db()
+        self.assertEqual(len(results), len(users))
+        self.assertEqual(results.count(None), 5)
+        self.assertEqual(results.count('NO_STOCK'), 15)
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(BorrowRecord.objects.filter(book=book).count(), 5)
+
+
+class BenchmarkStockStripesTests(TransactionTestCase):
+    """库存基准命令：结束后分类汇总与删除前一致（不残留负数）"""
+
+    def test_leaves_category_summary_consistent(self):
+        make_book(total_copies=4, available_copies=4)
+        before = facets.totals()
+        out = StringIO()
+        call_command('benchmark_stock_stripes', '--copies', '6', '--threads', '1', '--stripes', '2', stdout=out)
+        self.assertEqual(out.getvalue().count('✓'), 3)
+        self.assertFalse(CategorySummary.objects.filter(category='基准测试').exists())
+        self.assertEqual(facets.totals(), before)
+
+
+class HoldQueueTests(TestCase):
+    """预约排队测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(total_copies=1, available_copies=0)
+        self.readers = [User.objects.create_user(username=f'reader{i}', password='testpass123') for i in range(3)]
+        self.borrower = User.objects.create_user(username='borrower', password='testpass123')
+        self.record = BorrowRecord.objects.create(user=self.borrower, book=self.book,
+                                                  due_at=timezone.now() + timedelta(days=10))
+
+    def _place(self, user):
+        self.client.force_login(user)
+        self.client.post('/borrowing/hold/', {'isbn': self.book.isbn})
+        return Hold.objects.filter(user=user).latest('id')
+
+    def _return(self):
+        self.client.force_login(self.borrower)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/return/', {'record_id': str(self.record.id)})
+
+    def test_place_hold_only_when_out_of_stock(self):
+        hold = self._place(self.readers[0])
+        self.assertEqual(hold.status, 'waiting')
+        self._place(self.readers[0])
+        self.assertEqual(Hold.objects.filter(user=self.readers[0]).count(), 1)
+
+        Book.objects.filter(pk=self.book.pk).update(available_copies=1)
+        self.client.force_login(self.readers[1])
+        self.client.post('/borrowing/hold/', {'isbn': self.book.isbn})
+        self.assertFalse(Hold.objects.filter(user=self.readers[1]).exists())
+
+    def test_return_goes_to_first_hold(self):
+        """归还后副本按先后分配给队首，可借数量不变；队首借阅时不扣减库存"""
+        first, second = self._place(self.readers[0]), self._place(self.readers[1])
+        self.assertEqual((holds.queue_position(first), holds.queue_position(second)), (1, 2))
+
+        self._return()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('ready', 'waiting'))
+        self.assertIsNotNone(first.expires_at)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        # 排在后面的读者借不到预留的副本
+        self.client.force_login(self.readers[1])
+        self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.assertFalse(BorrowRecord.objects.filter(user=self.readers[1]).exists())
+
+        self.client.force_login(self.readers[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'fulfilled')
+        self.assertTrue(BorrowRecord.objects.filter(user=self.readers[0], status='borrowed').exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_demo_annotates_queue_positions(self):
+        """演示页一次查询标注全部预约的排队位次（不随预约数增加查询）"""
+        other = make_book(isbn='978-7-111-00000-6', total_copies=1, available_copies=0)
+        first = self._place(self.readers[0])
+        self._place(self.readers[1])
+        self.client.force_login(self.readers[1])
+        self.client.post('/borrowing/hold/', {'isbn': other.isbn})
+        self.assertEqual(holds.queue_position(first), 1)
+
+        response = self.client.get('/borrowing/demo/')
+        positions = {hold.book_id: hold.position for hold in response.context['holds']}
+        self.assertEqual(positions, {self.book.id: 2, other.id: 1})
+        ahead = holds.with_queue_positions(Hold.objects.filter(user=self.readers[1]))
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(hold.queue_ahead for hold in ahead), [0, 1])
+
+    def test_return_without_holds_restores_stock(self):
+        facets.rebuild()
+        availability.get(self.book.id)
+        self._return()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertEqual(availability.get(self.book.id), 1)
+
+    def test_expire_passes_copy_on(self):
+        """过期的预约把副本转给下一位，队列为空时计入可借数量"""
+        first, second = self._place(self.readers[0]), self._place(self.readers[1])
+        self._return()
+        later = timezone.now() + timedelta(days=holds.get_pickup_days() + 1)
+
+        self.assertEqual(holds.expire(later), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('expired', 'ready'))
+
+        later += timedelta(days=holds.get_pickup_days() + 1)
+        self.assertEqual(holds.expire(later), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_cancel_ready_hold_passes_copy_on(self):
+        first, second = self._place(self.readers[0]), self._place(self.readers[1])
+        self._return()
+        self.client.force_login(self.readers[0])
+        self.client.post('/borrowing/hold/cancel/', {'hold_id': str(first.id)})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('cancelled', 'ready'))
+
+    def test_api_checkin_and_checkout_use_holds(self):
+        hold = self._place(self.readers[0])
+        rule = _get_rule()
+        circulation.checkin(self.borrower, [self.record.id], rule)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'ready')
+
+        results = circulation.checkout(self.readers[0], [self.book.isbn], rule)
+        self.assertTrue(results[0]['ok'])
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'fulfilled')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_next_hold_uses_queue_index(self):
+        """队首查询走 (book, status, created_at, id) 联合索引，无需排序或全表扫描"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('执行计划格式与数据库相关')
+        plan = Hold.objects.filter(book_id=self.book.id, status='waiting').order_by('created_at', 'id')[:1].explain()
+        self.assertIn('USING INDEX borrowing_h_book_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class StripedCirculationTests(TestCase):
+    """分段库存图书的借还测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(total_copies=4, available_copies=4)
+        stripes.enable(self.book.id, 2)
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+
+    def test_take_copy_uses_stripes(self):
+        for strategy in (circulation.STOCK_STRATEGY_OPTIMISTIC, circulation.STOCK_STRATEGY_LOCKING):
+            with self.subTest(strategy=strategy):
+                book, error = circulation.take_copy(self.book.isbn, timezone.now(), strategy)
+                self.assertIsNone(error)
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 2})
+        # 图书行仅作快照，借阅不改动
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 4)
+
+    def test_checkout_and_checkin(self):
+        facets.rebuild()
+        rule = _get_rule()
+        with self.captureOnCommitCallbacks(execute=True):
+            results = circulation.checkout(self.user, [self.book.isbn] * 5, rule)
+        self.assertEqual([item['ok'] for item in results], [True] * 4 + [False])
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 0})
+        self.assertEqual(availability.get(self.book.id), 0)
+        self.assertEqual(facets.totals()['available_copies'], 0)
+
+        record_ids = [item['record_id'] for item in results if item['ok']]
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.checkin(self.user, record_ids[:3], rule)
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 3})
+        self.assertEqual(availability.get(self.book.id), 3)
+        self.assertEqual(facets.totals()['available_copies'], 3)
+
+    def test_return_view_puts_copy_back(self):
+        record = BorrowRecord.objects.create(user=self.user, book=self.book,
+                                             due_at=timezone.now() + timedelta(days=5))
+        self.client.force_login(self.user)
+        self.client.post('/borrowing/return/', {'record_id': str(record.id)})
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 5})
+
+
+class IdempotencyTests(TestCase):
+    """借还幂等键测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(self.user)
+
+    def _borrow_form(self, key, isbn=None):
+        return self.client.post('/borrowing/borrow/', {'isbn': isbn or self.book.isbn, 'idempotency_key': key})
+
+    def test_form_resubmit_borrows_once(self):
+        first = self._borrow_form('kiosk-1')
+        second = self._borrow_form('kiosk-1')
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+
+        self._borrow_form('kiosk-2')
+        self.assertEqual(BorrowRecord.objects.count(), 2)
+
+    def test_api_replays_json(self):
+        def post():
+            return self.client.post('/borrowing/api/borrow', {'isbns': [self.book.isbn]},
+                                    content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc')
+        first, second = post(), post()
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+
+    def test_key_reused_for_other_request(self):
+        self._borrow_form('kiosk-1')
+        response = self.client.post('/borrowing/renew/', {'record_id': '1', 'idempotency_key': 'kiosk-1'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['error']['code'], 'IDEMPOTENCY_KEY_MISMATCH')
+
+    def test_keys_are_per_user(self):
+        self._borrow_form('kiosk-1')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_login(other)
+        self._borrow_form('kiosk-1')
+        self.assertEqual(BorrowRecord.objects.count(), 2)
+
+    def test_expired_key_is_reusable_and_purged(self):
+        self._borrow_form('kiosk-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self._borrow_form('kiosk-1')
+        self.assertEqual(BorrowRecord.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_demo_forms_carry_distinct_keys(self):
+        content = self.client.get('/borrowing/demo/').content.decode()
+        keys = re.findall(r'name="idempotency_key" value="([0-9a-f]{32})"', content)
+        self.assertEqual(len(set(keys)), 3)
+
+
+class SimulateCirculationTests(TransactionTestCase):
+    """并发借还压测命令测试"""
+
+    def test_simulation_reports_and_checks_invariant(self):
+        out = StringIO()
+        call_command('simulate_circulation', threads=2, ops=15, books=2, copies=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('p95', output)
+        self.assertIn('✓ 库存不变量', output)
+        # 默认删除压测数据
+        self.assertFalse(Book.objects.filter(category='压测').exists())
+        self.assertFalse(User.objects.filter(username__startswith='sim_reader_').exists())
+        self.assertFalse(CirculationEvent.objects.exists())
+
+    def test_cleanup_recomputes_rolled_up_days(self):
+        """压测事件已被汇总时，清理后按剩余流水重算当天汇总"""
+        book = make_book()
+        user = User.objects.create_user(username='reader', password='testpass123')
+        record = BorrowRecord.objects.create(user=user, book=book, due_at=timezone.now() + timedelta(days=3))
+        ledger.log('borrowed', record, timezone.now())
+        call_command('simulate_circulation', threads=2, ops=15, books=2, copies=2, keep=True, stdout=StringIO())
+        rollups.consume()
+        self.assertGreater(rollups.total('borrowed')[0], 1)
+
+        call_command('simulate_circulation', threads=1, ops=1, books=1, copies=1, stdout=StringIO())
+        self.assertEqual(CirculationEvent.objects.count(), 1)
+        self.assertEqual(rollups.total('borrowed'), (1, Decimal('0.00')))
+        self.assertEqual(rollups.total('returned'), (0, Decimal('0.00')))
+
+
+class CirculationLedgerTests(TestCase):
+    """流通事件流水与增量汇总测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(self.user)
+        FineRule.objects.create(daily_fine=Decimal('0.50'), max_renewals=1, loan_period_days=30)
+
+    def _events(self):
+        return list(CirculationEvent.objects.order_by('id').values_list('event_type', 'record_id', 'amount'))
+
+    def test_form_views_write_events(self):
+        self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        record = BorrowRecord.objects.get()
+        self.client.post('/borrowing/renew/', {'record_id': record.id})
+        BorrowRecord.objects.filter(id=record.id).update(due_at=timezone.now() - timedelta(days=4))
+        self.client.post('/borrowing/return/', {'record_id': record.id})
+
+        self.assertEqual(self._events(), [
+            ('borrowed', record.id, Decimal('0.00')),
+            ('renewed', record.id, Decimal('0.00')),
+            ('returned', record.id, Decimal('0.00')),
+            ('fined', record.id, Decimal('2.00')),
+        ])
+
+    def test_rejected_request_writes_nothing(self):
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        self.client.post('/borrowing/borrow/', {'isbn': self.book.isbn})
+        self.client.post('/borrowing/return/', {'record_id': '999'})
+        self.assertFalse(CirculationEvent.objects.exists())
+
+    def test_api_writes_events_in_batch(self):
+        response = self.client.post('/borrowing/api/borrow', {'isbns': [self.book.isbn] * 2},
+                                    content_type='application/json')
+        record_ids = [item['record_id'] for item in response.json()['results']]
+        self.client.post('/borrowing/api/renew', {'record_ids': record_ids[:1]}, content_type='application/json')
+        self.client.post('/borrowing/api/return', {'record_ids': record_ids}, content_type='application/json')
+
+        events = self._events()
+        self.assertEqual([event[0] for event in events], ['borrowed'] * 2 + ['renewed'] + ['returned'] * 2)
+        self.assertEqual([event[1] for event in events], record_ids + record_ids[:1] + record_ids)
+
+    def test_event_rolls_back_with_transaction(self):
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() + timedelta(days=3))
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                circulation.renew(self.user, [record.id], _get_rule())
+                raise RuntimeError
+        self.assertFalse(CirculationEvent.objects.exists())
+
+    def test_fine_events_sum_to_record_fine(self):
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() - timedelta(days=2))
+        call_command('mark_overdue', stdout=StringIO())
+        # 归还前又过去两天：归还时重算的罚款只记变动额
+        BorrowRecord.objects.filter(id=record.id).update(due_at=timezone.now() - timedelta(days=4))
+        circulation.checkin(self.user, [record.id], _get_rule())
+
+        record.refresh_from_db()
+        self.assertEqual(record.fine_amount, Decimal('2.00'))
+        self.assertEqual([event[0] for event in self._events()], ['overdue', 'fined', 'returned', 'fined'])
+        self.assertEqual(sum(event[2] for event in self._events()), record.fine_amount)
+
+    def test_consume_by_high_water_mark(self):
+        records = [
+            BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() + timedelta(days=3))
+            for _ in range(3)
+        ]
+        yesterday = timezone.now() - timedelta(days=1)
+        ledger.write([
+            ledger.build('borrowed', records[0], yesterday),
+            ledger.build('borrowed', records[1], timezone.now()),
+            ledger.build('fined', records[1], timezone.now(), Decimal('1.50')),
+        ])
+        self.assertEqual(rollups.consume(batch_size=2), 3)
+        self.assertEqual(rollups.consume(), 0)
+
+        ledger.log('borrowed', records[2], timezone.now())
+        # 只读取高水位之后的新事件
+        with self.assertNumQueries(7):
+            self.assertEqual(rollups.consume(), 1)
+
+        today = timezone.localdate()
+        self.assertEqual(rollups.total('borrowed'), (3, Decimal('0.00')))
+        self.assertEqual(rollups.total('borrowed', start=today), (2, Decimal('0.00')))
+        self.assertEqual(rollups.daily(today)[today]['fined'], (1, Decimal('1.50')))
+        self.assertEqual(rollups.pending(), 0)
+
+    def _log(self, event_type, record):
+        event = ledger.build(event_type, record, timezone.now())
+        event.save()
+        return event
+
+    def _hide_event(self, event):
+        """模拟尚未提交的事务：删除事件行，之后按原 id 写回即为“晚提交”"""
+        CirculationEvent.objects.filter(id=event.id).delete()
+
+    def test_late_commit_is_picked_up(self):
+        """高水位越过的缺号在事件提交后补汇总"""
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() + timedelta(days=3))
+        self._log('borrowed', record)
+        late = self._log('returned', record)
+        self._log('renewed', record)
+        self._hide_event(late)
+
+        self.assertEqual(rollups.consume(), 2)
+        self.assertEqual(RollupCursor.objects.get().gaps.keys(), {str(late.id)})
+        self.assertEqual(rollups.consume(), 0)
+
+        late.save(force_insert=True)
+        self.assertEqual(rollups.pending(), 1)
+        self.assertEqual(rollups.consume(), 1)
+        self.assertEqual(rollups.total('returned')[0], 1)
+        self.assertEqual(RollupCursor.objects.get().gaps, {})
+        self.assertEqual(rollups.consume(), 0)
+
+    def test_gap_expires(self):
+        """超过等待时限仍未出现的缺号视为已回滚"""
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() + timedelta(days=3))
+        rolled_back = self._log('borrowed', record)
+        self._log('returned', record)
+        self._hide_event(rolled_back)
+        self.assertEqual(rollups.consume(), 1)
+        later = timezone.now() + timedelta(seconds=rollups.get_gap_timeout() + 1)
+        self.assertEqual(rollups.consume(now=later), 0)
+        self.assertEqual(RollupCursor.objects.get().gaps, {})
+
+    def test_skip_locked_consume_returns_without_waiting(self):
+        """读路径顺带汇总时，进度行被占用则直接跳过"""
+        from unittest import mock
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=timezone.now() + timedelta(days=3))
+        ledger.log('borrowed', record, timezone.now())
+        with mock.patch.object(rollups, '_lock_cursor', return_value=None):
+            self.assertEqual(rollups.consume(skip_locked=True), 0)
+        self.assertEqual(rollups.consume(), 1)
+
+    def test_backfill_and_rebuild(self):
+        now = timezone.now()
+        BorrowRecord.objects.create(user=self.user, book=self.book, borrowed_at=now - timedelta(days=40),
+                                    due_at=now - timedelta(days=10), returned_at=now - timedelta(days=5),
+                                    status='returned', fine_amount=Decimal('2.50'))
+        BorrowRecord.objects.create(user=self.user, book=self.book, borrowed_at=now - timedelta(days=35),
+                                    due_at=now - timedelta(days=5), status='overdue', fine_amount=Decimal('2.50'))
+        out = StringIO()
+        call_command('rollup_circulation', '--backfill', stdout=out)
+        self.assertIn('已补录 6 条历史事件', out.getvalue())
+        self.assertEqual(ledger.backfill(), 0)
+        self.assertEqual(rollups.total('fined'), (2, Decimal('5.00')))
+
+        DailyCirculationStat.objects.update(count=0)
+        self.assertEqual(rollups.rebuild(), 6)
+        self.assertEqual(rollups.total('borrowed')[0], 2)
+        self.assertEqual(rollups.total('returned')[0], 1)
+        self.assertEqual(rollups.total('overdue')[0], 1)
+
+
+class DemoHistoryTests(TestCase):
+    """借阅演示页借阅记录分页与筛选测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.admin = User.objects.create_user(username='admin1', password='testpass123', role='admin')
+        start = timezone.now() - timedelta(days=30)
+        BorrowRecord.objects.bulk_create([
+            BorrowRecord(user=self.user if idx % 2 else self.admin, book=self.book,
+                         borrowed_at=start + timedelta(days=idx), due_at=start + timedelta(days=idx + 30),
+                         status='returned' if idx < 10 else 'borrowed')
+            for idx in range(25)
+        ])
+
+    def _ids(self, response):
+        return [record.id for record in response.context['borrow_records']]
+
+    def test_admin_pages_through_all_records(self):
+        self.client.force_login(self.admin)
+        first = self.client.get('/borrowing/demo/')
+        page = first.context['borrow_records']
+        self.assertEqual(len(page), views.DEMO_PAGE_SIZE)
+        self.assertTrue(page.has_next)
+
+        second = self.client.get('/borrowing/demo/', {'cursor': page.next_cursor})
+        expected = list(BorrowRecord.objects.order_by('-borrowed_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self._ids(first) + self._ids(second), expected)
+        self.assertFalse(second.context['borrow_records'].has_next)
+
+    def test_only_template_columns_are_loaded(self):
+        self.client.force_login(self.admin)
+        record = self.client.get('/borrowing/demo/').context['borrow_records'].object_list[0]
+        self.assertIn('returned_at', record.get_deferred_fields())
+        self.assertIn('author', record.book.get_deferred_fields())
+        self.assertIn('password', record.user.get_deferred_fields())
+
+    def test_filters_and_links_keep_them(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/borrowing/demo/', {'status': 'returned'})
+        self.assertEqual(len(response.context['borrow_records']), 10)
+
+        day = timezone.localdate(BorrowRecord.objects.order_by('borrowed_at').first().borrowed_at)
+        response = self.client.get('/borrowing/demo/', {
+            'status': 'borrowed', 'date_from': str(day + timedelta(days=12)), 'date_to': 'bad-date',
+        })
+        self.assertEqual(len(response.context['borrow_records']), 13)
+        self.assertEqual(response.context['filter_query'], f'status=borrowed&date_from={day + timedelta(days=12)}')
+
+    def test_reader_sees_own_records(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/borrowing/demo/')
+        self.assertEqual(set(BorrowRecord.objects.filter(id__in=self._ids(response)).values_list('user', flat=True)),
+                         {self.user.id})
+        self.assertEqual(len(response.context['borrow_records']), 12)
+
+
+class ReturnDeskTests(TestCase):
+    """还书台批量归还测试"""
+
+    def setUp(self):
+        cache.clear()
+        FineRule.objects.create(daily_fine=Decimal('0.50'), max_renewals=1, loan_period_days=30)
+        self.book = make_book(available_copies=0)
+        self.other = make_book(isbn='978-7-115-46147-6', title='深度学习')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.librarian = User.objects.create_user(username='librarian1', password='testpass123', role='librarian')
+        now = timezone.now()
+        # 同一 ISBN 的三册，应还时间不同；第一册已逾期 4 天
+        self.records = [
+            BorrowRecord.objects.create(user=self.reader, book=self.book, due_at=now + timedelta(days=days))
+            for days in (-4, 5, 10)
+        ]
+
+    def _lines(self, response):
+        import json
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_streams_results_per_code(self):
+        self.client.force_login(self.librarian)
+        codes = [self.book.isbn, str(self.records[2].id), self.book.isbn.replace('-', ''), 'abc', self.other.isbn, self.records[2].id]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/borrowing/api/desk/return', {'codes': codes}, content_type='application/json')
+            lines = self._lines(response)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        items, summary = lines[:-1], lines[-1]
+        self.assertEqual([item['index'] for item in items], list(range(len(codes))))
+        self.assertEqual([item['ok'] for item in items], [True, True, True, False, False, False])
+        # ISBN 按应还时间先后对应在借记录，逾期记录按规则计算罚款
+        self.assertEqual([item.get('record_id') for item in items[:3]],
+                         [self.records[0].id, self.records[2].id, self.records[1].id])
+        self.assertEqual(items[0]['fine_amount'], '2.00')
+        self.assertEqual([item['error']['code'] for item in items[3:]],
+                         ['VALIDATION_ERROR', 'RECORD_NOT_FOUND', 'RECORD_NOT_FOUND'])
+        self.assertEqual(summary, {'done': True, 'succeeded': 3, 'failed': 3})
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 3)
+        self.assertEqual(availability.get(self.book.id), 3)
+
+    def test_groups_commit_separately(self):
+        groups = list(circulation.checkin_scans(self.librarian, [self.book.isbn] * 3, _get_rule(), group_size=2))
+        self.assertEqual([len(group) for group in groups], [2, 1])
+        self.assertTrue(all(item['ok'] for group in groups for item in group))
+        self.assertFalse(BorrowRecord.objects.filter(status__in=('borrowed', 'overdue')).exists())
+
+    def test_permissions_and_validation(self):
+        self.client.force_login(self.reader)
+        response = self.client.post('/borrowing/api/desk/return', {'codes': [self.book.isbn]}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get('/borrowing/desk/').status_code, 302)
+
+        self.client.force_login(self.librarian)
+        self.assertEqual(self.client.get('/borrowing/desk/').status_code, 200)
+        response = self.client.post('/borrowing/api/desk/return',
+                                    {'codes': ['1'] * (circulation.DESK_MAX_ITEMS + 1)}, content_type='application/json')
+        self.assertEqual(response.json()['error']['code'], 'VALIDATION_ERROR')
+
+
+class OverdueMarkingTests(TestCase):
+    """逾期标记：分块集合更新与逐条路径结果一致"""
+
+    def setUp(self):
+        cache.clear()
+        FineRule.objects.create(daily_fine=Decimal('0.35'), max_renewals=1, loan_period_days=30)
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        now = timezone.now()
+        due_dates = [
+            now - timedelta(minutes=1),
+            now - timedelta(hours=23, minutes=59),
+            now - timedelta(days=1),
+            now - timedelta(days=3, hours=5),
+            now - timedelta(days=45, seconds=1),
+            now + timedelta(days=2),
+        ]
+        self.records = [
+            BorrowRecord.objects.create(user=self.user, book=self.book, due_at=due_at) for due_at in due_dates
+        ]
+        BorrowRecord.objects.create(user=self.user, book=self.book, due_at=now - timedelta(days=9), status='returned')
+
+    def _state(self):
+        records = list(BorrowRecord.objects.order_by('id').values_list('id', 'status', 'fine_amount'))
+        events = list(CirculationEvent.objects.order_by('record_id', 'event_type').values_list('record_id', 'event_type', 'amount'))
+        return records, events
+
+    def _reset(self):
+        BorrowRecord.objects.filter(id__in=[record.id for record in self.records]).update(
+            status='borrowed', fine_amount=Decimal('0.00'),
+        )
+        CirculationEvent.objects.all().delete()
+
+    def test_set_based_matches_per_row(self):
+        now = timezone.now()
+        with mock_now(now):
+            call_command('mark_overdue', '--per-row', stdout=StringIO())
+        expected = self._state()
+        self._reset()
+        out = StringIO()
+        with mock_now(now):
+            call_command('mark_overdue', '--chunk-size', '2', stdout=out)
+        self.assertEqual(self._state(), expected)
+        self.assertIn('成功标记 5 条逾期记录', out.getvalue())
+        self.assertEqual(BorrowRecord.objects.get(id=self.records[4].id).fine_amount, Decimal('15.75'))
+
+    def test_chunk_statements_do_not_grow_with_rows(self):
+        rule = _get_rule()
+        now = timezone.now()
+        # 锁定、UPDATE、读回、写流水各一条（另含事务保存点 2 条）
+        with self.assertNumQueries(6):
+            marked, total = overdue.mark_range(self.records[0].id, self.records[-1].id, now, rule)
+        self.assertEqual(marked, 5)
+        self.assertEqual(overdue.mark_range(self.records[0].id, self.records[-1].id, now, rule), (0, Decimal('0.00')))
+        self.assertEqual(total, sum(BorrowRecord.objects.filter(status='overdue').values_list('fine_amount', flat=True)))
+
+    def test_chunk_bounds_cover_pending_ids(self):
+        now = timezone.now()
+        bounds = list(overdue.chunk_bounds(overdue.pending(now), 2))
+        pending_ids = [record.id for record in self.records[:5]]
+        self.assertEqual(bounds, [(pending_ids[0], pending_ids[1]), (pending_ids[2], pending_ids[3]), (pending_ids[4], pending_ids[4])])
+
+
+class FineAccrualTests(TestCase):
+    """逾期罚款逐日累计测试"""
+
+    def setUp(self):
+        cache.clear()
+        FineRule.objects.create(daily_fine=Decimal('0.50'), max_renewals=1, loan_period_days=30)
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.now = timezone.now()
+        today = self.now.date()
+
+        def create(days_overdue, **kwargs):
+            return BorrowRecord.objects.create(user=self.user, book=self.book, due_at=self.now - timedelta(days=days_overdue), **kwargs)
+
+        # 两天前标记逾期后未再累计；从未累计；今天已累计；已归还
+        self.stale = create(6, status='overdue', fine_amount=Decimal('2.00'), fine_accrued_on=today - timedelta(days=2))
+        self.legacy = create(3, status='overdue', fine_amount=Decimal('1.00'))
+        self.current = create(5, status='overdue', fine_amount=Decimal('2.50'), fine_accrued_on=today)
+        self.returned = create(9, status='returned', fine_amount=Decimal('1.00'), fine_accrued_on=today - timedelta(days=8))
+
+    def test_accrues_only_changed_records(self):
+        out = StringIO()
+        with mock_now(self.now):
+            call_command('accrue_fines', stdout=out)
+        self.assertIn('已累计 2 条逾期记录的罚款，新增罚款 1.50 元', out.getvalue())
+
+        fines = dict(BorrowRecord.objects.values_list('id', 'fine_amount'))
+        self.assertEqual(fines[self.stale.id], Decimal('3.00'))
+        self.assertEqual(fines[self.legacy.id], Decimal('1.50'))
+        self.assertEqual(fines[self.current.id], Decimal('2.50'))
+        self.assertEqual(fines[self.returned.id], Decimal('1.00'))
+        self.assertEqual(
+            sorted(CirculationEvent.objects.values_list('record_id', 'event_type', 'amount')),
+            sorted([(self.stale.id, 'fined', Decimal('1.00')), (self.legacy.id, 'fined', Decimal('0.50'))]),
+        )
+
+        # 同一天重复执行不再更新
+        with self.assertNumQueries(1):
+            self.assertEqual(overdue.accrue(self.now, _get_rule()), (0, Decimal('0.00')))
+        self.assertEqual(CirculationEvent.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', '仅 SQLite 退回单进程')
+    def test_sqlite_runs_single_process(self):
+        """SQLite 下 --workers 按 1 执行并提示"""
+        out = StringIO()
+        with mock_now(self.now):
+            call_command('accrue_fines', '--workers', '4', stdout=out)
+        self.assertIn('--workers 按 1 执行', out.getvalue())
+        self.assertIn('已累计 2 条逾期记录的罚款', out.getvalue())
+
+    def test_resumes_after_partial_run(self):
+        rule = _get_rule()
+        self.assertEqual(overdue.accrue_range(self.stale.id, self.stale.id, self.now, rule), (1, Decimal('1.00')))
+        self.assertEqual(overdue.accrue(self.now, rule, chunk_size=1), (1, Decimal('0.50')))
+        self.assertFalse(overdue.accrual_pending(self.now.date()).exists())
+
+    def test_mark_overdue_sets_accrued_date(self):
+        record = BorrowRecord.objects.create(user=self.user, book=self.book, due_at=self.now - timedelta(days=1))
+        call_command('mark_overdue', stdout=StringIO())
+        record.refresh_from_db()
+        self.assertEqual(record.fine_accrued_on, timezone.now().date())
+        self.assertNotIn(record.id, overdue.accrual_pending(timezone.now().date()).values_list('id', flat=True))
+
+    def test_return_overdue_recomputes_fine(self):
+        admin = User.objects.create_user(username='admin1', password='testpass123', role='admin')
+        self.client.force_login(admin)
+        self.client.post('/borrowing/overdue/return/', {'record_id': self.stale.id})
+        self.stale.refresh_from_db()
+        self.assertEqual((self.stale.status, self.stale.fine_amount), ('returned', Decimal('3.00')))
+        self.assertEqual(
+            list(CirculationEvent.objects.filter(record_id=self.stale.id).values_list('event_type', 'amount')),
+            [('returned', Decimal('0.00')), ('fined', Decimal('1.00'))],
+        )
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite 为库级锁，多进程写入会退回单进程（见 overdue.effective_workers）')
+class ParallelOverdueTests(TransactionTestCase):
+    """逾期标记与计息的多进程执行：结果与进程数无关（需要 MySQL/PostgreSQL）"""
+
+    def setUp(self):
+        cache.clear()
+        self.rule = FineRule.objects.create(daily_fine=Decimal('0.35'), max_renewals=1, loan_period_days=30)
+        book = make_book()
+        user = User.objects.create_user(username='reader', password='testpass123')
+        self.now = timezone.now()
+        BorrowRecord.objects.bulk_create([
+            BorrowRecord(user=user, book=book, due_at=self.now - timedelta(days=idx % 9, hours=idx))
+            for idx in range(23)
+        ])
+
+    def _state(self):
+        records = list(BorrowRecord.objects.order_by('id').values_list('id', 'status', 'fine_amount', 'fine_accrued_on'))
+        events = sorted(CirculationEvent.objects.values_list('record_id', 'event_type', 'amount'))
+        return records, events
+
+    def _reset(self):
+        BorrowRecord.objects.update(status='borrowed', fine_amount=Decimal('0.00'), fine_accrued_on=None)
+        CirculationEvent.objects.all().delete()
+
+    def test_result_independent_of_workers(self):
+        results, states = [], []
+        for workers in (1, 3):
+            self._reset()
+            reports = []
+            totals = overdue.mark(self.now, self.rule, chunk_size=5,
+                                  progress=lambda *args: reports.append(args), workers=workers)
+            results.append(totals)
+            states.append(self._state())
+            self.assertEqual(len(reports), 5)
+            self.assertEqual(reports[-1][2:], totals)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(results[0][0], BorrowRecord.objects.filter(status='overdue').count())
+
+    def test_parallel_accrual(self):
+        BorrowRecord.objects.update(status='overdue', fine_accrued_on=self.now.date() - timedelta(days=1))
+        count, _ = overdue.accrue(self.now, self.rule, chunk_size=4, workers=2)
+        self.assertEqual(count, 23)
+        self.assertFalse(overdue.accrual_pending(self.now.date()).exists())
+        expected = sum(
+            (Decimal((self.now.date() - due_at.date()).days) * self.rule.daily_fine
+             for due_at in BorrowRecord.objects.values_list('due_at', flat=True)),
+            Decimal('0.00'),
+        )
+        self.assertEqual(sum(BorrowRecord.objects.values_list('fine_amount', flat=True)), expected)
+
+
+class DueSchedulerTests(TestCase):
+    """到期调度：按应还时间出堆标记，刷新后跟上续借、归还与新借出"""
+
+    def setUp(self):
+        cache.clear()
+        FineRule.objects.create(daily_fine=Decimal('0.35'), max_renewals=1, loan_period_days=30)
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.now = timezone.now()
+
+    def _borrow(self, due_at):
+        return BorrowRecord.objects.create(user=self.user, book=self.book, due_at=due_at)
+
+    def test_marks_records_as_they_fall_due(self):
+        late = self._borrow(self.now - timedelta(days=2, minutes=1))
+        soon = self._borrow(self.now + timedelta(minutes=10))
+        later = self._borrow(self.now + timedelta(minutes=30))
+        far = self._borrow(self.now + timedelta(days=20))
+        queue = scheduler.DueScheduler(batch_size=100, lookahead=3600, refresh=3600)
+
+        self.assertEqual(queue.tick(self.now), (1, Decimal('0.70')))
+        self.assertEqual(len(queue.heap), 2)
+        self.assertEqual(queue.seconds_until_next(self.now), 600)
+
+        self.assertEqual(queue.tick(self.now + timedelta(minutes=10, seconds=1))[0], 1)
+        statuses = dict(BorrowRecord.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[late.id], 'overdue')
+        self.assertEqual(statuses[soon.id], 'overdue')
+        self.assertEqual(statuses[later.id], 'borrowed')
+        self.assertEqual(statuses[far.id], 'borrowed')
+        self.assertEqual(CirculationEvent.objects.filter(event_type='overdue').count(), 2)
+
+    def test_stale_entries_and_refresh(self):
+        renewed = self._borrow(self.now + timedelta(minutes=5))
+        returned = self._borrow(self.now + timedelta(minutes=5))
+        queue = scheduler.DueScheduler(batch_size=100, lookahead=3600, refresh=60)
+        queue.tick(self.now)
+        BorrowRecord.objects.filter(id=renewed.id).update(due_at=self.now + timedelta(days=30))
+        BorrowRecord.objects.filter(id=returned.id).update(status='returned', returned_at=self.now)
+        # 装载之后才借出、很快到期的记录在下次刷新时入队
+        fresh = self._borrow(self.now + timedelta(minutes=2))
+
+        # 未到刷新时间：堆中的旧条目出堆，但条件更新不会误标
+        queue.refresh = timedelta(hours=1)
+        self.assertEqual(queue.tick(self.now + timedelta(minutes=6))[0], 0)
+        queue.refresh = timedelta(seconds=60)
+        self.assertEqual(queue.tick(self.now + timedelta(minutes=6))[0], 1)
+        self.assertEqual(
+            dict(BorrowRecord.objects.values_list('id', 'status')),
+            {renewed.id: 'borrowed', returned.id: 'returned', fresh.id: 'overdue'},
+        )
+
+    def test_backlog_larger_than_batch(self):
+        for days in range(1, 8):
+            self._borrow(self.now - timedelta(days=days))
+        queue = scheduler.DueScheduler(batch_size=3, lookahead=3600, refresh=60)
+        # 每批取空后立即装载下一批，一次 tick 处理完积压
+        self.assertEqual(queue.tick(self.now)[0], 7)
+        self.assertFalse(BorrowRecord.objects.filter(status='borrowed').exists())
+
+    def test_command_once(self):
+        self._borrow(self.now - timedelta(hours=1))
+        self._borrow(self.now + timedelta(days=1))
+        out = StringIO()
+        call_command('run_due_scheduler', '--once', stdout=out)
+        self.assertIn('标记 1 条逾期记录', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('run_due_scheduler', '--once', '--lookahead', '10', '--refresh', '60')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', BORROW_REMINDER_DAYS=3)
+class DueReminderTests(TestCase):
+    """到期提醒：按读者合并、批量发送，重复执行不重复提醒"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.books = [make_book(isbn=f'978-7-111-1234{idx}-0', title=f'图书{idx}') for idx in range(3)]
+        self.alice = User.objects.create_user(username='alice', password='testpass123', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', password='testpass123', email='bob@example.com')
+        self.nomail = User.objects.create_user(username='nomail', password='testpass123')
+
+    def _borrow(self, user, book, due_in, **kwargs):
+        return BorrowRecord.objects.create(user=user, book=book, due_at=self.now + due_in, **kwargs)
+
+    def test_digest_per_user_and_dedup(self):
+        self._borrow(self.alice, self.books[0], timedelta(days=1))
+        self._borrow(self.alice, self.books[1], timedelta(days=2, hours=23))
+        self._borrow(self.alice, self.books[2], timedelta(days=10))
+        self._borrow(self.alice, self.books[2], -timedelta(days=1), status='overdue')
+        renewed = self._borrow(self.bob, self.books[0], timedelta(hours=5))
+        self._borrow(self.nomail, self.books[1], timedelta(hours=5))
+
+        self.assertEqual(reminders.send(self.now, batch_size=1), (2, 3))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['alice@example.com', 'bob@example.com'])
+        alice_mail = next(message for message in mail.outbox if message.to == ['alice@example.com'])
+        self.assertIn('（2 本）', alice_mail.subject)
+        self.assertIn('《图书0》', alice_mail.body)
+        self.assertNotIn('《图书2》', alice_mail.body)
+
+        # 重复执行不再发送；续借后按新的应还时间再提醒
+        self.assertEqual(reminders.send(self.now), (0, 0))
+        BorrowRecord.objects.filter(id=renewed.id).update(due_at=self.now + timedelta(days=2))
+        self.assertEqual(reminders.send(self.now), (1, 1))
+        self.assertEqual(DueReminder.objects.filter(record=renewed).count(), 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_message_not_recorded(self):
+        """后端未发出的邮件不记录，下次重试；已发出的不重复"""
+        from unittest import mock
+        from django.core.mail.backends.locmem import EmailBackend
+
+        self._borrow(self.alice, self.books[0], timedelta(days=1))
+        self._borrow(self.bob, self.books[1], timedelta(days=1))
+        send_messages = EmailBackend.send_messages
+
+        def reject_bob(backend, messages):
+            return 0 if messages[0].to == ['bob@example.com'] else send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', reject_bob):
+            self.assertEqual(reminders.send(self.now), (1, 1))
+        self.assertEqual(reminders.send(self.now), (1, 1))
+        self.assertEqual([message.to for message in mail.outbox], [['alice@example.com'], ['bob@example.com']])
+
+    def test_purge_closed(self):
+        """归还或逾期的记录的提醒被清理，在借记录的保留"""
+        kept = self._borrow(self.alice, self.books[0], timedelta(days=1))
+        returned = self._borrow(self.bob, self.books[1], timedelta(days=1))
+        reminders.send(self.now)
+        BorrowRecord.objects.filter(id=returned.id).update(status='returned')
+        out = StringIO()
+        call_command('purge_due_reminders', '--batch-size', '1', stdout=out)
+        self.assertIn('已清理 1 条', out.getvalue())
+        self.assertEqual(list(DueReminder.objects.values_list('record_id', flat=True)), [kept.id])
+
+    def test_command(self):
+        self._borrow(self.alice, self.books[0], timedelta(days=1))
+        out = StringIO()
+        call_command('send_due_reminders', '--dry-run', stdout=out)
+        self.assertIn('将向 1 名读者提醒 1 条借阅记录', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_due_reminders', stdout=out)
+        self.assertIn('已发送 1 封提醒邮件', out.getvalue())
+        call_command('send_due_reminders', stdout=out)
+        self.assertIn('没有需要提醒的记录', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
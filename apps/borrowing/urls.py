@@ -6,10 +6,20 @@ urlpatterns = [
     path('borrow/', views.borrow, name='borrow'),
     path('return/', views.return_book, name='return_book'),
     path('renew/', views.renew, name='renew'),
+    # 预约排队
+    path('hold/', views.place_hold, name='place_hold'),
+    path('hold/cancel/', views.cancel_hold, name='cancel_hold'),
     # 逾期和罚款管理
     path('overdue/', views.overdue_management, name='overdue_management'),
     path('overdue/return/', views.return_overdue, name='return_overdue'),
     path('api/rule', views.fine_rule_api, name='fine_rule_api'),
+    # 批量借还（流通台）
+    path('api/borrow', views.borrow_api, name='borrow_api'),
+    path('api/return', views.return_api, name='return_api'),
+    path('api/renew', views.renew_api, name='renew_api'),
+    # 还书台批量归还（流式返回）
+    path('desk/', views.desk, name='borrowing_desk'),
+    path('api/desk/return', views.desk_return_api, name='desk_return_api'),
 ]
 
 
@@ -2,25 +2,57 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
 from apps.library.models import Book
-from .models import BorrowRecord, FineRule
+from apps.library.pagination import paginate_keyset
+from apps.accounts.permissions import can_manage_books
+from .models import BorrowRecord, FineRule, Hold
+from . import circulation, holds, ledger, reminders, rules
+from .idempotency import idempotent
+from .circulation import MAX_LOAN_DAYS, MAX_RENEW_DAYS
 from apps.accounts.models import User
+from datetime import date, datetime, time
+from urllib.parse import urlencode
 import json
+import uuid
 
 
-MAX_LOAN_DAYS = 60
-MAX_RENEW_DAYS = 30
+DEMO_PAGE_SIZE = 20
+
+# 借阅记录列表模板用到的列（含关联的图书与借阅人）
+DEMO_RECORD_FIELDS = (
+    'id', 'borrowed_at', 'due_at', 'status', 'renew_count', 'fine_amount',
+    'book__id', 'book__title', 'book__isbn',
+    'user__id', 'user__username', 'user__first_name', 'user__last_name', 'user__role', 'user__student_id',
+)
 
 
 def _get_rule() -> FineRule:
-    rule = FineRule.objects.first()
-    if not rule:
-        rule = FineRule.objects.create()
-    return rule
+    """当前罚款规则（进程内缓存，规则修改后通过共享版本号失效，见 rules.py）"""
+    return rules.get_rule()
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _filter_records(records, status, date_from, date_to):
+    """按状态与借出日期（本地日期，含两端）筛选借阅记录"""
+    if status in dict(BorrowRecord.STATUS_CHOICES):
+        records = records.filter(status=status)
+    if date_from:
+        records = records.filter(borrowed_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        records = records.filter(
+            borrowed_at__lt=timezone.make_aware(datetime.combine(date_to + timezone.timedelta(days=1), time.min))
+        )
+    return records
 
 
 def demo(request):
@@ -28,21 +60,45 @@ def demo(request):
     user = request.user
     borrow_records = []
     now = timezone.now()
+    status = request.GET.get('status', '').strip()
+    date_from = _parse_date(request.GET.get('date_from', '').strip())
+    date_to = _parse_date(request.GET.get('date_to', '').strip())
     
     if user.is_authenticated:
-        # 获取当前用户的所有借阅记录，按借出时间倒序排列
-        # 使用select_related优化查询，同时加载book和user信息
-        if user.role == 'admin' or user.is_superuser:
-            # 管理员可以查看所有借阅记录
-            borrow_records = BorrowRecord.objects.all().select_related('book', 'user').order_by('-borrowed_at')
-        else:
-            # 普通用户只能查看自己的借阅记录
-            borrow_records = BorrowRecord.objects.filter(user=user).select_related('book', 'user').order_by('-borrowed_at')
+        # 管理员查看所有借阅记录，普通用户只能查看自己的借阅记录
+        records = BorrowRecord.objects.all()
+        if not (user.role == 'admin' or user.is_superuser):
+            records = records.filter(user=user)
+        records = _filter_records(records, status, date_from, date_to)
+        # 只取模板用到的列；按 (borrowed_at, id) 游标分页，每页一次索引范围查询，内存只占一页
+        records = records.select_related('book', 'user').only(*DEMO_RECORD_FIELDS)
+        borrow_records = paginate_keyset(records, request.GET.get('cursor'), DEMO_PAGE_SIZE, field='borrowed_at')
     
     rule = _get_rule()
 
+    # 当前用户的预约（排队中显示位次，待取书显示截止时间）
+    user_holds = []
+    if user.is_authenticated:
+        user_holds = list(holds.with_queue_positions(
+            Hold.objects.filter(user=user, status__in=holds.ACTIVE_STATUSES).select_related('book').order_by('created_at')
+        ))
+        for hold in user_holds:
+            hold.position = hold.queue_ahead + 1 if hold.status == 'waiting' else None
+
     return render(request, 'borrowing/demo.html', {
+        # 每个表单每次渲染一个幂等键，网络重试重复提交时只办理一次
+        'form_keys': {name: uuid.uuid4().hex for name in ('borrow', 'return', 'renew')},
         'borrow_records': borrow_records,
+        'status_choices': BorrowRecord.STATUS_CHOICES,
+        'filters': {'status': status, 'date_from': date_from, 'date_to': date_to},
+        # 翻页链接保留筛选条件
+        'filter_query': urlencode({
+            key: value for key, value in (
+                ('status', status), ('date_from', date_from or ''), ('date_to', date_to or ''),
+            ) if value
+        }),
+        'holds': user_holds,
+        'pickup_days': holds.get_pickup_days(),
         'now': now,
         'is_admin': user.is_authenticated and (user.role == 'admin' or user.is_superuser),
         'rule': rule,
@@ -50,6 +106,7 @@ def demo(request):
 
 
 @require_POST
+@idempotent
 @transaction.atomic
 def borrow(request):
     isbn = request.POST.get('isbn', '').strip()
@@ -58,20 +115,11 @@ def borrow(request):
         messages.error(request, '请先登录。')
         return redirect('dashboard_home')
 
-    try:
-        book = Book.objects.select_for_update().get(isbn=isbn)
-    except Book.DoesNotExist:
-        messages.error(request, '未找到该 ISBN 的图书。')
-        return redirect('borrowing_demo')
-
-    if book.available_copies <= 0:
-        messages.error(request, '该图书当前无可借副本。')
-        return redirect('borrowing_demo')
-
     rule = _get_rule()
 
     loan_days_raw = request.POST.get('loan_days')
     loan_days = rule.loan_period_days
+    invalid_days = False
     if loan_days_raw:
         try:
             requested_days = int(loan_days_raw)
@@ -79,27 +127,44 @@ def borrow(request):
                 raise ValueError
             loan_days = min(requested_days, MAX_LOAN_DAYS)
         except ValueError:
-            messages.warning(request, '借阅时长输入无效，已使用默认时长。')
+            invalid_days = True
             loan_days = min(rule.loan_period_days, MAX_LOAN_DAYS)
     else:
         loan_days = min(rule.loan_period_days, MAX_LOAN_DAYS)
 
-    due_at = timezone.now() + timezone.timedelta(days=loan_days)
+    now = timezone.now()
+    due_at = now + timezone.timedelta(days=loan_days)
 
-    BorrowRecord.objects.create(
+    # 本人有待取书预约时直接领取预留副本，不再扣减库存
+    hold = holds.claim(user, isbn)
+    if hold is not None:
+        book = hold.book
+    else:
+        # 扣减库存放在最后，行锁只持有到写入借阅记录、提交为止（策略见 circulation.take_copy）
+        book, error = circulation.take_copy(isbn, now)
+        if error == 'BOOK_NOT_FOUND':
+            messages.error(request, '未找到该 ISBN 的图书。')
+            return redirect('borrowing_demo')
+        if error == 'NO_STOCK':
+            messages.error(request, '该图书当前无可借副本，可预约排队，到书后为您保留。')
+            return redirect('borrowing_demo')
+
+    record = BorrowRecord.objects.create(
         user=user,
         book=book,
-        borrowed_at=timezone.now(),
+        borrowed_at=now,
         due_at=due_at,
         status='borrowed',
     )
-    book.available_copies -= 1
-    book.save(update_fields=['available_copies'])
+    ledger.log('borrowed', record, now)
+    if invalid_days:
+        messages.warning(request, '借阅时长输入无效，已使用默认时长。')
     messages.success(request, f'借阅成功，应还日期：{due_at.date()} (共 {loan_days} 天)')
     return redirect('borrowing_demo')
 
 
 @require_POST
+@idempotent
 @transaction.atomic
 def return_book(request):
     record_id = request.POST.get('record_id', '').strip()
@@ -132,6 +197,7 @@ def return_book(request):
         return redirect('borrowing_demo')
 
     now = timezone.now()
+    previous_fine = record.fine_amount
     record.returned_at = now
     if now > record.due_at:
         rule = _get_rule()
@@ -141,15 +207,50 @@ def return_book(request):
     else:
         record.status = 'returned'
     record.save()
+    ledger.write([ledger.build('returned', record, now)] + ledger.fine_changed(record, previous_fine, now))
 
-    book = record.book
-    book.available_copies += 1
-    book.save(update_fields=['available_copies'])
+    # 有人预约时副本留给队首读者，否则计入可借数量
+    holds.release_copy(record.book_id, now)
     messages.success(request, '归还成功。')
     return redirect('borrowing_demo')
 
 
 @require_POST
+@login_required
+@transaction.atomic
+def place_hold(request):
+    """无可借副本时预约排队，到书后保留 BORROW_HOLD_PICKUP_DAYS 天"""
+    isbn = request.POST.get('isbn', '').strip()
+    book = Book.objects.filter(isbn=isbn).first()
+    if book is None:
+        messages.error(request, '未找到该 ISBN 的图书。')
+        return redirect('borrowing_demo')
+
+    hold, error = holds.place(request.user, book)
+    if error == 'BOOK_AVAILABLE':
+        messages.error(request, '该图书当前有可借副本，请直接借阅。')
+    elif error == 'HOLD_EXISTS':
+        messages.error(request, '您已预约该图书。')
+    else:
+        messages.success(request, f'预约成功，当前排在第 {holds.queue_position(hold)} 位。')
+    return redirect('borrowing_demo')
+
+
+@require_POST
+@login_required
+@transaction.atomic
+def cancel_hold(request):
+    """取消本人的预约；已到书的预约取消后副本转给下一位"""
+    hold_id = request.POST.get('hold_id', '').strip()
+    if not hold_id.isdigit() or holds.cancel(request.user, int(hold_id)) is None:
+        messages.error(request, '未找到可取消的预约。')
+    else:
+        messages.success(request, '已取消预约。')
+    return redirect('borrowing_demo')
+
+
+@require_POST
+@idempotent
 @transaction.atomic
 def renew(request):
     record_id = request.POST.get('record_id', '').strip()
@@ -189,10 +290,212 @@ def renew(request):
     record.due_at = record.due_at + timezone.timedelta(days=additional_days)
     record.renew_count += 1
     record.save(update_fields=['due_at', 'renew_count'])
+    ledger.log('renewed', record, timezone.now())
     messages.success(request, f'续借成功，新增 {additional_days} 天。')
     return redirect('borrowing_demo')
 
 
+def _api_error(code, message, status=400):
+    return JsonResponse({
+        'error': {
+            'code': code,
+            'message': message
+        }
+    }, status=status)
+
+
+def _parse_body(request):
+    """解析 JSON 或表单请求体，格式错误时返回 None"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _parse_items(data, list_key, single_key):
+    """读取条目列表（兼容单条字段），返回 (条目列表, 错误信息)"""
+    if list_key in data:
+        items = data.getlist(list_key) if hasattr(data, 'getlist') else data[list_key]
+    elif single_key in data:
+        items = [data[single_key]]
+    else:
+        return None, f'请提供 {list_key}'
+    if not isinstance(items, list) or not items:
+        return None, f'{list_key} 必须是非空列表'
+    if len(items) > circulation.MAX_ITEMS:
+        return None, f'单次最多办理 {circulation.MAX_ITEMS} 项'
+    return items, None
+
+
+def _circulation_response(results):
+    succeeded = sum(1 for item in results if item['ok'])
+    return JsonResponse({
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results,
+    })
+
+
+def _resolve_patron(request, data):
+    """确定借阅人：管理角色可通过 user_id 代读者办理，否则为当前用户"""
+    user_id = data.get('user_id')
+    if user_id in (None, ''):
+        return request.user, None
+    if not can_manage_books(request.user):
+        return None, _api_error('FORBIDDEN', '无权限代他人办理', status=403)
+    try:
+        return User.objects.get(pk=int(user_id)), None
+    except (User.DoesNotExist, ValueError, TypeError):
+        return None, _api_error('VALIDATION_ERROR', '读者不存在')
+
+
+@require_POST
+@login_required
+@idempotent
+def borrow_api(request):
+    """
+    批量借阅API
+
+    URL: POST /api/borrow
+    权限: 已登录；admin/librarian 可传 user_id 代读者借阅
+    请求体: {"isbns": ["978...", ...], "loan_days": 45}（兼容单条 {"isbn": "978..."}）
+    返回: 逐条结果，所有条目在同一事务中办理
+    """
+    data = _parse_body(request)
+    if data is None:
+        return _api_error('VALIDATION_ERROR', '请求体必须是 JSON 对象')
+    isbns, error = _parse_items(data, 'isbns', 'isbn')
+    if error:
+        return _api_error('VALIDATION_ERROR', error)
+    isbns = [str(isbn).strip() for isbn in isbns]
+
+    loan_days = data.get('loan_days')
+    if loan_days not in (None, ''):
+        try:
+            loan_days = int(loan_days)
+        except (ValueError, TypeError):
+            return _api_error('VALIDATION_ERROR', 'loan_days 必须是整数')
+        if not 1 <= loan_days <= MAX_LOAN_DAYS:
+            return _api_error('VALIDATION_ERROR', f'loan_days 范围为 1~{MAX_LOAN_DAYS}')
+    else:
+        loan_days = None
+
+    patron, error_response = _resolve_patron(request, data)
+    if error_response:
+        return error_response
+    return _circulation_response(circulation.checkout(patron, isbns, _get_rule(), loan_days))
+
+
+def _parse_record_ids(data):
+    record_ids, error = _parse_items(data, 'record_ids', 'record_id')
+    if error:
+        return None, error
+    try:
+        return [int(record_id) for record_id in record_ids], None
+    except (ValueError, TypeError):
+        return None, '借阅记录ID必须是数字'
+
+
+@require_POST
+@login_required
+@idempotent
+def return_api(request):
+    """
+    批量归还API
+
+    URL: POST /api/return
+    权限: 记录所属用户；admin/librarian 可归还任意记录
+    请求体: {"record_ids": [123, 124]}（兼容单条 {"record_id": 123}）
+    返回: 逐条结果（逾期记录含罚款金额）
+    """
+    data = _parse_body(request)
+    if data is None:
+        return _api_error('VALIDATION_ERROR', '请求体必须是 JSON 对象')
+    record_ids, error = _parse_record_ids(data)
+    if error:
+        return _api_error('VALIDATION_ERROR', error)
+    manager = can_manage_books(request.user)
+    return _circulation_response(circulation.checkin(request.user, record_ids, _get_rule(), manager=manager))
+
+
+@require_POST
+@login_required
+@idempotent
+def renew_api(request):
+    """
+    批量续借API
+
+    URL: POST /api/renew
+    权限: 记录所属用户；admin/librarian 可续借任意记录
+    请求体: {"record_ids": [123, 124]}（兼容单条 {"record_id": 123}）
+    返回: 逐条结果（新的 due_at 与 renew_count）
+    """
+    data = _parse_body(request)
+    if data is None:
+        return _api_error('VALIDATION_ERROR', '请求体必须是 JSON 对象')
+    record_ids, error = _parse_record_ids(data)
+    if error:
+        return _api_error('VALIDATION_ERROR', error)
+    manager = can_manage_books(request.user)
+    return _circulation_response(circulation.renew(request.user, record_ids, _get_rule(), manager=manager))
+
+
+@login_required
+def desk(request):
+    """还书台页面：扫码枪连续扫入 ISBN 或借阅记录ID，批量归还并逐条显示结果"""
+    if not can_manage_books(request.user):
+        messages.error(request, '无权限访问此页面')
+        return redirect('dashboard_home')
+    return render(request, 'borrowing/desk.html', {
+        'max_items': circulation.DESK_MAX_ITEMS,
+        'group_size': circulation.DESK_GROUP_SIZE,
+    })
+
+
+@require_POST
+@login_required
+def desk_return_api(request):
+    """
+    还书台批量归还API（流式返回）
+
+    URL: POST /api/desk/return
+    权限: admin/librarian
+    请求体: {"codes": ["978-7-111-12345-3", 123, "124", ...]}（ISBN 或借阅记录ID，最多 500 项）
+    返回: application/x-ndjson，每办理完一组（一个事务）输出该组逐条结果，每行一个 JSON 对象；
+          最后一行为 {"done": true, "succeeded": n, "failed": m}
+    """
+    if not can_manage_books(request.user):
+        return _api_error('FORBIDDEN', '无权限访问此接口', status=403)
+    data = _parse_body(request)
+    if data is None:
+        return _api_error('VALIDATION_ERROR', '请求体必须是 JSON 对象')
+    codes = data.getlist('codes') if hasattr(data, 'getlist') else data.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return _api_error('VALIDATION_ERROR', 'codes 必须是非空列表')
+    if len(codes) > circulation.DESK_MAX_ITEMS:
+        return _api_error('VALIDATION_ERROR', f'单次最多办理 {circulation.DESK_MAX_ITEMS} 项')
+
+    rule = _get_rule()
+    user = request.user
+
+    def stream():
+        counts = {True: 0, False: 0}
+        for results in circulation.checkin_scans(user, codes, rule):
+            for item in results:
+                counts[item['ok']] += 1
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+        yield json.dumps({'done': True, 'succeeded': counts[True], 'failed': counts[False]}) + '\n'
+
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    # 禁止反向代理缓冲，使每组结果即时到达
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 def _check_admin_permission(user):
     """检查用户是否为管理员"""
     if not user.is_authenticated:
@@ -275,12 +578,8 @@ def overdue_management(request):
         status='overdue'
     ).select_related('user', 'book').order_by('-due_at')
     
-    # 获取即将逾期的记录（3天内到期）
-    soon_due = BorrowRecord.objects.filter(
-        status='borrowed',
-        due_at__lte=now + timezone.timedelta(days=3),
-        due_at__gt=now
-    ).select_related('user', 'book').order_by('due_at')
+    # 获取即将逾期的记录（BORROW_REMINDER_DAYS 天内到期，与到期提醒邮件一致）
+    soon_due = reminders.due_soon(now).select_related('user', 'book').order_by('due_at')
     
     # 统计信息
     total_fine = sum(record.fine_amount for record in overdue_records)
@@ -325,13 +624,15 @@ def return_overdue(request):
         return redirect('overdue_management')
     
     now = timezone.now()
+    # 按归还当天重算罚款（逾期标记时的金额只计到当时）
+    previous_fine = record.fine_amount
+    record.fine_amount = circulation.calculate_fine(record.due_at, now, _get_rule())
     record.returned_at = now
     record.status = 'returned'
     record.save()
+    ledger.write([ledger.build('returned', record, now)] + ledger.fine_changed(record, previous_fine, now))
     
-    book = record.book
-    book.available_copies += 1
-    book.save(update_fields=['available_copies'])
+    holds.release_copy(record.book_id, now)
     
     messages.success(request, f'归还成功。罚款金额: {record.fine_amount} 元')
     return redirect('overdue_management')
@@ -1,3 +1,42 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.borrowing import ledger
+from apps.borrowing.models import BorrowRecord, CirculationEvent
+from apps.library.models import Book
+
+
+class CirculationReportTests(TestCase):
+    """借阅统计读取流通事件汇总"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin1', password='testpass123', role='admin')
+        self.client.force_login(self.admin)
+        book = Book.objects.create(title='Python编程', isbn='978-7-111-12345-3', total_copies=3, available_copies=3)
+        now = timezone.now()
+        records = [
+            BorrowRecord.objects.create(user=self.admin, book=book, borrowed_at=now - timedelta(days=days),
+                                        due_at=now + timedelta(days=10))
+            for days in (0, 0, 3)
+        ]
+        ledger.write(ledger.build('borrowed', record, record.borrowed_at) for record in records)
+        ledger.log('returned', records[2], now)
+
+    def test_summary_counts_today_from_rollups(self):
+        data = self.client.get('/api/reports/summary').json()
+        self.assertEqual((data['borrows']['today_borrows'], data['borrows']['today_returns']), (2, 1))
+
+    def test_trend_reads_daily_rollups(self):
+        self.client.get('/api/reports/summary')
+        # 已汇总的事件不再读取：删除流水后趋势仍来自汇总表
+        CirculationEvent.objects.all().delete()
+        data = self.client.get('/api/reports/borrows', {'period': 'day', 'days': 7}).json()
+        self.assertEqual(data['summary']['total_borrows'], 3)
+        self.assertEqual(data['summary']['total_returns'], 1)
+        self.assertEqual(sum(item['count'] for item in data['borrow_trend']), 3)
 
-# Create your tests here.
+        weekly = self.client.get('/api/reports/borrows', {'period': 'week', 'days': 7}).json()
+        self.assertEqual(sum(item['count'] for item in weekly['borrow_trend']), 3)
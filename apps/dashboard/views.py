@@ -5,21 +5,28 @@ Dashboard数据统计视图模块
 - 图书统计：总数、可借数量、分类分布、热门图书排行
 - 用户统计：注册用户数、活跃用户数、逾期用户数、借阅量排行
 - 借阅趋势：按日/周/月聚合的借阅与归还趋势数据
+
+借阅趋势与今日借还读取流通事件的按日汇总（apps.borrowing.rollups），不回扫借阅记录
 """
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Sum, Q, F
+from django.db.models import Count, Q, F
 from django.utils import timezone
-from datetime import timedelta, datetime
-from decimal import Decimal
+from datetime import timedelta
 
-from apps.library.models import Book
+from apps.library import availability, facets
+from apps.library.models import Book, CategorySummary
+from apps.borrowing import rollups
 from apps.borrowing.models import BorrowRecord
 from apps.accounts.models import User
 
 
+# 统计接口读取前顺带汇总的事件数（一批），其余积压留给 rollup_circulation 命令
+ROLLUP_BATCH_ON_READ = 200
+
+
 def _check_admin_permission(user):
     """检查用户是否为管理员"""
     if not user.is_authenticated:
@@ -59,33 +66,28 @@ def books_statistics(request):
         }, status=403)
     
     try:
-        # 基础统计
-        total_books = Book.objects.count()
-        total_copies = Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0
-        available_copies = Book.objects.aggregate(total=Sum('available_copies'))['total'] or 0
-        borrowed_copies = total_copies - available_copies
-        
-        # 分类分布统计
-        category_stats = Book.objects.values('category').annotate(
-            count=Count('id'),
-            total_copies=Sum('total_copies'),
-            available_copies=Sum('available_copies')
-        ).order_by('-count')
+        # 基础统计与分类分布：读取增量维护的分类汇总表，不对 Book 全表聚合
+        category_stats = CategorySummary.objects.filter(book_count__gt=0).order_by('-book_count', 'category')
         
         category_distribution = [
             {
-                'category': item['category'] or '未分类',
-                'count': item['count'],
-                'total_copies': item['total_copies'],
-                'available_copies': item['available_copies']
+                'category': item.category or '未分类',
+                'count': item.book_count,
+                'total_copies': item.total_copies,
+                'available_copies': item.available_copies
             }
             for item in category_stats
         ]
         
+        total_books = sum(item['count'] for item in category_distribution)
+        total_copies = sum(item['total_copies'] for item in category_distribution)
+        available_copies = sum(item['available_copies'] for item in category_distribution)
+        borrowed_copies = total_copies - available_copies
+        
         # 热门图书排行（按借阅次数）
-        popular_books = Book.objects.annotate(
+        popular_books = availability.apply(list(Book.objects.annotate(
             borrow_count=Count('borrow_records')
-        ).order_by('-borrow_count')[:10]
+        ).order_by('-borrow_count')[:10]))
         
         popular_books_list = [
             {
@@ -228,15 +230,15 @@ def borrows_statistics(request):
         end_date = timezone.now()
         start_date = end_date - timedelta(days=days)
         
+        # 先顺带汇总积压的流通事件，再读取按日汇总表（代价与新增事件数成正比，不回扫借阅记录）
+        rollups.consume(ROLLUP_BATCH_ON_READ, max_batches=1, skip_locked=True)
+        start_day = timezone.localdate(start_date)
+        end_day = timezone.localdate(end_date)
+        daily = rollups.daily(start_day, end_day)
+
         # 基础统计
-        total_borrows = BorrowRecord.objects.filter(
-            borrowed_at__gte=start_date
-        ).count()
-        
-        total_returns = BorrowRecord.objects.filter(
-            returned_at__gte=start_date,
-            status='returned'
-        ).count()
+        total_borrows = sum(day.get('borrowed', (0, 0))[0] for day in daily.values())
+        total_returns = sum(day.get('returned', (0, 0))[0] for day in daily.values())
         
         current_borrows = BorrowRecord.objects.filter(
             status='borrowed'
@@ -246,121 +248,54 @@ def borrows_statistics(request):
             status='overdue'
         ).count()
         
-        total_fines = BorrowRecord.objects.filter(
-            fine_amount__gt=0
-        ).aggregate(total=Sum('fine_amount'))['total'] or Decimal('0.00')
+        total_fines = rollups.total('fined')[1]
         
-        # 按周期聚合借阅趋势
+        # 按周期聚合借阅趋势：周期起始日 -> 该周期内各日汇总之和
         borrow_trend = []
         return_trend = []
         
         if period == 'day':
-            # 按日统计
-            current = start_date.date()
-            end = end_date.date()
-            while current <= end:
-                day_start = timezone.make_aware(datetime.combine(current, datetime.min.time()))
-                day_end = day_start + timedelta(days=1)
-                
-                borrow_count = BorrowRecord.objects.filter(
-                    borrowed_at__gte=day_start,
-                    borrowed_at__lt=day_end
-                ).count()
-                
-                return_count = BorrowRecord.objects.filter(
-                    returned_at__gte=day_start,
-                    returned_at__lt=day_end,
-                    status='returned'
-                ).count()
-                
-                borrow_trend.append({
-                    'date': current.isoformat(),
-                    'count': borrow_count
-                })
-                
-                return_trend.append({
-                    'date': current.isoformat(),
-                    'count': return_count
-                })
-                
+            periods = []
+            current = start_day
+            while current <= end_day:
+                periods.append((current, current + timedelta(days=1)))
                 current += timedelta(days=1)
         
         elif period == 'week':
-            # 按周统计
-            current = start_date.date()
-            end = end_date.date()
-            week_start = current
-            while current <= end:
-                # 每周一作为周的开始
-                if current.weekday() == 0 or current == start_date.date():
-                    week_start = current
-                
-                # 如果是周日或者是最后一天，统计这一周
-                if current.weekday() == 6 or current == end:
-                    week_start_dt = timezone.make_aware(datetime.combine(week_start, datetime.min.time()))
-                    week_end_dt = timezone.make_aware(datetime.combine(current + timedelta(days=1), datetime.min.time()))
-                    
-                    borrow_count = BorrowRecord.objects.filter(
-                        borrowed_at__gte=week_start_dt,
-                        borrowed_at__lt=week_end_dt
-                    ).count()
-                    
-                    return_count = BorrowRecord.objects.filter(
-                        returned_at__gte=week_start_dt,
-                        returned_at__lt=week_end_dt,
-                        status='returned'
-                    ).count()
-                    
-                    borrow_trend.append({
-                        'date': week_start.isoformat(),
-                        'count': borrow_count
-                    })
-                    
-                    return_trend.append({
-                        'date': week_start.isoformat(),
-                        'count': return_count
-                    })
-                
-                current += timedelta(days=1)
+            # 每周一作为周的开始，首尾两周可能不足七天
+            periods = []
+            current = start_day
+            while current <= end_day:
+                week_end = min(current + timedelta(days=7 - current.weekday()), end_day + timedelta(days=1))
+                periods.append((current, week_end))
+                current = week_end
         
         elif period == 'month':
-            # 按月统计
-            current = start_date.date().replace(day=1)
-            end = end_date.date()
-            while current <= end:
-                month_start = current
+            periods = []
+            current = start_day.replace(day=1)
+            while current <= end_day:
                 # 计算下个月的第一天
-                if month_start.month == 12:
-                    next_month = month_start.replace(year=month_start.year + 1, month=1)
+                if current.month == 12:
+                    next_month = current.replace(year=current.year + 1, month=1)
                 else:
-                    next_month = month_start.replace(month=month_start.month + 1)
-                
-                month_start_dt = timezone.make_aware(datetime.combine(month_start, datetime.min.time()))
-                month_end_dt = timezone.make_aware(datetime.combine(next_month, datetime.min.time()))
-                
-                borrow_count = BorrowRecord.objects.filter(
-                    borrowed_at__gte=month_start_dt,
-                    borrowed_at__lt=month_end_dt
-                ).count()
-                
-                return_count = BorrowRecord.objects.filter(
-                    returned_at__gte=month_start_dt,
-                    returned_at__lt=month_end_dt,
-                    status='returned'
-                ).count()
-                
-                borrow_trend.append({
-                    'date': month_start.isoformat(),
-                    'count': borrow_count
-                })
-                
-                return_trend.append({
-                    'date': month_start.isoformat(),
-                    'count': return_count
-                })
-                
+                    next_month = current.replace(month=current.month + 1)
+                periods.append((current, next_month))
                 current = next_month
         
+        else:
+            periods = []
+        
+        for period_start, period_end in periods:
+            days_in_period = [day for day in daily if period_start <= day < period_end]
+            borrow_trend.append({
+                'date': period_start.isoformat(),
+                'count': sum(daily[day].get('borrowed', (0, 0))[0] for day in days_in_period)
+            })
+            return_trend.append({
+                'date': period_start.isoformat(),
+                'count': sum(daily[day].get('returned', (0, 0))[0] for day in days_in_period)
+            })
+        
         # 状态分布统计
         status_stats = BorrowRecord.objects.values('status').annotate(
             count=Count('id')
@@ -421,10 +356,11 @@ def dashboard_summary(request):
         }, status=403)
     
     try:
-        # 图书统计
-        total_books = Book.objects.count()
-        total_copies = Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0
-        available_copies = Book.objects.aggregate(total=Sum('available_copies'))['total'] or 0
+        # 图书统计（分类汇总表求和）
+        book_totals = facets.totals()
+        total_books = book_totals['books']
+        total_copies = book_totals['total_copies']
+        available_copies = book_totals['available_copies']
         
         # 用户统计
         total_users = User.objects.count()
@@ -437,13 +373,11 @@ def dashboard_summary(request):
         current_borrows = BorrowRecord.objects.filter(status='borrowed').count()
         overdue_count = BorrowRecord.objects.filter(status='overdue').count()
         
-        # 今日统计
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_borrows = BorrowRecord.objects.filter(borrowed_at__gte=today_start).count()
-        today_returns = BorrowRecord.objects.filter(
-            returned_at__gte=today_start,
-            status='returned'
-        ).count()
+        # 今日统计（流通事件按日汇总）
+        rollups.consume(ROLLUP_BATCH_ON_READ, max_batches=1, skip_locked=True)
+        today = rollups.daily(timezone.localdate()).get(timezone.localdate(), {})
+        today_borrows = today.get('borrowed', (0, 0))[0]
+        today_returns = today.get('returned', (0, 0))[0]
         
         return JsonResponse({
             'books': {
@@ -7,5 +7,7 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ("title", "author", "isbn", "category", "available_copies", "total_copies")
     search_fields = ("title", "author", "isbn", "category")
     list_filter = ("category",)
+    # 分段库存通过 sync_stock_stripes 命令开启/关闭，不在后台直接修改
+    readonly_fields = ("stock_stripes",)
 
 # Register your models here.
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.library'
+
+    def ready(self):
+        # 注册信号处理（检索索引维护）
+        from . import signals  # noqa: F401
@@ -0,0 +1,183 @@
+"""
+可借数量缓存层（availability overlay）
+
+目录页、图书详情等读路径从缓存读取每本书的可借数量，不再依赖借还事务正在加锁更新的 Book 行：
+- 读：按 id 批量读取缓存，缺失的用一次主键查询补齐并回填（read-through）
+- 缓存值按图书版本号分键（{前缀}:{图书 id}:{版本号}）；读取时先取版本号再查数据库，
+  回填写入读取时的版本键
+- 写：借还、整体编辑、批量导入在事务提交后递增对应图书的版本号，旧值随即不可达，并把数据库中的
+  最新值写入新版本键（write-through），随后的读取直接命中；即使读请求在提交前读到旧数据、
+  提交后才回填，写入的也是已作废的旧版本键，不会留下陈旧值；并发提交各自写入自己递增出的版本键，
+  只有最后一次递增的版本键可达，其值在该次提交之后读取
+- 版本号不过期；缓存值 TIMEOUT 秒过期；reconcile_availability 命令可核对并修正
+- 分段库存的图书（stripes.py）以各段之和为准，回填缓存时读取 StockStripe 求和
+
+多进程部署必须配置共享缓存（见 settings.CACHES 与 README）：版本号与写入的新值都在缓存中，
+使用默认的进程内缓存时只有提交借还的进程立即看到新值，其他进程最多 TIMEOUT 秒后才反映。
+"""
+import time
+from typing import Dict, Iterable, List
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import stripes
+from .models import Book
+
+
+KEY_PREFIX = 'library:availability'
+VERSION_PREFIX = 'library:availability:version'
+TIMEOUT = 60
+
+
+def _key(book_id: int, version: int) -> str:
+    return f'{KEY_PREFIX}:{book_id}:{version}'
+
+
+def _version_key(book_id: int) -> str:
+    return f'{VERSION_PREFIX}:{book_id}'
+
+
+def _initial_version() -> int:
+    # 版本号被淘汰后以当前毫秒时间戳重新开始，不会与淘汰前的版本键重合
+    return time.time_ns() // 1_000_000
+
+
+def _versions(book_ids: List[int]) -> Dict[int, int]:
+    """批量读取版本号，缺失的初始化（add 不覆盖并发初始化或递增的值）"""
+    keys = {book_id: _version_key(book_id) for book_id in book_ids}
+    cached = cache.get_many(list(keys.values()))
+    missing = [book_id for book_id, key in keys.items() if key not in cached]
+    if missing:
+        initial = _initial_version()
+        for book_id in missing:
+            cache.add(keys[book_id], initial, None)
+        cached.update(cache.get_many([keys[book_id] for book_id in missing]))
+    return {book_id: cached.get(key, 0) for book_id, key in keys.items()}
+
+
+def _load(book_ids) -> Dict[int, int]:
+    """从数据库读取可借数量：普通图书读 Book 行，分段库存的图书读各段之和"""
+    rows = Book.objects.filter(id__in=list(book_ids)).values_list('id', 'available_copies', 'stock_stripes')
+    result = {}
+    striped = []
+    for book_id, available, stripe_count in rows:
+        result[book_id] = available
+        if stripe_count:
+            striped.append(book_id)
+    if striped:
+        result.update(stripes.totals(striped))
+    return result
+
+
+def get_many(book_ids: Iterable[int]) -> Dict[int, int]:
+    """批量读取可借数量，缺失项从数据库补齐并回填缓存"""
+    book_ids = list(set(book_ids))
+    if not book_ids:
+        return {}
+    # 先取版本号再读数据库：读数据库期间有写入提交时，回填的是已作废的版本键
+    versions = _versions(book_ids)
+    keys = {book_id: _key(book_id, version) for book_id, version in versions.items()}
+    cached = cache.get_many(list(keys.values()))
+    result = {book_id: cached[key] for book_id, key in keys.items() if key in cached}
+    missing = [book_id for book_id in keys if book_id not in result]
+    if missing:
+        fresh = _load(missing)
+        cache.set_many({keys[book_id]: available for book_id, available in fresh.items()}, TIMEOUT)
+        result.update(fresh)
+    return result
+
+
+def get(book_id: int) -> int:
+    return get_many([book_id]).get(book_id, 0)
+
+
+def apply(books: List[Book]) -> List[Book]:
+    """用缓存中的可借数量覆盖图书对象的 available_copies（就地修改并返回原列表）"""
+    available = get_many(book.id for book in books)
+    for book in books:
+        if book.id in available:
+            book.available_copies = available[book.id]
+    return books
+
+
+def invalidate(book_ids: Iterable[int]) -> None:
+    """递增版本号使缓存值作废；版本号缺失时不处理（下次读取会以新的时间戳初始化）"""
+    for book_id in set(book_ids):
+        try:
+            cache.incr(_version_key(book_id))
+        except ValueError:
+            pass
+
+
+def invalidate_on_commit(book_ids: Iterable[int]) -> None:
+    """事务提交后再使缓存作废，回滚的借还与编辑不会影响缓存"""
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: invalidate(book_ids))
+
+
+def write_through(book_ids: Iterable[int]) -> None:
+    """递增版本号，并把数据库中的最新值写入新版本键；版本号缺失时只等下次读取初始化"""
+    versions = {}
+    for book_id in set(book_ids):
+        try:
+            versions[book_id] = cache.incr(_version_key(book_id))
+        except ValueError:
+            pass
+    if versions:
+        # 递增之后再读数据库：读到的值不早于本次提交
+        fresh = _load(versions)
+        cache.set_many({_key(book_id, versions[book_id]): available for book_id, available in fresh.items()}, TIMEOUT)
+
+
+def write_through_on_commit(book_ids: Iterable[int]) -> None:
+    """事务提交后写入最新可借数量，回滚的借还与编辑不会影响缓存"""
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: write_through(book_ids))
+
+
+def reconcile(batch_size: int = 1000, fix: bool = True) -> Dict:
+    """
+    核对缓存与数据库的可借数量
+
+    Returns:
+        {'checked': 缓存中存在的条目数, 'mismatched': 不一致数, 'samples': 前 20 条不一致明细}
+    """
+    checked = 0
+    mismatched = 0
+    samples = []
+    batch = []
+
+    def flush(rows):
+        nonlocal checked, mismatched
+        striped = stripes.totals([book_id for book_id, available, stripe_count in rows if stripe_count])
+        rows = [(book_id, striped.get(book_id, available)) for book_id, available, _ in rows]
+        versions = cache.get_many([_version_key(book_id) for book_id, _ in rows])
+        keys = {
+            book_id: _key(book_id, versions[_version_key(book_id)])
+            for book_id, _ in rows if _version_key(book_id) in versions
+        }
+        cached = cache.get_many(list(keys.values()))
+        fixes = {}
+        for book_id, available in rows:
+            key = keys.get(book_id)
+            if key not in cached:
+                continue
+            checked += 1
+            if cached[key] != available:
+                mismatched += 1
+                if len(samples) < 20:
+                    samples.append({'book_id': book_id, 'cached': cached[key], 'actual': available})
+                fixes[key] = available
+        if fix and fixes:
+            cache.set_many(fixes, TIMEOUT)
+
+    rows = Book.objects.order_by('id').values_list('id', 'available_copies', 'stock_stripes')
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return {'checked': checked, 'mismatched': mismatched, 'samples': samples}
@@ -0,0 +1,47 @@
+"""
+目录版本号
+
+图书新增、修改、删除与批量导入后（事务提交时）递增一行 CatalogVersion 的版本号，
+检索结果缓存、模糊检索文档频次、联想索引与图书 API 的 ETag 都以它判断目录是否变化：
+- 版本号存于数据库而非缓存，各工作进程无论使用何种缓存后端都能看到同一个值
+- 读取是一次按唯一键的单行查询；递增是一条 UPDATE ... SET generation = generation + 1
+- updated_at 记录最近一次递增的时间，删除图书后也会前移，可作为 Last-Modified
+"""
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion
+
+
+VERSION_NAME = 'catalog'
+
+
+def get_version() -> Tuple[int, Optional[object]]:
+    """(版本号, 最近递增时间)，从未递增过时为 (0, None)"""
+    row = CatalogVersion.objects.filter(name=VERSION_NAME).values_list('generation', 'updated_at').first()
+    return row or (0, None)
+
+
+def get_generation() -> int:
+    return get_version()[0]
+
+
+def bump() -> None:
+    """递增版本号"""
+    now = timezone.now()
+    if CatalogVersion.objects.filter(name=VERSION_NAME).update(generation=F('generation') + 1, updated_at=now):
+        return
+    try:
+        with transaction.atomic():
+            CatalogVersion.objects.create(name=VERSION_NAME, generation=1, updated_at=now)
+    except IntegrityError:
+        # 并发的另一进程刚创建了该行
+        CatalogVersion.objects.filter(name=VERSION_NAME).update(generation=F('generation') + 1, updated_at=now)
+
+
+def bump_on_commit() -> None:
+    """事务提交后再递增，避免并发请求在提交前用旧数据重新填充缓存"""
+    transaction.on_commit(bump)
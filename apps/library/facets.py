@@ -0,0 +1,146 @@
+"""
+分类汇总（分面统计）模块
+
+维护 CategorySummary 物化汇总表，避免每次统计都对 Book 全表 GROUP BY：
+- Book 加载时记录分类/馆藏/可借数量快照，保存/删除后按差值增量更新对应分类行
+- 借还只更新 available_copies，同样以差值方式更新
+- 增量更新在事务提交后执行（on_commit），不在借还事务中持有分类行锁
+- 批量导入等绕过 save() 的写入，按受影响分类重新聚合
+- rebuild() 全量重建，用于部署初始化或核对
+"""
+from typing import Iterable, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Book, CategorySummary
+
+
+FACET_FIELDS = ('category', 'total_copies', 'available_copies')
+
+# (分类, 馆藏总数, 可借数量)
+State = Tuple[str, int, int]
+
+
+def snapshot(book: Book) -> Optional[State]:
+    """读取图书当前的汇总相关字段；存在延迟加载字段时返回 None（避免触发额外查询）"""
+    if any(field not in book.__dict__ for field in FACET_FIELDS):
+        return None
+    return book.category or '', book.total_copies, book.available_copies
+
+
+def state_after_save(book: Book, old: State, update_fields=None) -> State:
+    """保存后的状态：update_fields 之外的字段未写入数据库，沿用旧值"""
+    values = []
+    for field, previous in zip(FACET_FIELDS, old):
+        if update_fields is not None and field not in update_fields:
+            values.append(previous)
+        elif field == 'category':
+            values.append(book.category or '')
+        else:
+            values.append(getattr(book, field))
+    return tuple(values)
+
+
+def apply_delta(category: str, books: int = 0, total: int = 0, available: int = 0) -> None:
+    """按差值更新单个分类的汇总行，分类行不存在时创建"""
+    if not (books or total or available):
+        return
+    category = category or ''
+    updated = CategorySummary.objects.filter(category=category).update(
+        book_count=F('book_count') + books,
+        total_copies=F('total_copies') + total,
+        available_copies=F('available_copies') + available,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            CategorySummary.objects.create(
+                category=category, book_count=books, total_copies=total, available_copies=available
+            )
+    except IntegrityError:
+        # 并发创建同一分类，改为差值更新
+        apply_delta(category, books, total, available)
+
+
+def apply_delta_on_commit(category: str, books: int = 0, total: int = 0, available: int = 0) -> None:
+    """事务提交后再更新汇总行，回滚的借还不会影响汇总"""
+    transaction.on_commit(lambda: apply_delta(category, books, total, available))
+
+
+def record_change(old: Optional[State], new: Optional[State]) -> None:
+    """根据图书变更前后的状态登记汇总差值（old 为 None 表示新建，new 为 None 表示删除）"""
+    if old is not None and new is not None and old[0] == new[0]:
+        apply_delta_on_commit(new[0], 0, new[1] - old[1], new[2] - old[2])
+        return
+    if old is not None:
+        apply_delta_on_commit(old[0], -1, -old[1], -old[2])
+    if new is not None:
+        apply_delta_on_commit(new[0], 1, new[1], new[2])
+
+
+def refresh_categories(categories: Iterable[str]) -> None:
+    """按分类重新聚合（走 category 索引），用于批量写入之后"""
+    categories = {category or '' for category in categories}
+    if not categories:
+        return
+    rows = {
+        row['category']: row
+        for row in Book.objects.filter(category__in=categories).values('category').annotate(
+            book_count=Count('id'),
+            total=Sum('total_copies'),
+            available=Sum('available_copies'),
+        )
+    }
+    with transaction.atomic():
+        for category in categories:
+            row = rows.get(category)
+            if row is None:
+                CategorySummary.objects.filter(category=category).delete()
+                continue
+            CategorySummary.objects.update_or_create(
+                category=category,
+                defaults={
+                    'book_count': row['book_count'],
+                    'total_copies': row['total'] or 0,
+                    'available_copies': row['available'] or 0,
+                },
+            )
+
+
+def rebuild() -> int:
+    """全量重建分类汇总表，返回分类数"""
+    rows = Book.objects.values('category').annotate(
+        book_count=Count('id'),
+        total=Sum('total_copies'),
+        available=Sum('available_copies'),
+    ).order_by()
+    summaries = [
+        CategorySummary(
+            category=row['category'] or '',
+            book_count=row['book_count'],
+            total_copies=row['total'] or 0,
+            available_copies=row['available'] or 0,
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        CategorySummary.objects.all().delete()
+        CategorySummary.objects.bulk_create(summaries)
+    return len(summaries)
+
+
+def top_categories(limit: int = 20):
+    """目录页分类筛选项：按图书数倒序"""
+    return CategorySummary.objects.filter(book_count__gt=0).order_by('-book_count', 'category')[:limit]
+
+
+def totals() -> dict:
+    """全馆汇总：图书总数、馆藏总数、可借数量（对分类汇总表求和）"""
+    result = CategorySummary.objects.aggregate(
+        books=Sum('book_count'),
+        total_copies=Sum('total_copies'),
+        available_copies=Sum('available_copies'),
+    )
+    return {key: value or 0 for key, value in result.items()}
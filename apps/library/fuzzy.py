@@ -0,0 +1,235 @@
+"""
+图书模糊检索模块
+
+基于 BookTrigram 三元组索引实现容错检索，处理作者名拼写错误、英文书名只输入一部分等
+倒排索引无法命中的查询：
+- 切分：书名/作者规范化后按单词切分，每个单词前补两个空格、后补一个空格，按 3 字符滑动切分
+  （与 PostgreSQL pg_trgm 的规则一致，中文按字符同样适用）
+- 相似度：查询三元组在某本书某字段中命中的比例（同 pg_trgm 的 word_similarity），
+  同分时按 Jaccard 相似度（命中数 / 两者并集）排序
+- 查询：只用普通 GROUP BY + HAVING，MySQL 与 SQLite 均可执行；WHERE 阶段按 gram_count
+  下界、HAVING 阶段按命中数下界剪枝，低于阈值的候选不参与排序
+- 高频三元组剪枝：按文档频次先用最罕见的三元组圈定候选，高频三元组
+  （如 "  s"、"ing"）只在候选图书范围内计数，避免扫描其全部索引行
+- 文档频次缓存 1 小时，缓存键带目录版本号（apps.library.catalog）：图书增删改、批量导入后
+  版本号递增，旧频次不再使用，新书立即参与剪枝
+- 索引：Book 保存时由信号增量维护，可通过 rebuild_search_index 命令全量重建
+"""
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Value
+from django.db.models.functions import Cast
+
+from . import catalog
+from .models import Book, BookTrigram
+from .search import _normalize
+
+
+# 参与模糊检索的字段
+FUZZY_FIELDS = ('title', 'author')
+
+DEFAULT_THRESHOLD = 0.5
+MAX_QUERY_GRAMS = 64
+MAX_RESULTS = 100
+# 候选阶段计划扫描的索引行数（按文档频次估算）
+ROW_BUDGET = 20000
+DF_CACHE_TIMEOUT = 3600
+DF_KEY_PREFIX = 'library:fuzzy:df'
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def get_threshold() -> float:
+    """相似度阈值（0~1），越高越严格"""
+    return getattr(settings, 'LIBRARY_FUZZY_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def trigrams(text: str) -> List[str]:
+    """
+    切分字符三元组（去重，保持出现顺序）
+
+    Example:
+        >>> trigrams('Deep')
+        ['  d', ' de', 'dee', 'eep', 'ep ']
+    """
+    grams = []
+    seen = set()
+    for word in _WORD_RE.findall(_normalize(text)):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            if gram not in seen:
+                seen.add(gram)
+                grams.append(gram)
+    return grams
+
+
+def build_trigrams(book: Book) -> List[BookTrigram]:
+    """生成单本图书的全部三元组行（未入库）"""
+    rows = []
+    for field in FUZZY_FIELDS:
+        grams = trigrams(getattr(book, field) or '')
+        rows.extend(
+            BookTrigram(book_id=book.pk, gram=gram, field=field, gram_count=len(grams))
+            for gram in grams
+        )
+    return rows
+
+
+def reindex_books(books: Iterable[Book]) -> int:
+    """重建指定图书的三元组索引，返回写入行数"""
+    books = list(books)
+    if not books:
+        return 0
+    rows = []
+    for book in books:
+        rows.extend(build_trigrams(book))
+    with transaction.atomic():
+        BookTrigram.objects.filter(book_id__in=[book.pk for book in books]).delete()
+        BookTrigram.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def index_book(book: Book) -> int:
+    """重建单本图书的三元组索引"""
+    return reindex_books([book])
+
+
+def rebuild_index(batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    全量重建三元组索引
+
+    Returns:
+        (图书数, 三元组行数)
+    """
+    book_count = 0
+    gram_count = 0
+    with transaction.atomic():
+        BookTrigram.objects.all().delete()
+        batch = []
+        books = Book.objects.only('id', *FUZZY_FIELDS).order_by('id').iterator(chunk_size=batch_size)
+        for book in books:
+            batch.extend(build_trigrams(book))
+            book_count += 1
+            if len(batch) >= batch_size:
+                BookTrigram.objects.bulk_create(batch, batch_size=batch_size)
+                gram_count += len(batch)
+                batch = []
+        if batch:
+            BookTrigram.objects.bulk_create(batch, batch_size=batch_size)
+            gram_count += len(batch)
+    return book_count, gram_count
+
+
+def _df_key(prefix: str, generation: int, gram: str) -> str:
+    # 三元组可能含空格，缓存键使用十六进制编码
+    return f'{prefix}:{generation}:{gram.encode("utf-8").hex()}'
+
+
+def gram_frequencies(grams: List[str], key_prefix: str = DF_KEY_PREFIX) -> Dict[str, int]:
+    """
+    三元组文档频次（索引行数），优先读取缓存，缺失的用一次 GROUP BY 补齐
+
+    Args:
+        key_prefix: 缓存键前缀；基准测试等临时数据使用自己的前缀，不污染正式的频次缓存
+    """
+    generation = catalog.get_generation()
+    keys = {gram: _df_key(key_prefix, generation, gram) for gram in grams}
+    cached = cache.get_many(list(keys.values()))
+    result = {gram: cached[key] for gram, key in keys.items() if key in cached}
+    missing = [gram for gram in grams if gram not in result]
+    if missing:
+        counted = dict(
+            BookTrigram.objects.filter(gram__in=missing).values_list('gram').annotate(n=Count('id')).order_by()
+        )
+        fresh = {gram: counted.get(gram, 0) for gram in missing}
+        cache.set_many({keys[gram]: n for gram, n in fresh.items()}, DF_CACHE_TIMEOUT)
+        result.update(fresh)
+    return result
+
+
+def search_book_ids(q: str, category: Optional[str] = None, threshold: Optional[float] = None,
+                    limit: int = MAX_RESULTS, df_key_prefix: str = DF_KEY_PREFIX) -> List[Dict]:
+    """
+    模糊检索图书，返回按相似度排序的 [{'book_id', 'score'}]（同一本书只保留得分最高的字段）
+
+    分两步执行，结果与对全部查询三元组直接 GROUP BY 一致：
+    1. 候选：相似度达到阈值需命中 min_shared 个三元组，按抽屉原理，其中至少 need 个落在
+       文档频次最低的 k 个三元组中；只扫描这 k 个三元组的索引行（累计行数受 ROW_BUDGET 约束）
+    2. 精算：仅对候选图书统计全部查询三元组的命中数并计算相似度（候选以子查询传入，不截断）
+
+    Args:
+        q: 查询串
+        category: 分类筛选
+        threshold: 相似度阈值，None 表示使用 LIBRARY_FUZZY_THRESHOLD
+        limit: 最多返回的图书数
+        df_key_prefix: 文档频次缓存键前缀（见 gram_frequencies）
+    """
+    grams = trigrams(q)[:MAX_QUERY_GRAMS]
+    if not grams:
+        return []
+    if threshold is None:
+        threshold = get_threshold()
+    total = len(grams)
+    # 命中比例不低于阈值，则命中数与该字段三元组总数都至少为 min_shared
+    min_shared = max(1, math.ceil(threshold * total - 1e-9))
+
+    frequencies = gram_frequencies(grams, df_key_prefix)
+    # 索引中不存在的三元组（多为拼写错误产生）不可能命中，只计入分母
+    present = sorted((gram for gram in grams if frequencies[gram]), key=lambda gram: frequencies[gram])
+    if len(present) < min_shared:
+        return []
+
+    k = len(present) - min_shared + 1
+    scanned = sum(frequencies[gram] for gram in present[:k])
+    while k < len(present) and scanned + frequencies[present[k]] <= ROW_BUDGET:
+        scanned += frequencies[present[k]]
+        k += 1
+    need = min_shared - (len(present) - k)
+
+    rows = BookTrigram.objects.filter(gram_count__gte=min_shared)
+    if category:
+        rows = rows.filter(book__category=category)
+    if k < len(present):
+        # 候选数不超过扫描的行数（受 ROW_BUDGET 约束）；作为子查询嵌入精算查询，不截断，
+        # 因而结果与全量计数一致（MySQL 不支持 IN 子查询中的 LIMIT）
+        candidates = (
+            rows.filter(gram__in=present[:k])
+            .values('book_id', 'field')
+            .annotate(hits=Count('id'))
+            .filter(hits__gte=need)
+            .values_list('book_id', flat=True)
+            .order_by()
+        )
+        rows = rows.filter(book_id__in=candidates)
+
+    shared = Cast(Count('id'), FloatField())
+    rows = (
+        rows
+        .filter(gram__in=present)
+        .values('book_id', 'field')
+        .annotate(
+            shared=Count('id'),
+            score=shared / Value(float(total)),
+            jaccard=shared / (Value(float(total)) + Cast(Max('gram_count') - Count('id'), FloatField())),
+        )
+        .filter(shared__gte=min_shared)
+        .order_by('-score', '-jaccard', F('book_id').desc())
+    )
+
+    results = []
+    seen = set()
+    # 每本书最多两行（书名/作者），多取一倍以便去重后仍有 limit 条
+    for row in rows[:limit * len(FUZZY_FIELDS)]:
+        if row['book_id'] in seen:
+            continue
+        seen.add(row['book_id'])
+        results.append({'book_id': row['book_id'], 'score': round(row['score'], 4)})
+        if len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,247 @@
+"""
+图书批量导入模块
+
+流式读取 CSV/Excel 文件并按批次写入数据库：
+- 逐行读取上传文件，不整体载入内存，百万行文件内存占用保持平稳
+- 每批先校验（ISBN 整列批量校验）再以 bulk_create(update_conflicts=True) 按 ISBN 合并写入（存在则更新，否则创建）
+- 统计 created/updated/skipped 数量并记录逐行错误（错误明细条数有上限）
+
+供 POST /api/books/import 接口与 import_books 管理命令共用。
+"""
+import csv
+import io
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.utils.xss_protection import clean_input
+from .isbn import validate_isbn13_batch
+from .models import Book
+from .signals import books_bulk_changed
+
+
+IMPORT_COLUMNS = ('title', 'author', 'isbn', 'publisher', 'category', 'total_copies')
+REQUIRED_COLUMNS = ('title', 'isbn')
+
+# 文本字段及其最大长度（与 Book 模型保持一致）
+TEXT_FIELDS = {
+    'title': 200,
+    'author': 120,
+    'publisher': 120,
+    'category': 80,
+}
+
+# 合并写入时更新的字段（created_at 保持首次导入时间）
+UPSERT_FIELDS = ['title', 'author', 'publisher', 'category', 'total_copies', 'available_copies', 'updated_at']
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    """文件格式错误（无法识别的文件类型、缺少必需列等），整体拒绝导入"""
+
+
+class ImportResult:
+    """导入结果统计"""
+
+    def __init__(self, max_errors: int = MAX_REPORTED_ERRORS):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[Dict] = []
+        self.max_errors = max_errors
+
+    def add_error(self, row: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'message': message})
+
+    def as_dict(self) -> Dict:
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def _to_text(value) -> str:
+    """单元格值转文本：Excel 中的整数可能以 float 形式读出"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _check_header(header: Iterable[str]) -> List[str]:
+    columns = [_to_text(name).lower() for name in header]
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ImportFormatError(f'缺少必需列: {", ".join(missing)}')
+    return columns
+
+
+def iter_csv_rows(fileobj) -> Iterator[Dict[str, str]]:
+    """逐行读取 CSV（支持带 BOM 的 UTF-8）"""
+    if isinstance(fileobj, io.TextIOBase):
+        text = fileobj
+    else:
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        columns = _check_header(next(reader))
+    except StopIteration:
+        raise ImportFormatError('文件为空')
+    except UnicodeDecodeError:
+        raise ImportFormatError('CSV 文件必须使用 UTF-8 编码')
+    try:
+        for values in reader:
+            yield dict(zip(columns, values))
+    except UnicodeDecodeError:
+        raise ImportFormatError('CSV 文件必须使用 UTF-8 编码')
+
+
+def iter_excel_rows(fileobj) -> Iterator[Dict[str, str]]:
+    """以只读模式逐行读取 Excel 首个工作表（需要 openpyxl）"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError('导入 Excel 文件需要安装 openpyxl')
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        try:
+            columns = _check_header(next(rows))
+        except StopIteration:
+            raise ImportFormatError('文件为空')
+        for values in rows:
+            yield {name: _to_text(value) for name, value in zip(columns, values)}
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename: str) -> Iterator[Dict[str, str]]:
+    """根据扩展名选择读取方式"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.csv':
+        return iter_csv_rows(fileobj)
+    if ext in ('.xlsx', '.xlsm'):
+        return iter_excel_rows(fileobj)
+    raise ImportFormatError('仅支持 CSV 或 Excel（.xlsx）文件')
+
+
+class BookImporter:
+    """
+    图书批量导入器
+
+    Example:
+        >>> importer = BookImporter(batch_size=1000)
+        >>> result = importer.run(iter_rows(fileobj, 'books.csv'))
+        >>> result.as_dict()
+        {'created': 98, 'updated': 2, 'skipped': 1, 'error_count': 0, 'errors': []}
+    """
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, max_errors: int = MAX_REPORTED_ERRORS):
+        self.batch_size = batch_size
+        self.result = ImportResult(max_errors=max_errors)
+
+    def run(self, rows: Iterable[Dict[str, str]]) -> ImportResult:
+        batch: List[Tuple[int, Dict[str, str]]] = []
+        # 第 1 行为表头，数据行号从 2 开始
+        for row_no, row in enumerate(rows, start=2):
+            if not any(_to_text(value) for value in row.values()):
+                self.result.skipped += 1
+                continue
+            batch.append((row_no, row))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.result
+
+    def _clean_row(self, row: Dict[str, str], isbn_error: Optional[str]) -> Tuple[Optional[Dict], Optional[str]]:
+        """校验并清理单行，返回 (数据, 错误信息)；ISBN 已在批次级别校验"""
+        data = {}
+        for field, max_length in TEXT_FIELDS.items():
+            value = _to_text(row.get(field))
+            if len(value) > max_length:
+                return None, f'{field} 长度不能超过 {max_length}'
+            data[field] = clean_input(value, max_length=max_length)
+        if not data['title']:
+            return None, '书名不能为空'
+
+        if isbn_error:
+            return None, isbn_error
+        data['isbn'] = _to_text(row.get('isbn'))
+
+        copies_raw = _to_text(row.get('total_copies'))
+        if copies_raw:
+            try:
+                data['total_copies'] = int(copies_raw)
+            except ValueError:
+                return None, 'total_copies 必须是整数'
+            if data['total_copies'] < 0:
+                return None, 'total_copies 不能为负数'
+        else:
+            data['total_copies'] = 1
+        return data, None
+
+    def _flush(self, batch: List[Tuple[int, Dict[str, str]]]) -> None:
+        _, isbn_errors = validate_isbn13_batch([_to_text(row.get('isbn')) for _, row in batch])
+        cleaned: Dict[str, Dict] = {}
+        for (row_no, row), isbn_error in zip(batch, isbn_errors):
+            data, error = self._clean_row(row, isbn_error)
+            if error:
+                self.result.add_error(row_no, error)
+                continue
+            if data['isbn'] in cleaned:
+                self.result.add_error(row_no, 'ISBN 重复')
+                continue
+            cleaned[data['isbn']] = data
+        if not cleaned:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            # 锁定本批已存在的图书，按馆藏变化量调整可借数量，避免与借还并发冲突
+            existing = {
+                book.isbn: book
+                for book in Book.objects.select_for_update().filter(isbn__in=list(cleaned)).only(
+                    'id', 'isbn', 'title', 'author', 'publisher', 'category', 'total_copies', 'available_copies'
+                )
+            }
+            to_write = []
+            for isbn, data in cleaned.items():
+                book = existing.get(isbn)
+                if book is None:
+                    data['available_copies'] = data['total_copies']
+                    self.result.created += 1
+                elif all(getattr(book, field) == data[field] for field in ('total_copies', *TEXT_FIELDS)):
+                    self.result.skipped += 1
+                    continue
+                else:
+                    delta = data['total_copies'] - book.total_copies
+                    data['available_copies'] = max(0, book.available_copies + delta)
+                    self.result.updated += 1
+                to_write.append(Book(created_at=now, updated_at=now, **data))
+
+            if not to_write:
+                return
+            unique_fields = ['isbn'] if connection.features.supports_update_conflicts_with_target else None
+            Book.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=UPSERT_FIELDS,
+            )
+            # bulk_create 不触发 post_save，通知检索索引等派生数据刷新
+            book_ids = list(Book.objects.filter(isbn__in=[book.isbn for book in to_write]).values_list('id', flat=True))
+            old_categories = {book.category for book in existing.values()}
+            books_bulk_changed.send(sender=Book, book_ids=book_ids, categories=old_categories)
@@ -0,0 +1,170 @@
+"""
+模糊检索性能基准管理命令
+
+用法：
+    python manage.py benchmark_fuzzy_search [--count 500000] [--queries 200] [--threshold 0.5] [--keep]
+
+功能：
+    - 在事务中批量生成 count 本合成图书（英文书名 + 作者名）并构建三元组索引
+    - 随机抽取图书，对书名/作者制造拼写错误或截取部分单词作为查询
+    - 统计 fuzzy.search_book_ids 的延迟分位数（p50/p95/p99/最大）与召回率（目标图书出现在结果中的比例）
+    - 默认结束后回滚，不留下测试数据；--count 0 表示直接使用现有馆藏
+    - 文档频次缓存使用本次运行独有的键前缀，回滚的基准数据不会留在正式检索使用的频次缓存中
+    - 使用 --keep 保留数据时，需再执行 rebuild_search_index 与 rebuild_category_summary
+
+数据量较大时生成与建索引耗时较长，建议在独立的测试库上执行
+"""
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.library import fuzzy
+from apps.library.isbn import make_isbn
+from apps.library.models import Book
+
+
+WORDS = (
+    'deep', 'learning', 'python', 'data', 'analysis', 'machine', 'introduction', 'algorithms',
+    'modern', 'operating', 'systems', 'computer', 'networks', 'database', 'design', 'patterns',
+    'distributed', 'programming', 'language', 'theory', 'practice', 'statistics', 'linear',
+    'algebra', 'calculus', 'physics', 'chemistry', 'biology', 'economics', 'history', 'principles',
+    'structure', 'interpretation', 'artificial', 'intelligence', 'compilers', 'graphics', 'security',
+)
+FIRST_NAMES = (
+    'ian', 'eric', 'wes', 'thomas', 'andrew', 'donald', 'robert', 'martin', 'brian', 'dennis',
+    'james', 'william', 'richard', 'linda', 'barbara', 'susan', 'michael', 'david', 'joseph', 'charles',
+)
+LAST_NAMES = (
+    'goodfellow', 'matthes', 'mckinney', 'cormen', 'tanenbaum', 'knuth', 'sedgewick', 'fowler',
+    'kernighan', 'ritchie', 'stallings', 'silberschatz', 'kurose', 'abelson', 'norvig', 'russell',
+    'aho', 'hennessy', 'patterson', 'stroustrup',
+)
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+SYLLABLES = (
+    'ka', 'lo', 'mi', 'ren', 'sto', 'vel', 'dar', 'ion', 'ter', 'gra', 'phy', 'lin', 'qua', 'mor',
+    'sen', 'tri', 'bel', 'cor', 'dex', 'fin', 'hal', 'jor', 'nes', 'pol', 'rus', 'tam', 'vin', 'zel',
+)
+
+
+def _vocabulary(rng: random.Random, base, size: int):
+    """在常用词基础上补充随机音节词，使三元组分布接近真实馆藏（而不是少数词反复出现）"""
+    words = set(base)
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class _Rollback(Exception):
+    """用于回滚基准数据"""
+
+
+def _typo(rng: random.Random, word: str) -> str:
+    """对单词制造一处拼写错误：删除、替换、交换相邻字符之一"""
+    if len(word) < 4:
+        return word
+    pos = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return word[:pos] + word[pos + 1:]
+    if kind == 1:
+        return word[:pos] + rng.choice(LETTERS) + word[pos + 1:]
+    return word[:pos - 1] + word[pos] + word[pos - 1] + word[pos + 1:]
+
+
+def _make_query(rng: random.Random, title: str, author: str) -> str:
+    if rng.random() < 0.5:
+        # 作者名拼写错误
+        return ' '.join(_typo(rng, word) for word in author.split())
+    words = title.split()
+    if rng.random() < 0.5 and len(words) > 2:
+        # 只输入书名的一部分
+        start = rng.randrange(len(words) - 1)
+        return ' '.join(words[start:start + 2])
+    return ' '.join(_typo(rng, word) if rng.random() < 0.5 else word for word in words)
+
+
+class Command(BaseCommand):
+    help = '模糊检索延迟基准'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500000, help='生成的图书数量（默认 500000，0 表示使用现有馆藏）')
+        parser.add_argument('--queries', type=int, default=200, help='查询次数（默认 200）')
+        parser.add_argument('--threshold', type=float, default=None, help='相似度阈值（默认取 LIBRARY_FUZZY_THRESHOLD）')
+        parser.add_argument('--batch-size', type=int, default=5000, help='批量写入大小（默认 5000）')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+        parser.add_argument('--keep', action='store_true', help='保留生成的数据（默认回滚）')
+
+    def _seed(self, rng, count, batch_size):
+        words = _vocabulary(rng, WORDS, 5000)
+        last_names = _vocabulary(rng, LAST_NAMES, 3000)
+        start = (Book.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        started = time.monotonic()
+        batch = []
+        for seq in range(start, start + count):
+            title = ' '.join(rng.sample(words, rng.randint(2, 5)))
+            author = f'{rng.choice(FIRST_NAMES)} {rng.choice(last_names)}'
+            batch.append(Book(
+                title=title, author=author, isbn=make_isbn(seq), publisher='基准测试出版社',
+                category='基准测试', total_copies=1, available_copies=1,
+            ))
+            if len(batch) >= batch_size:
+                Book.objects.bulk_create(batch, batch_size=batch_size)
+                batch = []
+        if batch:
+            Book.objects.bulk_create(batch, batch_size=batch_size)
+        self.stdout.write(f'生成图书：{count} 本，耗时 {time.monotonic() - started:.1f} 秒')
+
+        started = time.monotonic()
+        book_count, gram_count = fuzzy.rebuild_index(batch_size=batch_size)
+        self.stdout.write(
+            f'构建三元组索引：{book_count} 本图书，{gram_count} 个三元组，耗时 {time.monotonic() - started:.1f} 秒'
+        )
+
+    def _run(self, rng, options):
+        if options['count'] > 0:
+            self._seed(rng, options['count'], options['batch_size'])
+
+        ids = list(Book.objects.values_list('id', flat=True))
+        if not ids:
+            self.stdout.write(self.style.WARNING('馆藏为空，无法测试'))
+            return
+        targets = Book.objects.in_bulk(rng.sample(ids, min(options['queries'], len(ids))))
+
+        latencies = []
+        found = 0
+        df_key_prefix = f'{fuzzy.DF_KEY_PREFIX}:benchmark:{uuid.uuid4().hex}'
+        for book in targets.values():
+            query = _make_query(rng, book.title, book.author)
+            started = time.perf_counter()
+            rows = fuzzy.search_book_ids(query, threshold=options['threshold'], df_key_prefix=df_key_prefix)
+            latencies.append((time.perf_counter() - started) * 1000)
+            # 同名作者/同名书名的其他图书同样算命中
+            matched = Book.objects.filter(id__in=[row['book_id'] for row in rows]).values_list('title', 'author')
+            found += any(title == book.title or author == book.author for title, author in matched)
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        self.stdout.write(
+            f'查询 {len(latencies)} 次：p50 {percentile(0.5):.1f} ms，p95 {percentile(0.95):.1f} ms，'
+            f'p99 {percentile(0.99):.1f} ms，最大 {latencies[-1]:.1f} ms，平均 {statistics.mean(latencies):.1f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 召回率：{found}/{len(latencies)}（{found / len(latencies):.1%}），馆藏 {len(ids)} 本'
+        ))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                self._run(rng, options)
+                if not options['keep'] and options['count'] > 0:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write('已回滚生成的基准数据')
@@ -0,0 +1,92 @@
+"""
+ISBN 校验性能基准管理命令
+
+用法：
+    python manage.py benchmark_isbn [--count 100000] [--invalid-ratio 0.1] [--repeat 3]
+
+功能：
+    - 随机生成一列 ISBN（按比例混入校验位/格式错误的值）
+    - 分别用逐个校验（validate_isbn13）与批量校验（validate_isbn13_batch）计时
+    - 核对两种方式的结果完全一致，输出吞吐量与加速比
+
+不访问数据库，可在任意环境运行
+"""
+import random
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.library.isbn import make_isbn, np, validate_isbn13_batch
+from apps.library.models import validate_isbn13
+
+
+def _corrupt(rng: random.Random, value: str) -> str:
+    if rng.random() < 0.5:
+        # 修改校验位
+        return value[:-1] + str((int(value[-1]) + 1) % 10)
+    # 破坏格式
+    return value.replace('-', '', 1)
+
+
+def _per_row(values):
+    reasons = []
+    for value in values:
+        try:
+            validate_isbn13(value)
+            reasons.append(None)
+        except ValidationError as e:
+            reasons.append(e.messages[0])
+    return reasons
+
+
+class Command(BaseCommand):
+    help = '对比逐个与批量 ISBN 校验的性能'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='ISBN 数量（默认 100000）')
+        parser.add_argument('--invalid-ratio', type=float, default=0.1, help='非法值比例（默认 0.1）')
+        parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次（默认 3）')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+
+    def _time(self, func, values, repeat):
+        best = None
+        result = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func(values)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['count']
+        values = [make_isbn(rng.randrange(10 ** 9)) for _ in range(count)]
+        for idx in range(count):
+            if rng.random() < options['invalid_ratio']:
+                values[idx] = _corrupt(rng, values[idx])
+
+        repeat = max(1, options['repeat'])
+        per_row_time, expected = self._time(_per_row, values, repeat)
+        self.stdout.write(f'逐个校验 validate_isbn13：{per_row_time:.3f} 秒（{count / per_row_time:,.0f} 条/秒）')
+
+        modes = [('纯 Python 批量', False)]
+        if np is not None:
+            modes.append(('NumPy 批量', True))
+        else:
+            self.stdout.write(self.style.WARNING('未安装 NumPy，仅测试纯 Python 批量路径'))
+
+        for label, use_numpy in modes:
+            elapsed, (_, reasons) = self._time(
+                lambda vals: validate_isbn13_batch(vals, use_numpy=use_numpy), values, repeat
+            )
+            if reasons != expected:
+                raise CommandError(f'{label} 校验结果与逐个校验不一致')
+            self.stdout.write(
+                f'{label} validate_isbn13_batch：{elapsed:.3f} 秒（{count / elapsed:,.0f} 条/秒，'
+                f'加速 {per_row_time / elapsed:.1f}x）'
+            )
+
+        invalid = sum(1 for reason in expected if reason)
+        self.stdout.write(self.style.SUCCESS(f'✓ 结果一致：{count} 条，其中非法 {invalid} 条'))
@@ -0,0 +1,23 @@
+"""
+重建分类汇总表管理命令
+
+用法：
+    python manage.py rebuild_category_summary
+
+功能：
+    - 按 Book 全表重新聚合各分类的图书数、馆藏总数与可借数量
+    - 覆盖写入 CategorySummary
+
+日常变更由信号增量维护，仅在数据修复、直接修改数据库或核对统计时需要执行
+"""
+from django.core.management.base import BaseCommand
+
+from apps.library import facets
+
+
+class Command(BaseCommand):
+    help = '全量重建图书分类汇总表'
+
+    def handle(self, *args, **options):
+        count = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ 分类汇总重建完成，共 {count} 个分类'))
@@ -0,0 +1,57 @@
+"""
+重建图书检索索引管理命令
+
+用法：
+    python manage.py rebuild_search_index [--batch-size 1000] [--only tokens|trigrams]
+
+功能：
+    - 清空 BookSearchToken 倒排索引与 BookTrigram 模糊检索三元组索引
+    - 按批次遍历全部图书重新切分入库
+    - 输出图书数与索引行数
+
+日常增删改由信号自动维护索引，仅在首次部署、批量导入数据或分词规则变更后需要执行
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.library import fuzzy, search
+
+
+class Command(BaseCommand):
+    help = '全量重建图书检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='每批写入的索引行数量（默认 1000）',
+        )
+        parser.add_argument(
+            '--only',
+            choices=['tokens', 'trigrams'],
+            help='只重建倒排索引（tokens）或模糊检索三元组索引（trigrams），默认两者都重建',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        only = options['only']
+        if only in (None, 'tokens'):
+            started = time.monotonic()
+            book_count, token_count = search.rebuild_index(batch_size=batch_size)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ 索引重建完成：{book_count} 本图书，{token_count} 个词元，耗时 {elapsed:.2f} 秒'
+                )
+            )
+        if only in (None, 'trigrams'):
+            started = time.monotonic()
+            book_count, gram_count = fuzzy.rebuild_index(batch_size=batch_size)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ 三元组索引重建完成：{book_count} 本图书，{gram_count} 个三元组，耗时 {elapsed:.2f} 秒'
+                )
+            )
@@ -0,0 +1,38 @@
+"""
+核对可借数量缓存管理命令
+
+用法：
+    python manage.py reconcile_availability [--dry-run] [--batch-size 1000]
+
+功能：
+    - 按批次读取 Book 的可借数量，与缓存层中已有的条目逐一比对
+    - 输出核对条数、不一致条数及前 20 条明细
+    - 默认以数据库为准修正缓存；--dry-run 只报告不修正
+
+缓存与数据库的偏差只可能来自进程在提交后、更新缓存前退出等异常情况，可定时执行
+"""
+from django.core.management.base import BaseCommand
+
+from apps.library import availability
+
+
+class Command(BaseCommand):
+    help = '核对并修正可借数量缓存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只报告不一致，不修正缓存')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批核对的图书数（默认 1000）')
+
+    def handle(self, *args, **options):
+        result = availability.reconcile(batch_size=options['batch_size'], fix=not options['dry_run'])
+        for sample in result['samples']:
+            self.stdout.write(
+                f"  图书 {sample['book_id']}：缓存 {sample['cached']}，数据库 {sample['actual']}"
+            )
+        if result['mismatched']:
+            action = '未修正（--dry-run）' if options['dry_run'] else '已按数据库修正'
+            self.stdout.write(self.style.WARNING(
+                f"核对 {result['checked']} 条缓存，{result['mismatched']} 条不一致，{action}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ 核对 {result['checked']} 条缓存，全部一致"))
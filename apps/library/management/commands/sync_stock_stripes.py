@@ -0,0 +1,54 @@
+"""
+分段库存管理命令
+
+用法：
+    python manage.py sync_stock_stripes
+    python manage.py sync_stock_stripes --enable 978-7-111-12345-3 [--stripes 8]
+    python manage.py sync_stock_stripes --disable 978-7-111-12345-3
+
+功能：
+    - 默认：把各分段之和回写到 Book.available_copies 快照（建议定时执行，如每 5 分钟）
+    - --enable：为指定图书开启分段库存，按当前可借数量平均分配到 --stripes 段（已开启时重新分配）
+    - --disable：关闭分段库存，各段之和写回 Book.available_copies
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.library import stripes
+from apps.library.models import Book
+
+
+class Command(BaseCommand):
+    help = '同步分段库存快照，或按书开启/关闭分段库存'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--enable', metavar='ISBN', help='为指定图书开启分段库存')
+        group.add_argument('--disable', metavar='ISBN', help='关闭指定图书的分段库存')
+        parser.add_argument('--stripes', type=int, default=stripes.DEFAULT_STRIPES,
+                            help=f'分段数（默认 {stripes.DEFAULT_STRIPES}，最多 {stripes.MAX_STRIPES}）')
+        parser.add_argument('--batch-size', type=int, default=500, help='同步快照时每批图书数（默认 500）')
+
+    def _get_book(self, isbn):
+        book = Book.objects.filter(isbn=isbn).first()
+        if book is None:
+            raise CommandError(f'未找到 ISBN 为 {isbn} 的图书')
+        return book
+
+    def handle(self, *args, **options):
+        if options['enable']:
+            book = self._get_book(options['enable'])
+            available = stripes.enable(book.id, options['stripes'])
+            book.refresh_from_db(fields=['stock_stripes'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ 《{book.title}》已开启分段库存：{book.stock_stripes} 段，可借 {available} 册'
+            ))
+            return
+
+        if options['disable']:
+            book = self._get_book(options['disable'])
+            available = stripes.disable(book.id)
+            self.stdout.write(self.style.SUCCESS(f'✓ 《{book.title}》已关闭分段库存，可借 {available} 册'))
+            return
+
+        updated = stripes.sync(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ 分段库存快照已同步，更新 {updated} 本图书'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_alter_book_isbn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, verbose_name='词元')),
+                ('field', models.CharField(choices=[('title', '书名'), ('author', '作者'), ('isbn', 'ISBN'), ('category', '分类')], max_length=16, verbose_name='字段')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='权重')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='library.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '检索词元',
+                'verbose_name_plural': '检索词元',
+                'indexes': [models.Index(fields=['token', 'book'], name='library_boo_token_9533e1_idx')],
+            },
+        ),
+    ]
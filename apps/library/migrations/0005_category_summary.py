@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_category_summary(apps, schema_editor):
+    """按现有图书初始化分类汇总表"""
+    Book = apps.get_model('library', 'Book')
+    CategorySummary = apps.get_model('library', 'CategorySummary')
+    rows = Book.objects.values('category').annotate(
+        book_count=Count('id'),
+        total=Sum('total_copies'),
+        available=Sum('available_copies'),
+    ).order_by()
+    CategorySummary.objects.bulk_create([
+        CategorySummary(
+            category=row['category'] or '',
+            book_count=row['book_count'],
+            total_copies=row['total'] or 0,
+            available_copies=row['available'] or 0,
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=80, unique=True, verbose_name='分类')),
+                ('book_count', models.IntegerField(default=0, verbose_name='图书数')),
+                ('total_copies', models.IntegerField(default=0, verbose_name='馆藏总数')),
+                ('available_copies', models.IntegerField(default=0, verbose_name='可借数量')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '分类汇总',
+                'verbose_name_plural': '分类汇总',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='library_boo_categor_c1ecae_idx'),
+        ),
+        migrations.RunPython(populate_category_summary, migrations.RunPython.noop),
+    ]
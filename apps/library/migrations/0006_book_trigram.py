@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_category_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3, verbose_name='三元组')),
+                ('field', models.CharField(choices=[('title', '书名'), ('author', '作者')], max_length=16, verbose_name='字段')),
+                ('gram_count', models.PositiveSmallIntegerField(verbose_name='三元组总数')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='library.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '模糊检索三元组',
+                'verbose_name_plural': '模糊检索三元组',
+                'indexes': [models.Index(fields=['gram', 'book', 'field', 'gram_count'], name='library_boo_gram_fd74b7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_book_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='stock_stripes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='0 表示可借数量记在本行；大于 0 时分散记在 StockStripe 中，本行为定期同步的快照', verbose_name='库存分段数'),
+        ),
+        migrations.CreateModel(
+            name='StockStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe', models.PositiveSmallIntegerField(verbose_name='段号')),
+                ('available', models.PositiveIntegerField(default=0, verbose_name='可借数量')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripes', to='library.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '分段库存',
+                'verbose_name_plural': '分段库存',
+                'constraints': [models.UniqueConstraint(fields=('book', 'stripe'), name='uniq_stock_stripe')],
+            },
+        ),
+    ]
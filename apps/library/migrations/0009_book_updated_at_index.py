@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at'], name='library_boo_updated_eb1110_idx'),
+        ),
+    ]
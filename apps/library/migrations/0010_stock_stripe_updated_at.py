@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_book_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockstripe',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='更新时间'),
+        ),
+        migrations.AddIndex(
+            model_name='stockstripe',
+            index=models.Index(fields=['updated_at'], name='library_sto_updated_31ba10_idx'),
+        ),
+    ]
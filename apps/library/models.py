@@ -1,10 +1,15 @@
 import re
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 
 ISBN13_REGEX = re.compile(r"^97[89]-\d+-\d+-\d+-\d$")
 
+ISBN_FORMAT_ERROR = "ISBN 必须符合 978-组号-出版社-序号-校验位 的格式"
+ISBN_DIGITS_ERROR = "ISBN 必须是 13 位数字（不含连字符）"
+ISBN_CHECKSUM_ERROR = "ISBN 校验位不正确"
+
 
 def validate_isbn13(value: str) -> None:
     """
@@ -14,16 +19,16 @@ def validate_isbn13(value: str) -> None:
     - 校验位：符合 ISBN-13 加权算法
     """
     if not ISBN13_REGEX.match(value):
-        raise ValidationError("ISBN 必须符合 978-组号-出版社-序号-校验位 的格式")
+        raise ValidationError(ISBN_FORMAT_ERROR)
 
     digits = value.replace("-", "")
     if len(digits) != 13 or not digits.isdigit():
-        raise ValidationError("ISBN 必须是 13 位数字（不含连字符）")
+        raise ValidationError(ISBN_DIGITS_ERROR)
 
     checksum = sum((1 if idx % 2 == 0 else 3) * int(d) for idx, d in enumerate(digits[:-1]))
     check_digit = (10 - (checksum % 10)) % 10
     if check_digit != int(digits[-1]):
-        raise ValidationError("ISBN 校验位不正确")
+        raise ValidationError(ISBN_CHECKSUM_ERROR)
 
 
 class Book(models.Model):
@@ -41,6 +46,11 @@ class Book(models.Model):
     category = models.CharField(max_length=80, blank=True, db_index=True, verbose_name="分类")
     total_copies = models.PositiveIntegerField(default=1, verbose_name="馆藏总数")
     available_copies = models.PositiveIntegerField(default=1, verbose_name="可借数量")
+    stock_stripes = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="库存分段数",
+        help_text="0 表示可借数量记在本行；大于 0 时分散记在 StockStripe 中，本行为定期同步的快照",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -49,10 +59,134 @@ class Book(models.Model):
         verbose_name_plural = "图书"
         indexes = [
             models.Index(fields=["category"]),
+            # 目录页游标分页按 (created_at, id) 范围扫描
+            models.Index(fields=["created_at", "id"]),
+            # 目录页按分类筛选后的游标分页
+            models.Index(fields=["category", "created_at", "id"]),
+            # 图书 API 的条件请求取 Max(updated_at)
+            models.Index(fields=["updated_at"]),
         ]
 
     def __str__(self) -> str:
         return f"{self.title} ({self.isbn})"
 
 
-# Create your models here.
+class BookSearchToken(models.Model):
+    """图书全文检索倒排索引：每行表示某本书的某个字段包含一个词元。
+
+    词元由 apps.library.search.tokenize 生成（英文/数字按词切分，中文按二元组切分），
+    在 Book 保存/删除时由信号自动维护，可通过 rebuild_search_index 命令全量重建。
+    """
+
+    FIELD_CHOICES = (
+        ("title", "书名"),
+        ("author", "作者"),
+        ("isbn", "ISBN"),
+        ("category", "分类"),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="search_tokens", verbose_name="图书")
+    token = models.CharField(max_length=64, verbose_name="词元")
+    field = models.CharField(max_length=16, choices=FIELD_CHOICES, verbose_name="字段")
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name="权重")
+
+    class Meta:
+        verbose_name = "检索词元"
+        verbose_name_plural = "检索词元"
+        indexes = [
+            models.Index(fields=["token", "book"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.token} -> {self.book_id}"
+
+
+class BookTrigram(models.Model):
+    """图书模糊检索三元组索引：每行表示某本书的书名或作者包含一个字符三元组。
+
+    三元组由 apps.library.fuzzy.trigrams 生成（每个单词前补两个空格、后补一个空格后按 3 字符切分），
+    gram_count 冗余记录该书该字段的三元组总数，用于在 SQL 中直接计算相似度。
+    """
+
+    FIELD_CHOICES = (
+        ("title", "书名"),
+        ("author", "作者"),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="trigrams", verbose_name="图书")
+    gram = models.CharField(max_length=3, verbose_name="三元组")
+    field = models.CharField(max_length=16, choices=FIELD_CHOICES, verbose_name="字段")
+    gram_count = models.PositiveSmallIntegerField(verbose_name="三元组总数")
+
+    class Meta:
+        verbose_name = "模糊检索三元组"
+        verbose_name_plural = "模糊检索三元组"
+        indexes = [
+            # 覆盖索引：模糊检索只需扫描索引，无需回表
+            models.Index(fields=["gram", "book", "field", "gram_count"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.gram!r} -> {self.book_id}"
+
+
+class CategorySummary(models.Model):
+    """分类汇总表：按分类维护图书数、馆藏总数与可借数量
+
+    由 apps.library.facets 在 Book 保存/删除及借还变更库存时增量更新，
+    供 Dashboard 分类统计与目录页分类筛选直接读取，避免对 Book 全表聚合。
+    """
+
+    category = models.CharField(max_length=80, unique=True, verbose_name="分类")
+    book_count = models.IntegerField(default=0, verbose_name="图书数")
+    total_copies = models.IntegerField(default=0, verbose_name="馆藏总数")
+    available_copies = models.IntegerField(default=0, verbose_name="可借数量")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "分类汇总"
+        verbose_name_plural = "分类汇总"
+
+    def __str__(self) -> str:
+        return f"{self.category or '未分类'}: {self.book_count}"
+
+
+class CatalogVersion(models.Model):
+    """目录版本号：图书新增/修改/删除/批量导入后递增（见 apps.library.catalog），各进程共享"""
+
+    name = models.CharField(max_length=32, unique=True, verbose_name="名称")
+    generation = models.BigIntegerField(default=0, verbose_name="版本号")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "目录版本"
+        verbose_name_plural = "目录版本"
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.generation}"
+
+
+class StockStripe(models.Model):
+    """分段库存：热门图书的可借数量分散记在多行，借还随机选择一段加减，避免所有借还争用同一行锁
+
+    由 apps.library.stripes 维护；Book.stock_stripes 大于 0 的图书以各段之和为准，
+    Book.available_copies 由 sync_stock_stripes 命令定期同步为快照。
+    """
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="stripes", verbose_name="图书")
+    stripe = models.PositiveSmallIntegerField(verbose_name="段号")
+    available = models.PositiveIntegerField(default=0, verbose_name="可借数量")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "分段库存"
+        verbose_name_plural = "分段库存"
+        constraints = [
+            models.UniqueConstraint(fields=["book", "stripe"], name="uniq_stock_stripe"),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.book_id}#{self.stripe}: {self.available}"
@@ -0,0 +1,135 @@
+"""
+游标（Keyset）分页模块
+
+按 (时间字段, id) 复合键倒序分页，替代 Paginator 的 COUNT(*) + OFFSET：
+- 每页只需一次基于索引的范围查询，第 1 页与第 500 页成本相同
+- 游标为不透明的 base64 令牌，编码了当前页边界行的 (时间, id) 与翻页方向
+- 总数可选地使用数据库统计信息估算，不做精确 COUNT
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import Q
+
+
+def encode_cursor(value: datetime, pk: int, direction: str) -> str:
+    """编码游标令牌，direction 为 'next'（向后翻页）或 'prev'（向前翻页）"""
+    payload = json.dumps({'v': value.isoformat(), 'id': pk, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Optional[Tuple[datetime, int, str]]:
+    """解码游标令牌，格式非法时返回 None（视为第一页）"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        direction = payload['d']
+        if direction not in ('next', 'prev'):
+            return None
+        return datetime.fromisoformat(payload['v']), int(payload['id']), direction
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        return None
+
+
+def estimate_count(queryset) -> int:
+    """
+    估算查询集总数
+
+    未附加过滤条件时读取数据库的表统计信息（MySQL: information_schema，
+    PostgreSQL: pg_class），避免全表 COUNT(*)；其余情况退化为精确计数。
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if not queryset.query.where:
+        table = model._meta.db_table
+        sql = None
+        if connection.vendor == 'mysql':
+            sql = (
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+            )
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        if sql:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [table])
+                row = cursor.fetchone()
+            if row and row[0] is not None and row[0] >= 0:
+                return int(row[0])
+    return queryset.count()
+
+
+class KeysetPage:
+    """游标分页的一页结果，可直接在模板中迭代"""
+
+    def __init__(self, object_list: List, has_next: bool, has_previous: bool,
+                 field: str, estimated_total: Optional[int] = None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.field = field
+        self.estimated_total = estimated_total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(getattr(last, self.field), last.pk, 'next')
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if not self.has_previous or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(getattr(first, self.field), first.pk, 'prev')
+
+
+def paginate_keyset(queryset, cursor: Optional[str], per_page: int,
+                    field: str = 'created_at', estimate: bool = False) -> KeysetPage:
+    """
+    按 (field, id) 倒序做游标分页
+
+    Args:
+        queryset: 待分页的查询集（无需预先排序）
+        cursor: 上一页/下一页链接携带的游标令牌，None 表示第一页
+        per_page: 每页数量
+        field: 排序用的时间字段，需与 id 组成联合索引
+        estimate: 是否附带估算总数
+
+    Returns:
+        KeysetPage
+    """
+    decoded = decode_cursor(cursor)
+    estimated_total = estimate_count(queryset) if estimate else None
+
+    if decoded is None:
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False, field, estimated_total)
+
+    value, pk, direction = decoded
+    if direction == 'next':
+        # 取边界行之后（更旧）的记录
+        boundary = Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+        rows = list(queryset.filter(boundary).order_by(f'-{field}', '-pk')[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True, field, estimated_total)
+
+    # 向前翻页：正序取边界行之前（更新）的记录后再反转
+    boundary = Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+    rows = list(queryset.filter(boundary).order_by(field, 'pk')[:per_page + 1])
+    has_previous = len(rows) > per_page
+    rows = rows[:per_page]
+    rows.reverse()
+    return KeysetPage(rows, True, has_previous, field, estimated_total)
@@ -0,0 +1,205 @@
+"""
+图书全文检索模块
+
+基于 BookSearchToken 倒排索引实现图书检索，替代 list_books 中
+title/author/isbn/category 四列 icontains 的全表扫描：
+- 分词：英文/数字按词切分并小写化；中文（CJK）按二元组切分，便于中文书名检索
+- 索引：Book 保存时由信号增量维护，可通过 rebuild_search_index 命令全量重建
+- 查询：查询词之间为 AND 关系，按字段权重累加得分排序
+"""
+import re
+import unicodedata
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from .models import Book, BookSearchToken
+
+
+# 各字段的检索权重：书名命中优先于作者/ISBN，分类最低
+FIELD_WEIGHTS = {
+    'title': 3,
+    'author': 2,
+    'isbn': 2,
+    'category': 1,
+}
+
+# 参与索引的字段，仅这些字段变化时才需要重建单本图书的索引
+INDEXED_FIELDS = frozenset(FIELD_WEIGHTS)
+
+TOKEN_MAX_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+_CJK_RANGES = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+_TOKEN_RE = re.compile(rf'[{_CJK_RANGES}]+|[^\W_{_CJK_RANGES}]+')
+_CJK_RE = re.compile(rf'^[{_CJK_RANGES}]+$')
+
+
+def _normalize(text: str) -> str:
+    """全角转半角并小写化，保证索引与查询使用同一套规则"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def _cjk_grams(run: str) -> List[str]:
+    """
+    中文片段切分为二元组，并额外保留末字
+
+    末字单独入索引后，任意单字查询都能以前缀方式命中（非末字可由二元组前缀命中）。
+    """
+    if len(run) == 1:
+        return [run]
+    grams = [run[i:i + 2] for i in range(len(run) - 1)]
+    grams.append(run[-1])
+    return grams
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为索引词元（去重，保持出现顺序）
+
+    Example:
+        >>> tokenize('Python编程 第3版')
+        ['python', '编程', '程', '第', '3', '版']
+    """
+    tokens = []
+    seen = set()
+    for run in _TOKEN_RE.findall(_normalize(text)):
+        grams = _cjk_grams(run) if _CJK_RE.match(run) else [run]
+        for gram in grams:
+            gram = gram[:TOKEN_MAX_LENGTH]
+            if gram not in seen:
+                seen.add(gram)
+                tokens.append(gram)
+    return tokens
+
+
+def parse_query(q: str) -> List[Tuple[str, bool]]:
+    """
+    解析查询串为 (词元, 是否前缀匹配) 列表
+
+    - 英文/数字词：前缀匹配（输入 "pyth" 可命中 "python"）
+    - 中文单字：前缀匹配二元组
+    - 中文多字：切分为二元组后精确匹配
+    """
+    terms = []
+    seen = set()
+    for run in _TOKEN_RE.findall(_normalize(q)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            candidates = [(run[i:i + 2], False) for i in range(len(run) - 1)]
+        else:
+            candidates = [(run[:TOKEN_MAX_LENGTH], True)]
+        for term in candidates:
+            if term not in seen:
+                seen.add(term)
+                terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def build_tokens(book: Book) -> List[BookSearchToken]:
+    """生成单本图书的全部索引行（未入库）"""
+    rows = []
+    for field, weight in FIELD_WEIGHTS.items():
+        value = getattr(book, field) or ''
+        tokens = tokenize(value)
+        if field == 'isbn':
+            # 去掉连字符的完整 ISBN，支持直接输入 13 位数字检索
+            digits = value.replace('-', '')
+            if digits and digits not in tokens:
+                tokens.append(digits[:TOKEN_MAX_LENGTH])
+        rows.extend(
+            BookSearchToken(book_id=book.pk, token=token, field=field, weight=weight)
+            for token in tokens
+        )
+    return rows
+
+
+def reindex_books(books: Iterable[Book]) -> int:
+    """重建指定图书的索引，返回写入的词元数"""
+    books = list(books)
+    if not books:
+        return 0
+    rows = []
+    for book in books:
+        rows.extend(build_tokens(book))
+    with transaction.atomic():
+        BookSearchToken.objects.filter(book_id__in=[book.pk for book in books]).delete()
+        BookSearchToken.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def index_book(book: Book) -> int:
+    """重建单本图书的索引"""
+    return reindex_books([book])
+
+
+def rebuild_index(batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    全量重建检索索引
+
+    Returns:
+        (图书数, 词元数)
+    """
+    book_count = 0
+    token_count = 0
+    with transaction.atomic():
+        BookSearchToken.objects.all().delete()
+        batch = []
+        books = Book.objects.only('id', *INDEXED_FIELDS).order_by('id').iterator(chunk_size=batch_size)
+        for book in books:
+            batch.extend(build_tokens(book))
+            book_count += 1
+            if len(batch) >= batch_size:
+                BookSearchToken.objects.bulk_create(batch, batch_size=batch_size)
+                token_count += len(batch)
+                batch = []
+        if batch:
+            BookSearchToken.objects.bulk_create(batch, batch_size=batch_size)
+            token_count += len(batch)
+    return book_count, token_count
+
+
+def search_book_ids(q: str, category: Optional[str] = None):
+    """
+    检索图书，返回按相关度排序的 {'book_id', 'score'} 查询集
+
+    每个查询词都必须命中（AND），得分为命中词元的字段权重之和，
+    同分时按 id 倒序（即新书优先，与列表页默认排序一致）。
+    指定 category 时只返回该分类下的图书。
+    """
+    terms = parse_query(q)
+    if not terms:
+        return BookSearchToken.objects.none().values('book_id')
+
+    condition = Q()
+    matched = {}
+    for idx, (term, prefix) in enumerate(terms):
+        lookup = Q(token__istartswith=term) if prefix else Q(token=term)
+        condition |= lookup
+        matched[f'm{idx}'] = Max(Case(When(lookup, then=Value(1)), default=Value(0), output_field=IntegerField()))
+
+    tokens = BookSearchToken.objects.filter(condition)
+    if category:
+        tokens = tokens.filter(book__category=category)
+    return (
+        tokens
+        .values('book_id')
+        .annotate(score=Sum('weight'), **matched)
+        .filter(**{name: 1 for name in matched})
+        .order_by('-score', '-book_id')
+    )
+
+
+def load_books(rows, fields: Optional[Iterable[str]] = None) -> List[Book]:
+    """按检索结果顺序加载图书对象"""
+    ids = [row['book_id'] for row in rows]
+    qs = Book.objects.all()
+    if fields:
+        qs = qs.only(*fields)
+    books = qs.in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def matching_books(q: str, category: Optional[str] = None):
+    """返回命中检索的 Book 查询集（不含排序），用于计数、聚合等集合运算"""
+    return Book.objects.filter(id__in=search_book_ids(q, category).values('book_id'))
@@ -0,0 +1,157 @@
+"""
+目录检索结果缓存模块
+
+在 list_books 的检索分支前缓存“查询 + 分类 + 页码”对应的一页结果，开学初大量重复的
+教材查询直接命中缓存，不再执行倒排索引聚合：
+- 缓存键由规范化后的查询词（与检索使用同一套分词规则）、分类、页码与检索模式组成，并带上代际号
+- 代际号即目录版本号（apps.library.catalog，存于数据库）：Book 保存/删除/批量导入后（事务提交时）
+  递增，旧代际的条目自然失效，无需逐条删除；各进程读取同一个版本号，命中缓存也需一次单行查询
+- 借还只改动 available_copies，不递增代际号；命中缓存时从可借数量缓存层（availability）读取
+- 命中/未命中次数记录在缓存中，可通过管理接口查看
+
+缓存使用 Django 默认缓存（settings.CACHES）。进程内缓存时各进程各存一份结果，
+但代际号相同，失效对所有进程同时生效；多进程部署配置 Redis/Memcached 等共享缓存可提高命中率。
+"""
+import hashlib
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+
+from . import availability, catalog, fuzzy, search
+from .models import Book
+
+
+KEY_PREFIX = 'library:search_cache'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+
+DEFAULT_TIMEOUT = 300
+
+# 缓存的展示字段（与目录页模板一致）
+CACHED_FIELDS = ('id', 'title', 'author', 'isbn', 'publisher', 'category', 'total_copies', 'available_copies')
+
+# 仅这些字段变化时无需使缓存失效：可借数量命中时实时读取，updated_at 不展示
+VOLATILE_FIELDS = frozenset({'available_copies', 'updated_at'})
+
+
+def get_timeout() -> int:
+    """缓存有效期（秒），0 表示关闭检索缓存"""
+    return getattr(settings, 'LIBRARY_SEARCH_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def normalize_query(q: str) -> str:
+    """规范化查询串：大小写、全半角、空白差异不影响缓存键"""
+    return ' '.join(f'{term}*' if prefix else term for term, prefix in search.parse_query(q))
+
+
+def _incr(key: str) -> int:
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # 计数键在 add 与 incr 之间被淘汰
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def get_generation() -> int:
+    return catalog.get_generation()
+
+
+def bump_generation() -> None:
+    """递增代际号，使全部已缓存的检索结果失效"""
+    catalog.bump()
+
+
+def bump_generation_on_commit() -> None:
+    """事务提交后再递增代际号，避免并发请求在提交前用旧数据重新填充缓存"""
+    catalog.bump_on_commit()
+
+
+def should_invalidate(update_fields=None) -> bool:
+    """保存时是否需要使缓存失效：仅更新可借数量等字段时不失效"""
+    return update_fields is None or not set(update_fields) <= VOLATILE_FIELDS
+
+
+def _page_number(page) -> int:
+    try:
+        return max(int(page), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def make_key(q: str, category: Optional[str], page, fuzzy_mode: bool = False) -> Optional[str]:
+    """生成缓存键；查询词无有效词元时返回 None（不缓存）"""
+    normalized = normalize_query(q)
+    if not normalized:
+        return None
+    raw = '|'.join([normalized, category or '', str(_page_number(page)), 'fuzzy' if fuzzy_mode else 'exact'])
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:{get_generation()}:{digest}'
+
+
+def _build_page(entry: Dict, per_page: int):
+    """由缓存条目还原分页对象：总数用 range 占位，不再 COUNT"""
+    paginator = Paginator(range(entry['count']), per_page)
+    page_obj = paginator.get_page(entry['number'])
+    page_obj.object_list = [Book(**row) for row in entry['rows']]
+    return page_obj
+
+
+def get_page(q: str, category: Optional[str], page, per_page: int, fuzzy_mode: bool = False):
+    """
+    返回检索结果的一页（Page 对象），优先读取缓存
+
+    Args:
+        q: 原始查询串
+        category: 分类筛选，None 表示全部
+        page: 请求的页码（非法值视为第 1 页）
+        per_page: 每页数量
+        fuzzy_mode: 是否使用三元组模糊检索（结果至多 fuzzy.MAX_RESULTS 条）
+
+    Returns:
+        django.core.paginator.Page，object_list 为 Book 列表
+    """
+    timeout = get_timeout()
+    key = make_key(q, category, page, fuzzy_mode) if timeout else None
+    if key is not None:
+        entry = cache.get(key)
+        if entry is not None:
+            _incr(HITS_KEY)
+            page_obj = _build_page(entry, per_page)
+            availability.apply(page_obj.object_list)
+            return page_obj
+        _incr(MISSES_KEY)
+
+    rows = fuzzy.search_book_ids(q, category) if fuzzy_mode else search.search_book_ids(q, category)
+    paginator = Paginator(rows, per_page)
+    page_obj = paginator.get_page(page)
+    page_obj.object_list = search.load_books(page_obj.object_list)
+    if key is not None:
+        cache.set(key, {
+            'count': paginator.count,
+            'number': page_obj.number,
+            'rows': [{field: getattr(book, field) for field in CACHED_FIELDS} for book in page_obj.object_list],
+        }, timeout)
+    return page_obj
+
+
+def stats() -> Dict:
+    """命中统计"""
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'enabled': bool(get_timeout()),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'generation': get_generation(),
+    }
+
+
+def reset_stats() -> None:
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,175 @@
+"""
+图书相关信号处理
+
+- Book 保存时增量维护检索索引与模糊检索三元组索引；删除时索引行随外键级联删除
+- Book 加载/保存/删除时按差值维护分类汇总表（CategorySummary）
+- Book 保存/删除后递增检索缓存代际号（仅借还改动可借数量时不失效）
+- Book 保存/删除、新增借阅记录后更新进程内联想索引
+- Book 保存/删除/批量变更、借还改动库存后使可借数量缓存作废（递增版本号）
+批量写入（bulk_create/update）不会触发 post_save，由调用方发送 books_bulk_changed；
+只改动可借数量的批量 UPDATE 发送 book_stock_changed。
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import availability, facets, fuzzy, search, search_cache, suggest
+from .models import Book
+
+
+# 批量变更通知，参数：book_ids（受影响的图书 id 列表），
+# categories（可选，变更前所属分类，用于刷新被移出图书的分类汇总）
+books_bulk_changed = Signal()
+
+# 库存变更通知（借还批量处理等绕过 save() 的条件更新），参数：
+# deltas（{book_id: 可借数量增减}），categories（{book_id: 所属分类}）
+book_stock_changed = Signal()
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_search_index')
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """图书保存后重建其索引；仅更新库存等非检索字段时跳过"""
+    if raw:
+        return
+    if update_fields is not None and not (set(update_fields) & search.INDEXED_FIELDS):
+        return
+    search.index_book(instance)
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_search_index')
+def update_search_index_bulk(sender, book_ids, **kwargs):
+    """批量变更后重建受影响图书的索引"""
+    search.reindex_books(Book.objects.filter(id__in=book_ids).only('id', *search.INDEXED_FIELDS))
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_trigram_index')
+def update_trigram_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """书名/作者变化后重建其三元组索引"""
+    if raw:
+        return
+    if update_fields is not None and not (set(update_fields) & set(fuzzy.FUZZY_FIELDS)):
+        return
+    fuzzy.index_book(instance)
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_trigram_index')
+def update_trigram_index_bulk(sender, book_ids, **kwargs):
+    fuzzy.reindex_books(Book.objects.filter(id__in=book_ids).only('id', *fuzzy.FUZZY_FIELDS))
+
+
+@receiver(post_init, sender=Book, dispatch_uid='library_book_facet_snapshot')
+def remember_facet_state(sender, instance, **kwargs):
+    """记录图书加载时的分类/馆藏/可借数量，作为保存时计算差值的基准"""
+    instance._facet_state = facets.snapshot(instance) if instance.pk else None
+
+
+@receiver(pre_save, sender=Book, dispatch_uid='library_book_facet_fallback')
+def load_facet_state(sender, instance, raw=False, **kwargs):
+    """加载时字段被延迟（only/defer）导致无快照的，保存前从数据库补读"""
+    if raw or instance._state.adding or getattr(instance, '_facet_state', None) is not None:
+        return
+    row = Book.objects.filter(pk=instance.pk).values_list(*facets.FACET_FIELDS).first()
+    instance._facet_state = (row[0] or '', row[1], row[2]) if row else None
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_category_summary')
+def update_category_summary(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """按保存前后的差值更新分类汇总；update_fields 之外的字段视为未变化"""
+    if raw:
+        return
+    old = None if created else getattr(instance, '_facet_state', None)
+    if not created and old is None:
+        return
+    new = facets.snapshot(instance) if old is None else facets.state_after_save(instance, old, update_fields)
+    facets.record_change(old, new)
+    instance._facet_state = new
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='library_book_category_summary_delete')
+def remove_from_category_summary(sender, instance, **kwargs):
+    """删除图书后从所属分类中扣除"""
+    old = getattr(instance, '_facet_state', None) or facets.snapshot(instance)
+    if old is not None:
+        facets.record_change(old, None)
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_category_summary')
+def update_category_summary_bulk(sender, book_ids, categories=(), **kwargs):
+    """批量变更后按受影响分类重新聚合（事务提交后执行）"""
+    affected = set(categories) | set(Book.objects.filter(id__in=book_ids).values_list('category', flat=True))
+    transaction.on_commit(lambda: facets.refresh_categories(affected))
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_search_cache')
+def invalidate_search_cache(sender, instance, raw=False, update_fields=None, **kwargs):
+    """图书信息变化后使检索缓存失效（事务提交后执行）"""
+    if raw or not search_cache.should_invalidate(update_fields):
+        return
+    search_cache.bump_generation_on_commit()
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='library_book_search_cache_delete')
+def invalidate_search_cache_on_delete(sender, instance, **kwargs):
+    search_cache.bump_generation_on_commit()
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_search_cache')
+def invalidate_search_cache_bulk(sender, book_ids, **kwargs):
+    search_cache.bump_generation_on_commit()
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_suggest')
+def update_suggest_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """书名/作者/ISBN 变化后更新联想索引"""
+    if raw:
+        return
+    if update_fields is not None and not (set(update_fields) & set(suggest.SUGGEST_FIELDS)):
+        return
+    suggest.book_saved_on_commit(instance)
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='library_book_suggest_delete')
+def remove_from_suggest_index(sender, instance, **kwargs):
+    suggest.book_deleted_on_commit(instance.pk)
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_suggest')
+def update_suggest_index_bulk(sender, book_ids, **kwargs):
+    suggest.books_changed_on_commit(book_ids)
+
+
+@receiver(post_save, sender='borrowing.BorrowRecord', dispatch_uid='library_borrow_suggest_rank')
+def count_borrow_for_suggest(sender, instance, created, raw=False, **kwargs):
+    """新增借阅记录后累加联想排序用的借阅次数"""
+    if created and not raw:
+        suggest.borrowed_on_commit(instance.book_id)
+
+
+@receiver(post_save, sender=Book, dispatch_uid='library_book_availability')
+def invalidate_availability(sender, instance, raw=False, update_fields=None, **kwargs):
+    """保存后写入最新可借数量（不区分改动的字段）"""
+    if raw:
+        return
+    availability.write_through_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='library_book_availability_delete')
+def invalidate_availability_on_delete(sender, instance, **kwargs):
+    availability.invalidate_on_commit([instance.pk])
+
+
+@receiver(books_bulk_changed, dispatch_uid='library_bulk_availability')
+def invalidate_availability_bulk(sender, book_ids, **kwargs):
+    availability.write_through_on_commit(book_ids)
+
+
+@receiver(book_stock_changed, dispatch_uid='library_stock_changed')
+def apply_stock_change(sender, deltas, categories, **kwargs):
+    """批量借还后按增减量同步分类汇总，并写入最新可借数量（事务提交后执行）"""
+    by_category = {}
+    for book_id, delta in deltas.items():
+        category = categories.get(book_id) or ''
+        by_category[category] = by_category.get(category, 0) + delta
+    availability.write_through_on_commit(deltas)
+    for category, delta in by_category.items():
+        facets.apply_delta_on_commit(category, available=delta)
@@ -0,0 +1,144 @@
+"""
+分段库存模块（striped counter）
+
+数百册的教材集中借阅时，所有借还都在同一行 Book.available_copies 上排队等锁。
+分段模式把一本书的可借数量分散到 N 行 StockStripe：
+- 借：随机打乱有余量的段，逐段执行 UPDATE ... SET available = available - 1 WHERE available > 0，
+  第一条影响 1 行即借到；各事务大多落在不同的段上，行锁互不等待
+- 还：随机选一段 +1；该段已被并发关闭或重新分配时，锁定图书行后按当前模式还入
+- 借还同时更新所在段的 updated_at，图书列表接口的 ETag/Last-Modified 据此变化（不改动 Book 行）
+- 总数：读路径经可借数量缓存层（availability）读取各段之和并缓存，借还提交后使缓存作废；
+  Book.available_copies 作为快照由 sync_stock_stripes 命令定期回写，供后台与未接入缓存的报表使用
+- 分类汇总（CategorySummary）仍由 book_stock_changed 信号按增减量更新，与是否分段无关
+
+按书开启/关闭（sync_stock_stripes --enable/--disable），开启时按当前可借数量平均分配，
+关闭时把各段之和写回 Book.available_copies。分段模式下调整馆藏请先关闭分段。
+"""
+import random
+from typing import Dict, Iterable
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Book, StockStripe
+
+
+DEFAULT_STRIPES = 8
+MAX_STRIPES = 64
+
+
+def totals(book_ids: Iterable[int]) -> Dict[int, int]:
+    """各书分段之和 {book_id: 可借数量}"""
+    rows = (
+        StockStripe.objects.filter(book_id__in=list(book_ids))
+        .values_list('book_id')
+        .annotate(total=Sum('available'))
+        .order_by()
+    )
+    return dict(rows)
+
+
+def take(book: Book) -> bool:
+    """从随机一段借出一册；各段均无余量时返回 False，须在事务中调用"""
+    stripes = list(
+        StockStripe.objects.filter(book_id=book.id, available__gt=0).values_list('stripe', flat=True)
+    )
+    random.shuffle(stripes)
+    now = timezone.now()
+    for stripe in stripes:
+        # 读取余量后到 UPDATE 之间可能被并发借走，条件 UPDATE 失败则换下一段
+        updated = StockStripe.objects.filter(book_id=book.id, stripe=stripe, available__gt=0).update(
+            available=F('available') - 1, updated_at=now,
+        )
+        if updated:
+            return True
+    return False
+
+
+def _put_stripe(book_id: int, stripes: int, count: int, now) -> int:
+    return StockStripe.objects.filter(book_id=book_id, stripe=random.randrange(stripes)).update(
+        available=F('available') + count, updated_at=now,
+    )
+
+
+def put(book: Book, count: int = 1) -> None:
+    """把 count 册还入随机一段，须在事务中调用"""
+    if count <= 0:
+        return
+    now = timezone.now()
+    if _put_stripe(book.id, book.stock_stripes, count, now):
+        return
+    # 影响 0 行：分段已被并发关闭或按新段数重新分配。enable/disable 持有图书行锁，
+    # 锁定后读到的分段模式即为最终状态
+    stripes = Book.objects.select_for_update().filter(id=book.id).values_list('stock_stripes', flat=True).first()
+    if stripes is None:
+        return
+    if stripes:
+        _put_stripe(book.id, stripes, count, now)
+    else:
+        Book.objects.filter(id=book.id).update(available_copies=F('available_copies') + count, updated_at=now)
+
+
+def enable(book_id: int, stripes: int = DEFAULT_STRIPES) -> int:
+    """
+    开启分段模式：按当前可借数量平均分配到 stripes 段（已开启时按新段数重新分配）
+
+    Returns:
+        分配的可借总数
+    """
+    stripes = max(1, min(stripes, MAX_STRIPES))
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(id=book_id)
+        if book.stock_stripes:
+            # 先锁定全部段再求和，避免与并发借还交错
+            list(StockStripe.objects.select_for_update().filter(book_id=book_id))
+            available = totals([book_id]).get(book_id, 0)
+            StockStripe.objects.filter(book_id=book_id).delete()
+        else:
+            available = book.available_copies
+        base, extra = divmod(available, stripes)
+        StockStripe.objects.bulk_create([
+            StockStripe(book_id=book_id, stripe=idx, available=base + (1 if idx < extra else 0))
+            for idx in range(stripes)
+        ])
+        # 总数不变，可借数量缓存无需失效；不触发 post_save，避免检索索引等无关重建
+        Book.objects.filter(id=book_id).update(
+            stock_stripes=stripes, available_copies=available, updated_at=timezone.now()
+        )
+    return available
+
+
+def disable(book_id: int) -> int:
+    """
+    关闭分段模式：各段之和写回 Book.available_copies 并删除分段
+
+    Returns:
+        写回的可借数量
+    """
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(id=book_id)
+        if not book.stock_stripes:
+            return book.available_copies
+        list(StockStripe.objects.select_for_update().filter(book_id=book_id))
+        available = totals([book_id]).get(book_id, 0)
+        StockStripe.objects.filter(book_id=book_id).delete()
+        Book.objects.filter(id=book_id).update(stock_stripes=0, available_copies=available, updated_at=timezone.now())
+    return available
+
+
+def sync(batch_size: int = 500) -> int:
+    """
+    把分段之和回写到 Book.available_copies 快照（只更新有差异的图书）
+
+    Returns:
+        更新的图书数
+    """
+    updated = 0
+    striped = list(Book.objects.filter(stock_stripes__gt=0).order_by('id').values_list('id', 'available_copies'))
+    for start in range(0, len(striped), batch_size):
+        batch = dict(striped[start:start + batch_size])
+        for book_id, total in totals(batch).items():
+            if batch[book_id] != total:
+                updated += Book.objects.filter(id=book_id, stock_stripes__gt=0).update(available_copies=total)
+    return updated
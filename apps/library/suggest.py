@@ -0,0 +1,320 @@
+"""
+检索联想（自动补全）模块
+
+在进程内维护一份按字典序排列的 (前缀键, 图书 id) 数组，输入联想只做 bisect 二分定位
+与顺序扫描，不访问数据库：
+- 键：书名、作者、ISBN（含去掉连字符的纯数字形式）规范化后的全文，以及书名/作者中每个
+  空格分隔单词开始的后缀（输入 "learning" 也能联想到 "Deep Learning"）；
+  数组中只存每个键的前 KEY_LENGTH 个字符，更长的输入先按截断前缀定位，再对少量候选核对完整键
+- 排序：命中图书按借阅次数倒序、书名正序，取前 N 条；不超过 TOP_PREFIX_LENGTH 个字符的短前缀
+  命中范围大，构建时即为每个短前缀保存排名前 MAX_LIMIT 的图书，查询直接取用；更长的前缀扫描
+  全部命中键后再排序截断
+- 构建：在后台线程中从 Book 加载（每个工作进程各自一份），构建期间继续使用旧索引；
+  工作进程启动时（core/wsgi.py、core/asgi.py）即开始构建，全表加载期间（十万册级约数秒）
+  联想返回空列表，不让请求等待全表扫描
+- 增量：本进程内 Book 保存/删除、新增借阅记录由信号在事务提交后更新
+- 多进程：至多每 CHECK_INTERVAL 秒读取一次目录版本号（apps.library.catalog，存于数据库），
+  其他进程修改过图书则在后台重建；借阅次数只影响排序，不触发其他进程重建
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from . import catalog
+from .models import Book
+from .search import _normalize
+
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 30
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+MAX_PREFIX_LENGTH = 64
+# 数组中每个键保存的字符数
+KEY_LENGTH = 16
+# 不超过该长度的前缀预先保存排名前 MAX_LIMIT 的图书，避免单字符前缀扫描整个数组
+TOP_PREFIX_LENGTH = 3
+
+SUGGEST_FIELDS = ('id', 'title', 'author', 'isbn')
+
+
+def build_keys(title: str, author: str, isbn: str) -> List[str]:
+    """生成一本图书的完整联想键（去重）"""
+    keys = []
+    for text in (title, author):
+        text = _normalize(text).strip()
+        words = text.split()
+        for i in range(len(words)):
+            keys.append(' '.join(words[i:]))
+    isbn = _normalize(isbn).strip()
+    keys.extend([isbn, isbn.replace('-', '')])
+    return list(dict.fromkeys(key[:MAX_PREFIX_LENGTH] for key in keys if key))
+
+
+def compact_keys(title: str, author: str, isbn: str) -> List[str]:
+    """数组中存放的截断键（去重）"""
+    return list(dict.fromkeys(key[:KEY_LENGTH] for key in build_keys(title, author, isbn)))
+
+
+def _short_prefixes(keys: List[str]) -> set:
+    """键的全部短前缀（1 至 TOP_PREFIX_LENGTH 个字符）"""
+    return {key[:n] for key in keys for n in range(1, min(len(key), TOP_PREFIX_LENGTH) + 1)}
+
+
+def _rank(entry: Dict) -> Tuple:
+    return (-entry['borrow_count'], entry['title'], entry['id'])
+
+
+class SuggestIndex:
+    """进程内联想索引：有序键数组 + 图书条目"""
+
+    # 为 False 时在调用线程中同步重建（测试中使用，测试事务内的数据对其他线程不可见）
+    background = True
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys: List[Tuple[str, int]] = []
+        self._entries: Dict[int, Dict] = {}
+        # 短前缀 -> 按排名排列的前 MAX_LIMIT 个图书 id；_stale 中的前缀在下次查询时重新排名
+        self._top: Dict[str, List[int]] = {}
+        self._stale: set = set()
+        self._loaded = False
+        self._rebuilding = False
+        self._generation = 0
+        self._checked_at = 0.0
+
+    # ---- 构建与同步 ----
+
+    def load(self) -> int:
+        """从数据库全量构建，返回图书数"""
+        # 先读版本号：构建期间的图书变更会使版本号再次变化，下次检查时重建
+        generation = catalog.get_generation()
+        rows = Book.objects.values(*SUGGEST_FIELDS).annotate(borrows=Count('borrow_records')).order_by()
+        keys = []
+        entries = {}
+        for row in rows.iterator(chunk_size=2000):
+            entry = self._make_entry(row, row['borrows'])
+            entries[row['id']] = entry
+            keys.extend((key, row['id']) for key in entry['keys'])
+        keys.sort()
+        top = {}
+        for entry in sorted(entries.values(), key=_rank):
+            for head in _short_prefixes(entry['keys']):
+                ids = top.setdefault(head, [])
+                if len(ids) < MAX_LIMIT:
+                    ids.append(entry['id'])
+        with self._lock:
+            self._keys = keys
+            self._entries = entries
+            self._top = top
+            self._stale = set()
+            self._loaded = True
+            self._generation = generation
+            self._checked_at = time.monotonic()
+        return len(entries)
+
+    def _rebuild(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            logger.exception('联想索引重建失败')
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            if self.background:
+                connection.close()
+
+    def schedule_rebuild(self) -> None:
+        """重建索引；同一时间只有一个重建，后台重建期间查询继续使用旧索引"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        if self.background:
+            threading.Thread(target=self._rebuild, name='suggest-index-rebuild', daemon=True).start()
+        else:
+            self._rebuild()
+
+    def ensure_fresh(self) -> None:
+        """首次使用时开始构建；之后按间隔检查目录版本号，其他进程修改过图书则重建"""
+        if not self._loaded:
+            self.schedule_rebuild()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if catalog.get_generation() != self._generation:
+            self.schedule_rebuild()
+
+    @staticmethod
+    def _make_entry(row: Dict, borrows: int) -> Dict:
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'author': row['author'],
+            'isbn': row['isbn'],
+            'borrow_count': borrows,
+            'keys': compact_keys(row['title'], row['author'], row['isbn']),
+        }
+
+    def _remove_keys(self, book_id: int, keys: List[str]) -> None:
+        for key in keys:
+            pos = bisect.bisect_left(self._keys, (key, book_id))
+            if pos < len(self._keys) and self._keys[pos] == (key, book_id):
+                del self._keys[pos]
+
+    def _scan(self, head: str) -> set:
+        """前缀命中的全部图书 id"""
+        keys = self._keys
+        pos = bisect.bisect_left(keys, (head,))
+        ids = set()
+        while pos < len(keys) and keys[pos][0].startswith(head):
+            ids.add(keys[pos][1])
+            pos += 1
+        return ids
+
+    def _promote(self, book_id: int) -> None:
+        """新图书或排名上升的图书并入各短前缀的前 N 名（其他图书排名不变，结果仍准确）"""
+        entry = self._entries[book_id]
+        rank = _rank(entry)
+        for head in _short_prefixes(entry['keys']):
+            if head in self._stale:
+                continue
+            ids = self._top.setdefault(head, [])
+            if book_id in ids:
+                ids.remove(book_id)
+            elif len(ids) >= MAX_LIMIT and rank > _rank(self._entries[ids[-1]]):
+                continue
+            bisect.insort(ids, book_id, key=lambda i: _rank(self._entries[i]))
+            del ids[MAX_LIMIT:]
+
+    def _demote(self, book_id: int, keys: List[str]) -> None:
+        """图书删除、键或排名变化时，其所在的短前缀前 N 名可能需要由名单外的图书补位，标记重新排名"""
+        for head in _short_prefixes(keys):
+            if book_id in self._top.get(head, ()):
+                self._stale.add(head)
+
+    def _top_ids(self, head: str) -> List[int]:
+        if head in self._stale:
+            ids = heapq.nsmallest(MAX_LIMIT, self._scan(head), key=lambda i: _rank(self._entries[i]))
+            self._top[head] = ids
+            self._stale.discard(head)
+        return self._top.get(head, [])
+
+    # ---- 增量更新 ----
+
+    def upsert(self, book: Book) -> None:
+        """新增或更新单本图书（借阅次数沿用原值）"""
+        with self._lock:
+            if not self._loaded:
+                return
+            old = self._entries.get(book.id)
+            if old is not None:
+                self._remove_keys(book.id, old['keys'])
+                self._demote(book.id, old['keys'])
+            row = {'id': book.id, 'title': book.title, 'author': book.author, 'isbn': book.isbn}
+            entry = self._make_entry(row, old['borrow_count'] if old else 0)
+            self._entries[book.id] = entry
+            for key in entry['keys']:
+                bisect.insort(self._keys, (key, book.id))
+            self._promote(book.id)
+
+    def remove(self, book_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(book_id, None)
+            if entry is not None:
+                self._remove_keys(book_id, entry['keys'])
+                self._demote(book_id, entry['keys'])
+
+    def add_borrow(self, book_id: int, count: int = 1) -> None:
+        with self._lock:
+            entry = self._entries.get(book_id)
+            if entry is not None:
+                entry['borrow_count'] += count
+                self._promote(book_id)
+
+    def reload_books(self, book_ids) -> None:
+        """批量变更后重新加载指定图书（借阅次数同样重新统计）"""
+        if not self._loaded:
+            return
+        rows = Book.objects.filter(id__in=book_ids).values(*SUGGEST_FIELDS).annotate(
+            borrows=Count('borrow_records')
+        ).order_by()
+        for row in rows:
+            with self._lock:
+                old = self._entries.pop(row['id'], None)
+                if old is not None:
+                    self._remove_keys(row['id'], old['keys'])
+                    self._demote(row['id'], old['keys'])
+                entry = self._make_entry(row, row['borrows'])
+                self._entries[row['id']] = entry
+                for key in entry['keys']:
+                    bisect.insort(self._keys, (key, row['id']))
+                self._promote(row['id'])
+
+    # ---- 查询 ----
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """
+        按前缀联想
+
+        Example:
+            >>> index.suggest('pyth', limit=5)
+            [{'id': 1, 'title': 'Python编程', 'author': 'Eric Matthes', 'isbn': '978-7-...', 'borrow_count': 42}]
+        """
+        prefix = _normalize(prefix).strip()[:MAX_PREFIX_LENGTH]
+        if not prefix:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            if len(prefix) <= TOP_PREFIX_LENGTH:
+                # 短前缀直接取预先排好的前 N 名
+                entries = [self._entries[book_id] for book_id in self._top_ids(prefix)[:limit] if book_id in self._entries]
+            else:
+                ids = self._scan(prefix[:KEY_LENGTH])
+                entries = [self._entries[book_id] for book_id in ids if book_id in self._entries]
+        if len(prefix) > KEY_LENGTH:
+            # 截断键只保证前 KEY_LENGTH 个字符相同，按完整键核对
+            entries = [
+                entry for entry in entries
+                if any(key.startswith(prefix) for key in build_keys(entry['title'], entry['author'], entry['isbn']))
+            ]
+        # 全部命中项排序后再截断
+        entries = heapq.nsmallest(limit, entries, key=_rank)
+        return [
+            {field: entry[field] for field in ('id', 'title', 'author', 'isbn', 'borrow_count')}
+            for entry in entries
+        ]
+
+
+index = SuggestIndex()
+
+
+def book_saved_on_commit(book: Book) -> None:
+    """图书保存事务提交后更新本进程索引；其他进程由目录版本号变化得知"""
+    transaction.on_commit(lambda: index.upsert(book))
+
+
+def book_deleted_on_commit(book_id: int) -> None:
+    transaction.on_commit(lambda: index.remove(book_id))
+
+
+def books_changed_on_commit(book_ids) -> None:
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: index.reload_books(book_ids))
+
+
+def borrowed_on_commit(book_id: int, count: int = 1) -> None:
+    transaction.on_commit(lambda: index.add_borrow(book_id, count))
+
+
+def suggest(prefix: str, limit: Optional[int] = None) -> List[Dict]:
+    return index.suggest(prefix, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
@@ -1,3 +1,957 @@
+"""
+图书管理模块测试
+"""
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from apps.library import isbn as isbn_module
+from apps.library import availability, catalog, fuzzy, search, search_cache, stripes, suggest
+from apps.library.isbn import validate_isbn13_batch
+from apps.library.importer import BookImporter, ImportFormatError, iter_csv_rows
+from apps.library.models import Book, BookSearchToken, CategorySummary, StockStripe
+from apps.library.pagination import paginate_keyset
+from apps.library.views import API_DEFAULT_FIELDS
+
+
+def make_book(isbn='978-7-111-12345-3', **kwargs):
+    """创建测试图书（ISBN 默认使用一个校验位正确的值）"""
+    defaults = {
+        'title': 'Python编程',
+        'author': 'Eric Matthes',
+        'publisher': '人民邮电出版社',
+        'category': '计算机',
+        'total_copies': 3,
+        'available_copies': 3,
+    }
+    defaults.update(kwargs)
+    return Book.objects.create(isbn=isbn, **defaults)
+
+
+class TokenizeTests(TestCase):
+    """分词测试"""
+
+    def test_tokenize_mixed_text(self):
+        """英文按词切分并小写，中文切分为二元组并保留末字"""
+        self.assertEqual(search.tokenize('Python编程 第3版'), ['python', '编程', '程', '第', '3', '版'])
+
+    def test_tokenize_fullwidth(self):
+        """全角字符归一化为半角"""
+        self.assertEqual(search.tokenize('ＰＹＴＨＯＮ'), ['python'])
+
+    def test_parse_query(self):
+        """中文多字精确匹配二元组，英文词与中文单字前缀匹配"""
+        self.assertEqual(search.parse_query('深度学习'), [('深度', False), ('度学', False), ('学习', False)])
+        self.assertEqual(search.parse_query('Pyth 书'), [('pyth', True), ('书', True)])
+
+
+class SearchIndexTests(TestCase):
+    """检索索引测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.python = make_book()
+        self.dl = make_book(
+            isbn='978-7-115-46147-6', title='深度学习', author='Ian Goodfellow', category='人工智能'
+        )
+
+    def _ids(self, q):
+        return [row['book_id'] for row in search.search_book_ids(q)]
+
+    def test_index_updated_on_save(self):
+        """保存图书后索引自动更新"""
+        self.assertEqual(self._ids('python'), [self.python.id])
+        self.python.title = 'Java编程'
+        self.python.save()
+        self.assertEqual(self._ids('python'), [])
+        self.assertEqual(self._ids('java'), [self.python.id])
+
+    def test_stock_update_skips_reindex(self):
+        """仅更新库存时不重建索引"""
+        BookSearchToken.objects.filter(book=self.python).delete()
+        self.python.available_copies = 2
+        self.python.save(update_fields=['available_copies'])
+        self.assertFalse(BookSearchToken.objects.filter(book=self.python).exists())
+
+    def test_index_removed_on_delete(self):
+        """删除图书后索引随之删除"""
+        book_id = self.dl.id
+        self.dl.delete()
+        self.assertFalse(BookSearchToken.objects.filter(book_id=book_id).exists())
+
+    def test_search_chinese_and_prefix(self):
+        """中文、英文前缀、ISBN 检索"""
+        self.assertEqual(self._ids('深度学习'), [self.dl.id])
+        self.assertEqual(self._ids('学'), [self.dl.id])
+        self.assertEqual(self._ids('good'), [self.dl.id])
+        self.assertEqual(self._ids('9787111'), [self.python.id])
+        self.assertEqual(self._ids('978-7-115'), [self.dl.id])
+
+    def test_search_requires_all_terms(self):
+        """多个查询词为 AND 关系"""
+        self.assertEqual(self._ids('python 计算机'), [self.python.id])
+        self.assertEqual(self._ids('python 人工智能'), [])
+
+    def test_search_ranks_title_first(self):
+        """书名命中的得分高于分类命中"""
+        other = make_book(isbn='978-7-302-00000-1', title='数据结构', category='Python')
+        self.assertEqual(self._ids('python'), [self.python.id, other.id])
+
+    def test_rebuild_command(self):
+        """全量重建命令恢复索引"""
+        BookSearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._ids('深度'), [self.dl.id])
+
+    def test_list_books_uses_index(self):
+        """图书列表页使用索引检索"""
+        response = self.client.get('/library/', {'q': '深度学习'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book.id for book in response.context['page_obj']], [self.dl.id])
+
+
+class KeysetPaginationTests(TestCase):
+    """游标分页测试"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        base = timezone.now()
+        self.books = []
+        for idx in range(7):
+            book = make_book(isbn=f'978-7-000-0000{idx}-0', title=f'Book {idx}')
+            # 两本书使用相同的 created_at，验证 id 作为次级排序键
+            created = base - timedelta(minutes=idx if idx != 4 else 3)
+            Book.objects.filter(pk=book.pk).update(created_at=created)
+            self.books.append(book)
+
+    def _walk(self, per_page):
+        pages = []
+        page = paginate_keyset(Book.objects.all(), None, per_page)
+        pages.append([book.pk for book in page])
+        while page.has_next:
+            page = paginate_keyset(Book.objects.all(), page.next_cursor, per_page)
+            pages.append([book.pk for book in page])
+        return pages, page
+
+    def test_walk_forward_covers_all_rows(self):
+        """向后翻页不重不漏"""
+        pages, _ = self._walk(3)
+        flat = [pk for chunk in pages for pk in chunk]
+        expected = list(Book.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(flat, expected)
+        self.assertEqual([len(chunk) for chunk in pages], [3, 3, 1])
+
+    def test_previous_cursor_returns_prior_page(self):
+        """从第二页向前翻页回到第一页"""
+        first = paginate_keyset(Book.objects.all(), None, 3)
+        second = paginate_keyset(Book.objects.all(), first.next_cursor, 3)
+        back = paginate_keyset(Book.objects.all(), second.previous_cursor, 3)
+        self.assertEqual([b.pk for b in back], [b.pk for b in first])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """非法游标视为第一页"""
+        page = paginate_keyset(Book.objects.all(), 'not-a-cursor', 3)
+        self.assertFalse(page.has_previous)
+        self.assertEqual(len(page), 3)
+
+    def test_estimated_total(self):
+        """估算总数（SQLite 下退化为精确计数）"""
+        page = paginate_keyset(Book.objects.all(), None, 3, estimate=True)
+        self.assertEqual(page.estimated_total, 7)
+
+    def test_list_page_cursor_mode(self):
+        """列表页按配置切换游标分页与页码分页"""
+        with self.settings(LIBRARY_PAGINATION_MODE='cursor'):
+            response = self.client.get('/library/')
+        self.assertTrue(response.context['is_cursor'])
+        self.assertEqual(len(response.context['page_obj']), 7)
+        with self.settings(LIBRARY_PAGINATION_MODE='page'):
+            response = self.client.get('/library/')
+        self.assertFalse(response.context['is_cursor'])
+
+
+class BooksApiTests(TestCase):
+    """图书查询 JSON 接口测试"""
+
+    def setUp(self):
+        from apps.accounts.models import User
+
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(self.user)
+        self.python = make_book()
+        self.dl = make_book(isbn='978-7-115-46147-6', title='深度学习', author='Ian Goodfellow')
+
+    def test_list_with_default_fields(self):
+        """默认字段与分页信息"""
+        response = self.client.get('/library/api/books')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'][0]['id'], self.dl.id)
+        self.assertEqual(set(data['results'][0]), set(API_DEFAULT_FIELDS))
+
+    def test_field_projection_and_search(self):
+        """fields 投影与 q 检索"""
+        response = self.client.get('/library/api/books', {'q': 'python', 'fields': 'title,isbn'})
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'], [{'id': self.python.id, 'title': 'Python编程', 'isbn': self.python.isbn}])
+
+    def test_invalid_params(self):
+        """非法字段与分页参数返回 400"""
+        self.assertEqual(self.client.get('/library/api/books', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/library/api/books', {'page_size': 'x'}).status_code, 400)
+        data = self.client.get('/library/api/books', {'page_size': 1000}).json()
+        self.assertEqual(data['page_size'], 100)
+
+    def test_conditional_get(self):
+        """ETag 未变化返回 304，图书更新后重新返回 200"""
+        response = self.client.get('/library/api/books')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        response = self.client.get('/library/api/books', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.python.available_copies = 2
+        self.python.save(update_fields=['available_copies', 'updated_at'])
+        response = self.client.get('/library/api/books', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_after_delete(self):
+        """删除图书不改变其余图书的 updated_at，但目录版本号变化，ETag 与 Last-Modified 随之更新"""
+        from datetime import timedelta
+        from unittest import mock
+
+        from django.utils import timezone
+
+        self.python.save()
+        response = self.client.get('/library/api/books')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        later = timezone.now() + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.dl.delete()
+        self.assertEqual(self.client.get('/library/api/books', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get('/library/api/books', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+
+
+class BookImportTests(TestCase):
+    """图书批量导入测试"""
+
+    CSV = (
+        'title,author,isbn,publisher,category,total_copies\n'
+        'Python编程,Eric Matthes,978-7-111-12345-3,人民邮电出版社,计算机,5\n'
+        '深度学习,Ian Goodfellow,978-7-115-46147-6,人民邮电出版社,人工智能,2\n'
+        '重复,,978-7-115-46147-6,,,1\n'
+        '错误ISBN,,978-7-115-46147-0,,,1\n'
+        ',,,,,\n'
+    )
+
+    def _run(self, text, batch_size=2):
+        return BookImporter(batch_size=batch_size).run(iter_csv_rows(StringIO(text)))
+
+    def test_import_creates_and_reports_errors(self):
+        """新建、重复、校验错误与空行统计"""
+        result = self._run(self.CSV, batch_size=10)
+        self.assertEqual(result.as_dict(), {
+            'created': 2,
+            'updated': 0,
+            'skipped': 1,
+            'error_count': 2,
+            'errors': [
+                {'row': 4, 'message': 'ISBN 重复'},
+                {'row': 5, 'message': 'ISBN 校验位不正确'},
+            ],
+        })
+        book = Book.objects.get(isbn='978-7-111-12345-3')
+        self.assertEqual((book.total_copies, book.available_copies), (5, 5))
+        # 批量写入后检索索引同步更新
+        self.assertEqual([row['book_id'] for row in search.search_book_ids('深度学习')],
+                         [Book.objects.get(isbn='978-7-115-46147-6').id])
+
+    def test_import_updates_existing(self):
+        """已存在的 ISBN 按馆藏变化量调整可借数量，未变化的行跳过"""
+        book = make_book(total_copies=3, available_copies=1)
+        text = (
+            'title,author,isbn,publisher,category,total_copies\n'
+            'Python编程（第2版）,Eric Matthes,978-7-111-12345-3,人民邮电出版社,计算机,5\n'
+        )
+        result = self._run(text)
+        self.assertEqual((result.created, result.updated), (0, 1))
+        book.refresh_from_db()
+        self.assertEqual((book.title, book.total_copies, book.available_copies), ('Python编程（第2版）', 5, 3))
+        self.assertEqual(self._run(text).skipped, 1)
+
+    def test_missing_required_column(self):
+        """缺少必需列时整体拒绝"""
+        with self.assertRaises(ImportFormatError):
+            self._run('title,author\nx,y\n')
+
+    def test_import_api(self):
+        """导入接口权限与上传处理"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from apps.accounts.models import User
+
+        student = User.objects.create_user(username='student', password='testpass123')
+        self.client.force_login(student)
+        upload = SimpleUploadedFile('books.csv', self.CSV.encode('utf-8'))
+        self.assertEqual(self.client.post('/library/api/books/import', {'file': upload}).status_code, 403)
+
+        librarian = User.objects.create_user(username='librarian', password='testpass123', role='librarian')
+        self.client.force_login(librarian)
+        upload = SimpleUploadedFile('books.csv', self.CSV.encode('utf-8'))
+        response = self.client.post('/library/api/books/import', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+
+        upload = SimpleUploadedFile('books.txt', b'x')
+        self.assertEqual(self.client.post('/library/api/books/import', {'file': upload}).status_code, 400)
+
+    def test_import_command(self):
+        """管理命令导入文件"""
+        import os
+        import tempfile
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write(self.CSV)
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command('import_books', f.name, stdout=out)
+        self.assertIn('新建 2', out.getvalue())
+
+
+class IsbnBatchValidationTests(TestCase):
+    """ISBN 批量校验测试"""
+
+    VALUES = [
+        '978-7-111-12345-3',      # 合法
+        '978-7-111-12345-0',      # 校验位错误
+        '979-10-90636-07-1',      # 979 前缀
+        '9787111123453',          # 缺少连字符
+        '978-7-111-12345-3\n',    # 正则 $ 允许末尾换行，但位数校验失败
+        '978-7-111-1234-3',       # 位数不足
+        '978-٧-١١١-١٢٣٤٥-٣',      # 阿拉伯-印度数字（\d 可匹配）
+        '',
+    ]
+
+    def _expected(self):
+        from django.core.exceptions import ValidationError
+        from apps.library.models import validate_isbn13
+
+        reasons = []
+        for value in self.VALUES:
+            try:
+                validate_isbn13(value)
+                reasons.append(None)
+            except ValidationError as e:
+                reasons.append(e.messages[0])
+        return reasons
+
+    def test_python_path_matches_single_validator(self):
+        """纯 Python 批量路径与逐个校验一致"""
+        mask, reasons = validate_isbn13_batch(self.VALUES, use_numpy=False)
+        self.assertEqual(reasons, self._expected())
+        self.assertEqual(list(mask), [reason is None for reason in reasons])
+
+    def test_numpy_path_matches_single_validator(self):
+        """NumPy 向量化路径与逐个校验一致"""
+        if isbn_module.np is None:
+            self.skipTest('未安装 NumPy')
+        mask, reasons = validate_isbn13_batch(self.VALUES * 50, use_numpy=True)
+        self.assertEqual(reasons, self._expected() * 50)
+        self.assertEqual(mask.tolist(), [reason is None for reason in reasons])
+
+    def test_make_isbn_passes_validation(self):
+        """按序号生成的 ISBN 均通过校验且互不重复"""
+        values = [isbn_module.make_isbn(seq) for seq in range(0, 10 ** 9, 7_654_321)]
+        mask, reasons = validate_isbn13_batch(values, use_numpy=False)
+        self.assertEqual(reasons, [None] * len(values))
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_benchmark_command(self):
+        """基准命令核对结果一致"""
+        out = StringIO()
+        call_command('benchmark_isbn', count=500, repeat=1, stdout=out)
+        self.assertIn('结果一致', out.getvalue())
+
+
+class CategorySummaryTests(TestCase):
+    """分类汇总增量维护测试"""
+
+    def _summary(self, category):
+        row = CategorySummary.objects.filter(category=category).first()
+        return (row.book_count, row.total_copies, row.available_copies) if row else None
+
+    def test_create_update_delete(self):
+        """新建、修改库存、改分类、删除时按差值更新"""
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(total_copies=3, available_copies=3)
+            make_book(isbn='978-7-115-46147-6', total_copies=2, available_copies=2)
+        self.assertEqual(self._summary('计算机'), (2, 5, 5))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.get(pk=book.pk)
+            book.available_copies -= 1
+            book.save(update_fields=['available_copies', 'updated_at'])
+        self.assertEqual(self._summary('计算机'), (2, 5, 4))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.category = '文学'
+            book.save()
+        self.assertEqual(self._summary('计算机'), (1, 2, 2))
+        self.assertEqual(self._summary('文学'), (1, 3, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(pk=book.pk).delete()
+        self.assertEqual(self._summary('文学'), (0, 0, 0))
+
+    def test_unsaved_fields_ignored(self):
+        """update_fields 之外的修改不计入汇总"""
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(total_copies=3, available_copies=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            book.category = '文学'
+            book.available_copies = 1
+            book.save(update_fields=['available_copies'])
+        self.assertEqual(self._summary('计算机'), (1, 3, 1))
+        self.assertIsNone(self._summary('文学'))
+
+    def test_deferred_load_falls_back_to_database(self):
+        """延迟加载字段的实例保存时从数据库补读旧值"""
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(total_copies=3, available_copies=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.only('id', 'title').get(pk=book.pk)
+            book.total_copies = 5
+            book.save()
+        self.assertEqual(self._summary('计算机'), (1, 5, 3))
+
+    def test_rollback_does_not_touch_summary(self):
+        """事务回滚时不更新汇总"""
+        from django.db import transaction
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(total_copies=3, available_copies=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    book.available_copies = 0
+                    book.save(update_fields=['available_copies'])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self._summary('计算机'), (1, 3, 3))
+
+    def test_bulk_import_refreshes_categories(self):
+        """批量导入后按分类重新聚合（含被移出的旧分类）"""
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book(total_copies=3, available_copies=3)
+        text = (
+            'title,author,isbn,publisher,category,total_copies\n'
+            'Python编程,Eric Matthes,978-7-111-12345-3,人民邮电出版社,编程语言,4\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            BookImporter().run(iter_csv_rows(StringIO(text)))
+        self.assertIsNone(self._summary('计算机'))
+        self.assertEqual(self._summary('编程语言'), (1, 4, 4))
+
+    def test_rebuild_and_list_facets(self):
+        """全量重建及目录页分类筛选"""
+        cache.clear()
+        make_book()
+        make_book(isbn='978-7-115-46147-6', title='深度学习', category='人工智能')
+        call_command('rebuild_category_summary', stdout=StringIO())
+        self.assertEqual(self._summary('人工智能'), (1, 3, 3))
+
+        response = self.client.get('/library/', {'category': '人工智能'})
+        self.assertEqual([book.title for book in response.context['page_obj']], ['深度学习'])
+        self.assertEqual({facet.category for facet in response.context['categories']}, {'计算机', '人工智能'})
+        response = self.client.get('/library/', {'category': '计算机', 'q': '深度'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+class SearchCacheTests(TestCase):
+    """检索结果缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.python = make_book()
+        self.dl = make_book(isbn='978-7-115-46147-6', title='深度学习', author='Ian Goodfellow')
+
+    def _titles(self, q, **params):
+        response = self.client.get('/library/', {'q': q, **params})
+        return [book.title for book in response.context['page_obj']]
+
+    def test_normalized_query_hits_cache(self):
+        """大小写、全角、空白不同的查询命中同一缓存条目"""
+        self.assertEqual(self._titles('Python'), ['Python编程'])
+        self.assertEqual(self._titles('  ＰＹＴＨＯＮ '), ['Python编程'])
+        self.assertEqual(search_cache.stats()['hits'], 1)
+        self.assertEqual(search_cache.stats()['misses'], 1)
+        # 命中只读取一次目录版本号
+        with self.assertNumQueries(1):
+            search_cache.get_page('python', None, 1, 12)
+
+    def test_stock_change_keeps_entry_and_refreshes_available(self):
+        """借还只改可借数量：缓存不失效，命中时显示最新可借数量"""
+        self._titles('python')
+        self._titles('python')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.get(pk=self.python.pk)
+            book.available_copies -= 1
+            book.save(update_fields=['available_copies', 'updated_at'])
+        response = self.client.get('/library/', {'q': 'python'})
+        self.assertEqual(response.context['page_obj'][0].available_copies, 2)
+        self.assertEqual(search_cache.stats()['hits'], 2)
+
+    def test_book_change_invalidates_after_commit(self):
+        """图书信息变化在事务提交后使缓存失效"""
+        self.assertEqual(self._titles('编程'), ['Python编程'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dl.title = '深度学习编程'
+            self.dl.save()
+        self.assertEqual(sorted(self._titles('编程')), ['Python编程', '深度学习编程'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.delete()
+        self.assertEqual(self._titles('编程'), ['深度学习编程'])
+        self.assertEqual(search_cache.stats()['hits'], 0)
+
+    def test_generation_shared_through_database(self):
+        """其他进程递增的版本号（只写数据库、不经本进程缓存）同样使缓存失效"""
+        self._titles('python')
+        Book.objects.filter(pk=self.python.pk).update(title='Python编程（第2版）')
+        catalog.bump()
+        self.assertEqual(self._titles('python'), ['Python编程（第2版）'])
+        self.assertEqual(search_cache.stats()['hits'], 0)
+
+    def test_disabled_by_setting(self):
+        """有效期为 0 时不缓存"""
+        with self.settings(LIBRARY_SEARCH_CACHE_TIMEOUT=0):
+            self._titles('python')
+            self._titles('python')
+        self.assertEqual(search_cache.stats()['misses'], 0)
+
+    def test_stats_api(self):
+        """统计接口仅管理员/图书管理员可访问"""
+        from apps.accounts.models import User
+
+        self._titles('python')
+        reader = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_login(reader)
+        self.assertEqual(self.client.get('/library/api/search-cache/stats').status_code, 403)
+
+        librarian = User.objects.create_user(username='librarian', password='testpass123', role='librarian')
+        self.client.force_login(librarian)
+        data = self.client.get('/library/api/search-cache/stats').json()
+        self.assertEqual((data['hits'], data['misses']), (0, 1))
+        data = self.client.delete('/library/api/search-cache/stats').json()
+        self.assertEqual(data['misses'], 0)
+
+
+class SuggestTests(TestCase):
+    """检索联想测试"""
+
+    def setUp(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.accounts.models import User
+        from apps.borrowing.models import BorrowRecord
+
+        cache.clear()
+        self.python = make_book()
+        self.pandas = make_book(isbn='978-7-115-46147-6', title='Python数据分析', author='Wes McKinney')
+        self.dl = make_book(isbn='978-7-302-00000-1', title='Deep Learning', author='Ian Goodfellow')
+        user = User.objects.create_user(username='reader', password='testpass123')
+        for _ in range(2):
+            BorrowRecord.objects.create(user=user, book=self.pandas, due_at=timezone.now() + timedelta(days=30))
+        # 测试事务中的数据对后台线程不可见，重建在当前线程中执行
+        patcher = mock.patch.object(suggest.index, 'background', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        suggest.index.load()
+
+    def _titles(self, q, **params):
+        response = self.client.get('/library/api/books/suggest', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_prefix_ranked_by_borrow_count(self):
+        """按借阅次数排序，前缀不区分大小写，且不访问数据库"""
+        with self.assertNumQueries(0):
+            self.assertEqual(self._titles('PYTH'), ['Python数据分析', 'Python编程'])
+        self.assertEqual(self._titles('pyth', limit=1), ['Python数据分析'])
+        self.assertEqual(self._titles('learn'), ['Deep Learning'])
+        self.assertEqual(self._titles('ian'), ['Deep Learning'])
+        self.assertEqual(self._titles('9787115'), ['Python数据分析'])
+        self.assertEqual(self._titles('978-7-302'), ['Deep Learning'])
+        self.assertEqual(self._titles(''), [])
+
+    def test_incremental_updates(self):
+        """图书保存/删除、新增借阅后增量更新"""
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.borrowing.models import BorrowRecord
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.title = 'Java编程'
+            self.python.save()
+            self.dl.delete()
+        self.assertEqual(self._titles('pyth'), ['Python数据分析'])
+        self.assertEqual(self._titles('java'), ['Java编程'])
+        self.assertEqual(self._titles('deep'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.title = 'Python编程'
+            self.python.save()
+            for _ in range(3):
+                BorrowRecord.objects.create(
+                    user=self.pandas.borrow_records.first().user, book=self.python,
+                    due_at=timezone.now() + timedelta(days=30),
+                )
+        self.assertEqual(self._titles('pyth'), ['Python编程', 'Python数据分析'])
+
+    def test_rebuilds_when_other_process_changed_books(self):
+        """目录版本号变化时（其他进程修改了图书）按间隔重建"""
+        Book.objects.filter(pk=self.dl.pk).update(title='Deep Learning 2')
+        catalog.bump()
+        self.assertEqual(self._titles('deep'), ['Deep Learning'])
+        suggest.index._checked_at -= suggest.CHECK_INTERVAL
+        self.assertEqual(self._titles('deep'), ['Deep Learning 2'])
+
+    def test_background_rebuild_serves_old_index(self):
+        """后台重建期间继续使用旧索引，同一时间只启动一个重建"""
+        Book.objects.filter(pk=self.dl.pk).update(title='Deep Learning 2')
+        catalog.bump()
+        suggest.index._checked_at -= suggest.CHECK_INTERVAL
+        with mock.patch.object(suggest.index, 'background', True), \
+                mock.patch('apps.library.suggest.threading.Thread') as thread:
+            with self.assertNumQueries(1):
+                self.assertEqual(self._titles('deep'), ['Deep Learning'])
+            suggest.index._checked_at -= suggest.CHECK_INTERVAL
+            self.assertEqual(self._titles('deep'), ['Deep Learning'])
+        self.assertEqual(thread.call_count, 1)
+        with mock.patch('apps.library.suggest.connection.close'):
+            thread.call_args.kwargs['target']()
+        self.assertEqual(self._titles('deep'), ['Deep Learning 2'])
+
+    def test_long_prefix_checked_against_full_key(self):
+        """键只存前 KEY_LENGTH 个字符，更长的输入按完整键核对"""
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book(isbn='978-7-111-00000-6', title='Deep Learning with PyTorch')
+            make_book(isbn='978-7-111-00001-3', title='Deep Learning with Python')
+        self.assertTrue(all(len(key) <= suggest.KEY_LENGTH for key, _ in suggest.index._keys))
+        self.assertEqual(self._titles('deep learning with pyto'), ['Deep Learning with PyTorch'])
+        self.assertEqual(sorted(self._titles('deep learning with pyt')), ['Deep Learning with PyTorch', 'Deep Learning with Python'])
+
+    def test_short_prefix_ranks_all_matches(self):
+        """短前缀命中多于 MAX_LIMIT 本时按全部命中项排名，名单内图书删除后由名单外图书补位"""
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.borrowing.models import BorrowRecord
+
+        with self.captureOnCommitCallbacks(execute=True):
+            books = [
+                make_book(isbn=f'978-7-200-{idx:05d}-0', title=f'Python卷{idx:02d}', author='Guido')
+                for idx in range(suggest.MAX_LIMIT + 5)
+            ]
+        last = books[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                BorrowRecord.objects.create(
+                    user=self.pandas.borrow_records.first().user, book=last,
+                    due_at=timezone.now() + timedelta(days=30),
+                )
+        self.assertEqual(self._titles('p', limit=1), [last.title])
+        self.assertEqual(self._titles('py', limit=2), [last.title, 'Python数据分析'])
+        self.assertEqual(self._titles('python卷', limit=1), [last.title])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRecord.objects.filter(book__in=[last, self.pandas]).delete()
+            last.delete()
+            self.pandas.delete()
+        self.assertEqual(self._titles('p', limit=20), [f'Python卷{idx:02d}' for idx in range(20)])
+
+    def test_invalid_limit(self):
+        response = self.client.get('/library/api/books/suggest', {'q': 'py', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FuzzySearchTests(TestCase):
+    """三元组模糊检索测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.dl = make_book(title='Deep Learning', author='Ian Goodfellow')
+        self.ds = make_book(isbn='978-7-115-46147-6', title='Data Structures and Algorithms', author='Robert Sedgewick')
+
+    def _ids(self, q, **kwargs):
+        return [row['book_id'] for row in fuzzy.search_book_ids(q, **kwargs)]
+
+    def test_trigrams(self):
+        self.assertEqual(fuzzy.trigrams('Deep'), ['  d', ' de', 'dee', 'eep', 'ep '])
+        self.assertEqual(fuzzy.trigrams('ＤＥＥＰ!'), fuzzy.trigrams('deep'))
+
+    def test_typo_and_partial_title(self):
+        """作者名拼写错误、只输入部分书名"""
+        self.assertEqual(self._ids('goodfelow'), [self.dl.id])
+        self.assertEqual(self._ids('sedgwick'), [self.ds.id])
+        self.assertEqual(self._ids('structures algorithm'), [self.ds.id])
+        self.assertEqual(self._ids('xyzzy'), [])
+
+    def test_threshold(self):
+        """阈值越高越严格"""
+        self.assertEqual(self._ids('goodfelow', threshold=0.95), [])
+        self.assertEqual(self._ids('goodfellow', threshold=0.95), [self.dl.id])
+
+    def test_candidate_pruning_matches_full_scan(self):
+        """高频三元组剪枝与全量计数结果一致"""
+        for idx in range(5):
+            make_book(isbn=isbn_module.make_isbn(idx), title=f'Deep Dive {idx}', author='Ian Smith')
+        expected = self._ids('ian goodfelow')
+        original = fuzzy.ROW_BUDGET
+        fuzzy.ROW_BUDGET = 0
+        try:
+            cache.clear()
+            self.assertEqual(self._ids('ian goodfelow'), expected)
+        finally:
+            fuzzy.ROW_BUDGET = original
+        self.assertEqual(expected[0], self.dl.id)
+
+    def test_index_updated_on_save(self):
+        self.dl.author = 'Yoshua Bengio'
+        self.dl.save()
+        self.assertEqual(self._ids('goodfelow'), [])
+        self.assertEqual(self._ids('bengo'), [self.dl.id])
+
+    def test_new_book_found_with_cached_frequencies(self):
+        """文档频次已缓存时新增图书，提交后立即可检索（频次缓存键随目录版本号变化）"""
+        self.assertEqual(self._ids('bengio'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(isbn='978-7-111-00000-6', title='Deep Learning Notes', author='Yoshua Bengio')
+        self.assertEqual(self._ids('bengio'), [book.id])
+
+    def test_benchmark_uses_own_frequency_keys(self):
+        """基准测试的频次缓存不影响正式检索"""
+        cache.clear()
+        call_command('benchmark_fuzzy_search', '--count', '30', '--queries', '5', stdout=StringIO())
+        generation = catalog.get_generation()
+        self.assertIsNone(cache.get(fuzzy._df_key(fuzzy.DF_KEY_PREFIX, generation, ' go')))
+        self.assertEqual(self._ids('goodfelow'), [self.dl.id])
+
+    def test_list_books_falls_back_to_fuzzy(self):
+        """精确检索无结果时目录页退化为模糊检索"""
+        response = self.client.get('/library/', {'q': 'goodfelow'})
+        self.assertTrue(response.context['is_fuzzy'])
+        self.assertEqual([book.id for book in response.context['page_obj']], [self.dl.id])
+        self.assertContains(response, '以下为近似结果')
+
+        response = self.client.get('/library/', {'q': 'deep'})
+        self.assertFalse(response.context['is_fuzzy'])
+        response = self.client.get('/library/', {'q': 'deep lerning', 'mode': 'fuzzy'})
+        self.assertTrue(response.context['is_fuzzy'])
+        self.assertEqual([book.id for book in response.context['page_obj']], [self.dl.id])
+
+    def test_rebuild_command(self):
+        from apps.library.models import BookTrigram
+
+        BookTrigram.objects.all().delete()
+        call_command('rebuild_search_index', '--only', 'trigrams', stdout=StringIO())
+        self.assertEqual(self._ids('goodfelow'), [self.dl.id])
+
+
+class AvailabilityOverlayTests(TestCase):
+    """可借数量缓存层测试"""
+
+    def setUp(self):
+        from apps.accounts.models import User
+
+        cache.clear()
+        self.book = make_book()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+
+    def _drift(self, available):
+        """直接改数据库（不触发信号），制造缓存与数据库的偏差"""
+        Book.objects.filter(pk=self.book.pk).update(available_copies=available)
+
+    def test_read_through_and_invalidate(self):
+        """首次读取回填缓存，之后不再查询数据库；作废后重新读取"""
+        self.assertEqual(availability.get(self.book.id), 3)
+        self._drift(2)
+        with self.assertNumQueries(0):
+            self.assertEqual(availability.get(self.book.id), 3)
+        availability.invalidate([self.book.id])
+        self.assertEqual(availability.get(self.book.id), 2)
+
+    def test_invalidate_during_read_not_cached(self):
+        """读数据库期间有写入提交并作废时，回填的旧值不会被后续读取命中"""
+        load = availability._load
+
+        def racing_load(book_ids):
+            result = load(book_ids)
+            self._drift(1)
+            availability.invalidate(book_ids)
+            return result
+
+        with mock.patch.object(availability, '_load', racing_load):
+            self.assertEqual(availability.get(self.book.id), 3)
+        self.assertEqual(availability.get(self.book.id), 1)
+
+    def test_evicted_version_not_reusing_old_values(self):
+        """版本号被淘汰后重新初始化，不会读到淘汰前回填的值"""
+        availability.get(self.book.id)
+        self._drift(2)
+        cache.delete(availability._version_key(self.book.id))
+        self.assertEqual(availability.get(self.book.id), 2)
+
+    def test_full_save_invalidates(self):
+        """后台整体编辑图书后缓存失效"""
+        availability.get(self.book.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.available_copies = 1
+            self.book.save()
+        self.assertEqual(availability.get(self.book.id), 1)
+
+    def test_commit_writes_through(self):
+        """提交后直接写入最新值，随后的读取不再查询数据库"""
+        availability.get(self.book.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.available_copies = 1
+            self.book.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(availability.get(self.book.id), 1)
+
+    def test_list_and_detail_read_overlay(self):
+        """目录页与详情接口读取缓存值"""
+        availability.get(self.book.id)
+        versions = availability._versions([self.book.id])
+        cache.set(availability._key(self.book.id, versions[self.book.id]), 1)
+        response = self.client.get('/library/')
+        self.assertEqual(response.context['page_obj'].object_list[0].available_copies, 1)
+
+        self.client.force_login(self.user)
+        data = self.client.get(f'/library/api/books/{self.book.id}').json()
+        self.assertEqual((data['title'], data['available_copies']), ('Python编程', 1))
+        self.assertEqual(self.client.get('/library/api/books/999999').status_code, 404)
+        data = self.client.get('/library/api/books').json()
+        self.assertEqual(data['results'][0]['available_copies'], 1)
+
+    def test_reconcile_command(self):
+        """核对命令发现并修正偏差"""
+        availability.get(self.book.id)
+        self._drift(1)
+        out = StringIO()
+        call_command('reconcile_availability', '--dry-run', stdout=out)
+        self.assertIn('1 条不一致', out.getvalue())
+        self.assertEqual(availability.get(self.book.id), 3)
+
+        call_command('reconcile_availability', stdout=StringIO())
+        self.assertEqual(availability.get(self.book.id), 1)
+        out = StringIO()
+        call_command('reconcile_availability', stdout=out)
+        self.assertIn('全部一致', out.getvalue())
+
+
+class StockStripeTests(TestCase):
+    """分段库存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(total_copies=10, available_copies=10)
+
+    def test_enable_distributes_and_disable_restores(self):
+        self.assertEqual(stripes.enable(self.book.id, 4), 10)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock_stripes, 4)
+        self.assertEqual(
+            list(StockStripe.objects.filter(book=self.book).order_by('stripe').values_list('available', flat=True)),
+            [3, 3, 2, 2],
+        )
+        self.assertTrue(stripes.take(self.book))
+        self.assertEqual(stripes.disable(self.book.id), 9)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.stock_stripes, self.book.available_copies), (0, 9))
+        self.assertFalse(StockStripe.objects.filter(book=self.book).exists())
+
+    def test_take_until_empty(self):
+        """各段扣完后借阅失败，段内数量不为负"""
+        stripes.enable(self.book.id, 3)
+        self.book.refresh_from_db()
+        taken = sum(stripes.take(self.book) for _ in range(12))
+        self.assertEqual(taken, 10)
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 0})
+        stripes.put(self.book, 2)
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 2})
+
+    def test_put_falls_back_when_stripes_gone(self):
+        """还入时分段已被并发关闭（段行不存在），改为计入 Book.available_copies"""
+        stripes.enable(self.book.id, 2)
+        self.book.refresh_from_db()
+        stripes.take(self.book)
+        stripes.disable(self.book.id)
+        stripes.put(self.book)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.stock_stripes, self.book.available_copies), (0, 10))
+
+    def test_put_follows_new_stripe_count(self):
+        """分段按更少的段数重新分配后，随机段号不存在时按当前段数还入"""
+        stripes.enable(self.book.id, 8)
+        self.book.refresh_from_db()
+        stripes.take(self.book)
+        stripes.enable(self.book.id, 1)
+        with mock.patch('apps.library.stripes.random.randrange', side_effect=[7, 0]):
+            stripes.put(self.book)
+        self.assertEqual(stripes.totals([self.book.id]), {self.book.id: 10})
+
+    def test_books_api_etag_tracks_stripes(self):
+        """分段借还不改动 Book 行，图书列表接口的 ETag 仍随之变化"""
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from apps.accounts.models import User
+
+        self.client.force_login(User.objects.create_user(username='reader', password='testpass123'))
+        stripes.enable(self.book.id, 2)
+        self.book.refresh_from_db()
+        etag = self.client.get('/library/api/books')['ETag']
+        later = timezone.now() + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertTrue(stripes.take(self.book))
+        self.assertEqual(self.client.get('/library/api/books', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_availability_reads_stripe_sum_and_sync(self):
+        """可借数量缓存读取各段之和；快照由 sync 回写"""
+        stripes.enable(self.book.id, 2)
+        self.book.refresh_from_db()
+        stripes.take(self.book)
+        self.assertEqual(availability.get(self.book.id), 9)
+        self.assertEqual(availability.reconcile()['mismatched'], 0)
+
+        self.assertEqual(stripes.sync(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 9)
+        self.assertEqual(stripes.sync(), 0)
+
+    def test_command_toggles_mode(self):
+        out = StringIO()
+        call_command('sync_stock_stripes', enable=self.book.isbn, stripes=5, stdout=out)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock_stripes, 5)
+        call_command('sync_stock_stripes', disable=self.book.isbn, stdout=out)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock_stripes, 0)
+        self.assertEqual(self.book.available_copies, 10)
@@ -3,6 +3,9 @@ from . import views
 
 urlpatterns = [
     path('', views.list_books, name='book_list'),
+    path('api/books', views.books_api, name='books_api'),
+    path('api/books/<int:book_id>', views.book_detail_api, name='book_detail_api'),
+    path('api/books/suggest', views.books_suggest_api, name='books_suggest_api'),
+    path('api/books/import', views.books_import_api, name='books_import_api'),
+    path('api/search-cache/stats', views.search_cache_stats_api, name='search_cache_stats_api'),
 ]
-
-
@@ -1,15 +1,262 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Max
+from django.http import JsonResponse
 from django.shortcuts import render
-from django.db import models
 from django.core.paginator import Paginator
-from .models import Book
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_http_methods, require_POST
+from apps.accounts.permissions import can_manage_books
+from .models import Book, CategorySummary, StockStripe
+from . import availability, catalog, facets, search, search_cache, suggest
+from .importer import BookImporter, ImportFormatError, iter_rows
+from .pagination import paginate_keyset
+
+
+PAGE_SIZE = 12
+API_MAX_PAGE_SIZE = 100
+
+# JSON 接口可选择返回的字段，默认返回前 8 个（与接口文档一致）
+API_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'publisher', 'category',
+    'available_copies', 'total_copies', 'created_at', 'updated_at',
+)
+API_DEFAULT_FIELDS = API_FIELDS[:8]
 
 
 def list_books(request):
     q = request.GET.get('q', '').strip()
-    qs = Book.objects.all().order_by('-created_at')
-    if q:
-        qs = qs.filter(models.Q(title__icontains=q) | models.Q(author__icontains=q) | models.Q(isbn__icontains=q) | models.Q(category__icontains=q))
-    paginator = Paginator(qs, 12)
+    category = request.GET.get('category', '').strip()
     page = request.GET.get('page')
-    page_obj = paginator.get_page(page)
-    return render(request, 'library/list.html', { 'page_obj': page_obj, 'q': q })
+    cursor = request.GET.get('cursor')
+    fuzzy_mode = request.GET.get('mode') == 'fuzzy'
+    mode = getattr(settings, 'LIBRARY_PAGINATION_MODE', 'page')
+    estimate = getattr(settings, 'LIBRARY_ESTIMATE_TOTAL', False)
+
+    # 分类筛选项直接读取分类汇总表，不对 Book 全表聚合
+    categories = [facet for facet in facets.top_categories() if facet.category]
+    books = Book.objects.all()
+    if category:
+        books = books.filter(category=category)
+
+    is_cursor = False
+    if q:
+        # 通过倒排索引检索并按相关度排序，避免四列 icontains 全表扫描；结果页经检索缓存
+        page_obj = search_cache.get_page(q, category or None, page, PAGE_SIZE, fuzzy_mode)
+        if not fuzzy_mode and page_obj.paginator.count == 0:
+            # 精确检索无结果（拼写错误、只输入部分书名等）时退化为三元组模糊检索
+            fuzzy_mode = True
+            page_obj = search_cache.get_page(q, category or None, page, PAGE_SIZE, fuzzy_mode)
+    elif mode == 'cursor' and (cursor or not page):
+        # 游标分页：按 (created_at, id) 范围查询，无 COUNT(*) 与 OFFSET
+        is_cursor = True
+        page_obj = paginate_keyset(books, cursor, PAGE_SIZE, estimate=estimate and not category)
+        if category and estimate:
+            summary = CategorySummary.objects.filter(category=category).first()
+            page_obj.estimated_total = summary.book_count if summary else 0
+    else:
+        paginator = Paginator(books.order_by('-created_at', '-id'), PAGE_SIZE)
+        page_obj = paginator.get_page(page)
+    if not q:
+        # 可借数量从缓存层读取（检索结果页由检索缓存处理）
+        page_obj.object_list = availability.apply(list(page_obj.object_list))
+    return render(request, 'library/list.html', {
+        'page_obj': page_obj,
+        'q': q,
+        'category': category,
+        'categories': categories,
+        'is_cursor': is_cursor,
+        'is_fuzzy': bool(q) and fuzzy_mode,
+    })
+
+
+def _validation_error(message):
+    return JsonResponse({
+        'error': {
+            'code': 'VALIDATION_ERROR',
+            'message': message
+        }
+    }, status=400)
+
+
+@require_http_methods(["GET"])
+@login_required
+def books_api(request):
+    """
+    图书查询API
+
+    URL: GET /api/books
+    权限: 已登录
+    查询参数:
+        - q: 检索关键字（书名/作者/ISBN/分类）
+        - page: 页码，默认 1
+        - page_size: 每页数量，默认 12，最大 100
+        - fields: 逗号分隔的返回字段，默认 id,title,author,isbn,publisher,category,available_copies,total_copies
+    返回: 分页 JSON；携带 ETag/Last-Modified，条件请求未变化时返回 304
+    """
+    q = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', PAGE_SIZE))
+    except ValueError:
+        return _validation_error('page 和 page_size 必须是整数')
+    if page < 1 or page_size < 1:
+        return _validation_error('page 和 page_size 必须大于 0')
+    page_size = min(page_size, API_MAX_PAGE_SIZE)
+
+    fields_raw = request.GET.get('fields', '')
+    if fields_raw:
+        fields = [name.strip() for name in fields_raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in API_FIELDS]
+        if unknown:
+            return _validation_error(f'不支持的字段: {", ".join(unknown)}')
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+    else:
+        fields = list(API_DEFAULT_FIELDS)
+
+    books = search.matching_books(q) if q else Book.objects.all()
+
+    # 条件请求只读目录版本号（增删改、批量导入后递增，删除图书也会变化）与最近修改时间
+    # （updated_at 有索引，取最大值只读索引一端）；借还改动 updated_at，可借数量变化同样反映在 ETag 中。
+    # 分段库存的借还只改 StockStripe，取其 updated_at 的最大值一并计入
+    generation, version_at = catalog.get_version()
+    candidates = [
+        version_at,
+        Book.objects.aggregate(last_modified=Max('updated_at'))['last_modified'],
+        StockStripe.objects.aggregate(last_modified=Max('updated_at'))['last_modified'],
+    ]
+    last_modified = max((value for value in candidates if value is not None), default=None)
+    signature = '|'.join([
+        q, str(page), str(page_size), ','.join(fields),
+        str(generation), last_modified.isoformat() if last_modified else '',
+    ])
+    etag = quote_etag(hashlib.md5(signature.encode('utf-8')).hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+
+    offset = (page - 1) * page_size
+    if q:
+        # 先按相关度取本页 id，再按 id 投影所需字段
+        ids = [row['book_id'] for row in search.search_book_ids(q)[offset:offset + page_size]]
+        rows = {row['id']: row for row in Book.objects.filter(id__in=ids).values(*fields)}
+        results = [rows[book_id] for book_id in ids if book_id in rows]
+    else:
+        results = list(books.order_by('-created_at', '-id').values(*fields)[offset:offset + page_size])
+
+    if 'available_copies' in fields:
+        available = availability.get_many(row['id'] for row in results)
+        for row in results:
+            row['available_copies'] = available.get(row['id'], row['available_copies'])
+
+    response = JsonResponse({
+        'count': books.count(),
+        'page': page,
+        'page_size': page_size,
+        'results': results,
+    })
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+@require_http_methods(["GET"])
+@login_required
+def book_detail_api(request, book_id):
+    """
+    图书详情API
+
+    URL: GET /api/books/{id}
+    权限: 已登录
+    返回: 图书全部字段，可借数量读取自缓存层
+    """
+    book = Book.objects.filter(pk=book_id).values(*API_FIELDS).first()
+    if book is None:
+        return JsonResponse({
+            'error': {
+                'code': 'NOT_FOUND',
+                'message': '图书不存在'
+            }
+        }, status=404)
+    book['available_copies'] = availability.get(book_id)
+    return JsonResponse(book)
+
+
+@require_POST
+@login_required
+def books_import_api(request):
+    """
+    图书批量导入API
+
+    URL: POST /api/books/import
+    权限: admin, librarian
+    表单: file（CSV 或 Excel），列包含 title, author, isbn, publisher, category, total_copies
+    返回: created/updated/skipped 数量及逐行错误
+    """
+    if not can_manage_books(request.user):
+        return JsonResponse({
+            'error': {
+                'code': 'FORBIDDEN',
+                'message': '无权限访问此接口'
+            }
+        }, status=403)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return _validation_error('请上传 file 文件')
+
+    try:
+        result = BookImporter().run(iter_rows(upload.file, upload.name))
+    except ImportFormatError as e:
+        return _validation_error(str(e))
+    return JsonResponse(result.as_dict())
+
+
+@require_http_methods(["GET"])
+def books_suggest_api(request):
+    """
+    检索联想API
+
+    URL: GET /api/books/suggest
+    权限: 无（与图书目录页一致）
+    查询参数:
+        - q: 书名/作者/ISBN 前缀
+        - limit: 返回条数，默认 10，最大 20
+    返回: 按借阅次数排序的候选图书，由进程内索引应答，不查询数据库
+    """
+    q = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', suggest.DEFAULT_LIMIT))
+    except ValueError:
+        return _validation_error('limit 必须是整数')
+    if limit < 1:
+        return _validation_error('limit 必须大于 0')
+    return JsonResponse({'q': q, 'results': suggest.suggest(q, limit)})
+
+
+@require_http_methods(["GET", "DELETE"])
+@login_required
+def search_cache_stats_api(request):
+    """
+    检索缓存统计API
+
+    URL: GET /api/search-cache/stats（DELETE 清零命中统计）
+    权限: admin, librarian
+    返回: enabled, hits, misses, hit_rate, generation
+    """
+    if not can_manage_books(request.user):
+        return JsonResponse({
+            'error': {
+                'code': 'FORBIDDEN',
+                'message': '无权限访问此接口'
+            }
+        }, status=403)
+    if request.method == 'DELETE':
+        search_cache.reset_stats()
+    return JsonResponse(search_cache.stats())
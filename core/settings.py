@@ -189,6 +189,40 @@ SESSION_COOKIE_NAME = 'book_sessionid'
 # 防止会话固定攻击：登录后重新生成会话ID
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 
+# 缓存：默认进程内缓存（LocMemCache，各进程互不共享）。检索结果缓存与联想索引的失效版本号
+# 存在数据库（CatalogVersion），不依赖共享缓存；罚款规则与可借数量缓存在进程内缓存下
+# 跨进程最多延迟 60 秒生效。多进程（多个 gunicorn/uwsgi 工作进程）部署必须改为共享缓存，例如：
+#     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#     'LOCATION': 'redis://127.0.0.1:6379/1',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'campus-library',
+    }
+}
+
+# Library catalog settings - 图书目录配置
+# 列表页分页模式：'cursor' 按 (created_at, id) 游标分页（无 COUNT/OFFSET），'page' 为传统页码分页
+LIBRARY_PAGINATION_MODE = 'cursor'
+# 游标分页时是否显示估算总数（MySQL 读取 information_schema 表统计信息）
+LIBRARY_ESTIMATE_TOTAL = True
+# 检索结果缓存有效期（秒），0 关闭
+LIBRARY_SEARCH_CACHE_TIMEOUT = 300
+# 模糊检索相似度阈值（查询三元组命中比例，0~1），精确检索无结果或 mode=fuzzy 时使用
+LIBRARY_FUZZY_THRESHOLD = 0.5
+# 单册借阅扣减库存策略：optimistic（条件 UPDATE，按影响行数判断）或 locking（SELECT ... FOR UPDATE 后检查）
+BORROW_STOCK_STRATEGY = 'optimistic'
+# 预约到书后的保留天数，超过后由 expire_holds 命令转给下一位
+BORROW_HOLD_PICKUP_DAYS = 3
+# 借还幂等键有效期（秒），有效期内重复提交重放首次响应；过期记录由 purge_idempotency_keys 清理
+BORROW_IDEMPOTENCY_TTL = 24 * 3600
+# 到期提醒：提前多少天提醒（send_due_reminders 命令与逾期管理页的“即将到期”列表共用）
+BORROW_REMINDER_DAYS = 3
+
+# 邮件：开发环境输出到控制台；生产环境改为 SMTP 后端并配置 EMAIL_HOST 等
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = '校园图书馆 <library@localhost>'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
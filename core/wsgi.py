@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# 工作进程启动即在后台构建检索联想索引，不等第一次联想请求
+from apps.library.suggest import index  # noqa: E402
+
+index.schedule_rebuild()